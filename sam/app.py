@@ -1,22 +1,198 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, WebSocket, Request
+from fastapi.concurrency import run_in_threadpool
+import anyio
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import numpy as np
 import cv2
 import base64
-from typing import Optional
+from typing import List, Optional
 import io
 from PIL import Image
 import os
-from anthropic import Anthropic
-from src.prompts import get_navigation_prompt, get_ultrasound_diagnostic_prompt
+import json
+import random
+import time
+import asyncio
+import contextvars
+import tempfile
+from anthropic import APIConnectionError
+from src.prompts import prompt_registry
+from src.keyframes import select_keyframes, frame_quality, frame_signature
+from src.live import LatestFrameSlot, LatencyTracker, elapsed_ms
+from src.phash import DedupCache, dhash
+from src.voting import VotingEngine
+from src.image_store import ImageStore
+from src.jobs import JobQueue, DONE, FINISHED
+from src.outbox import Outbox, LinkDown
+from src.scheduler import (
+    PRIORITY_CLASSES, Overloaded, RequestScheduler, parse_class_map, priority_class
+)
+from src.routing import ModelRouter
+from src.usage import (
+    OFFLINE, UsageLedger, RequestUsage, SpeculationStats, current_request, image_tokens, track_session
+)
+from src.batch import BatchStats, run_concurrent, run_message_batch
+from src.navlib import NavigationLibrary
+from src.guidance import GuidanceSessions, GuidanceTracker
+from src.classifier import OrganClassifier, PrefilterStats
+from src.chat import ChatSessions
+from src.backends import OfflineBackend, make_backend
+from src.identification import (
+    IDENTIFY_TOOL, IDENTIFY_TOOL_NAME, UNKNOWN_IDENTIFICATION, parse_identification,
+    SWEEP_TOOL_NAME, sweep_tool, parse_sweep
+)
+from src.ingest import (
+    MAX_IMAGE_BYTES, check_content_length, check_image_header, read_body_limited, read_upload_limited
+)
 
 CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
 
-claude_client = Anthropic(api_key=CLAUDE_API_KEY)
+# Inference backend: "hosted" (Anthropic API), "standin" (an Anthropic-compatible
+# server at ANTHROPIC_BASE_URL) or "offline" (rule-based, no network). Setting
+# only ANTHROPIC_BASE_URL selects the stand-in.
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None
+LLM_BACKEND = os.getenv("LLM_BACKEND") or ("standin" if ANTHROPIC_BASE_URL else "hosted")
+# While the link is down, diagnoses are answered by the offline backend (and
+# still queued for a full review) instead of returning nothing
+LLM_OFFLINE_FALLBACK = os.getenv("LLM_OFFLINE_FALLBACK", "1") == "1"
+
+# Model tiers and per-task routing rules
+ROUTING_CONFIG = os.getenv("ROUTING_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "routing.json"))
+router = ModelRouter.from_file(ROUTING_CONFIG)
+
+# Token and cost budgets. Past USAGE_SOFT_LIMIT of a budget, max_tokens
+# shrinks towards USAGE_MIN_TOKENS; past USAGE_DOWNGRADE_AT, calls use the
+# cheapest tier without escalation; a spent budget is answered offline.
+usage_ledger = UsageLedger(
+    session_token_budget=int(os.getenv("SESSION_TOKEN_BUDGET", "0")) or None,
+    daily_cost_budget=float(os.getenv("DAILY_COST_BUDGET", "0")) or None,
+    soft_limit=float(os.getenv("USAGE_SOFT_LIMIT", "0.7")),
+    downgrade_at=float(os.getenv("USAGE_DOWNGRADE_AT", "0.9")),
+    min_tokens=int(os.getenv("USAGE_MIN_TOKENS", "256")),
+)
+
+# Registered prompt behind each task's answers
+TASK_PROMPTS = {"identify": "identify", "navigate": "navigation", "describe": "diagnostic"}
 
 app = FastAPI(title="Image and Text Processing API")
 
+# Limits of a single multi-organ sweep call
+MAX_SWEEP_IMAGES = int(os.getenv("MAX_SWEEP_IMAGES", "4"))
+MAX_SWEEP_ORGANS = int(os.getenv("MAX_SWEEP_ORGANS", "12"))
+
+# Bulk identification: "batch" uses the Message Batches API, "concurrent"
+# runs individual calls with bounded concurrency, "auto" picks batch on the
+# hosted API (stand-in servers usually lack it) and falls back on failure
+BATCH_MODE = os.getenv("BATCH_MODE", "auto")
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "10"))
+BATCH_TIMEOUT = float(os.getenv("BATCH_TIMEOUT", str(6 * 3600)))
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "200"))
+BATCH_JOB_WORKERS = int(os.getenv("BATCH_JOB_WORKERS", "1"))
+batch_stats = BatchStats()
+
+# Clip uploads are copied to disk in chunks of this size before decoding
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_CLIP_BYTES = int(os.getenv("MAX_CLIP_BYTES", str(200 * 1024 * 1024)))
+# Keyframes all go into one model request, which caps its image count and size
+MAX_CLIP_KEYFRAMES = int(os.getenv("MAX_CLIP_KEYFRAMES", "8"))
+
+# Live guidance: minimum seconds between LLM calls per connection, and the
+# local quality score below which frames are not worth sending upstream
+LIVE_LLM_INTERVAL = float(os.getenv("LIVE_LLM_INTERVAL", "3.0"))
+LIVE_MIN_QUALITY = float(os.getenv("LIVE_MIN_QUALITY", "0.35"))
+
+# Near-duplicate frames within a session reuse earlier results. The threshold
+# is the maximum Hamming distance (out of 64 bits) between frame hashes.
+PHASH_THRESHOLD = int(os.getenv("PHASH_THRESHOLD", "6"))
+dedup_cache = DedupCache(threshold=PHASH_THRESHOLD)
+
+# Debounced per-session identification signal
+voting_engine = VotingEngine(
+    half_life=float(os.getenv("VOTE_HALF_LIFE", "10.0")),
+    change_threshold=int(os.getenv("VOTE_CHANGE_THRESHOLD", "12")),
+)
+
+# Upload-once image registry: bounded memory, disk spill and expiry
+image_store = ImageStore(
+    max_memory_bytes=int(os.getenv("IMAGE_STORE_MEMORY_MB", "64")) * 1024 * 1024,
+    spill_dir=os.getenv("IMAGE_STORE_DIR", os.path.join(tempfile.gettempdir(), "space-triage-images")),
+    ttl=int(os.getenv("IMAGE_STORE_TTL", "3600")),
+)
+
+# Store-and-forward: requests made while the link is down are queued durably
+# and replayed in priority order (lower first), paced to OUTBOX_RATE_BPS
+OUTBOX_DB_PATH = os.getenv("OUTBOX_DB_PATH", os.path.join(tempfile.gettempdir(), "space-triage-outbox.sqlite3"))
+OUTBOX_RATE_BPS = int(os.getenv("OUTBOX_RATE_BPS", str(32 * 1024)))
+OUTBOX_PRIORITY = {"describe": 1, "identify": 2, "navigate": 3}
+
+# Priority admission control for upstream calls. Quotas cap concurrent calls
+# per class, timeouts bound queue wait, and lower classes are shed first once
+# more than SCHED_MAX_WAITING requests are queued.
+scheduler = RequestScheduler(
+    total_slots=int(os.getenv("SCHED_TOTAL_SLOTS", "8")),
+    quotas=parse_class_map(os.getenv("SCHED_QUOTAS"), {"emergency": 8, "diagnostic": 6, "navigation": 4, "routine": 2}, int),
+    timeouts=parse_class_map(os.getenv("SCHED_TIMEOUTS"), {"emergency": 120, "diagnostic": 60, "navigation": 20, "routine": 10}),
+    max_queue=parse_class_map(os.getenv("SCHED_MAX_QUEUE"), {"emergency": 64, "diagnostic": 32, "navigation": 16, "routine": 8}, int),
+    max_waiting=int(os.getenv("SCHED_MAX_WAITING", "48")),
+)
+# Requests wait for their slot on a worker thread, so the request threadpool
+# is sized to hold every running and waiting caller with THREADPOOL_HEADROOM
+# threads to spare. An emergency request then always finds a thread to queue on.
+THREADPOOL_HEADROOM = int(os.getenv("THREADPOOL_HEADROOM", "16"))
+
+# Asynchronous jobs for the long-running generations
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(tempfile.gettempdir(), "space-triage-jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_WAIT = 60
+
+# Vetted navigation instructions served without an LLM call. A view is
+# trusted when its nearest labelled exemplar is at least this similar and
+# beats the next view class by the margin.
+navigation_library = NavigationLibrary(
+    os.getenv("NAVLIB_DB_PATH", os.path.join(tempfile.gettempdir(), "space-triage-navlib.sqlite3")),
+    min_similarity=float(os.getenv("NAVLIB_MIN_SIMILARITY", "0.8")),
+    min_margin=float(os.getenv("NAVLIB_MIN_MARGIN", "0.05")),
+)
+
+# Local organ classifier answering confident /identify calls without the LLM
+# (train it with train_classifier.py). A small share of confident frames is
+# still sent to the LLM to measure agreement.
+LOCAL_CLASSIFIER_PATH = os.getenv(
+    "LOCAL_CLASSIFIER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "organ_classifier.npz")
+)
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+LOCAL_CLASSIFIER_AUDIT_RATE = float(os.getenv("LOCAL_CLASSIFIER_AUDIT_RATE", "0.05"))
+organ_classifier = None
+if os.path.exists(LOCAL_CLASSIFIER_PATH):
+    try:
+        organ_classifier = OrganClassifier.load(LOCAL_CLASSIFIER_PATH)
+    except Exception as e:
+        print(f"Could not load local classifier: {str(e)}")
+prefilter_stats = PrefilterStats()
+
+backend = make_backend(LLM_BACKEND, api_key=CLAUDE_API_KEY, base_url=ANTHROPIC_BASE_URL, classifier=organ_classifier)
+offline_backend = backend if isinstance(backend, OfflineBackend) else OfflineBackend(organ_classifier)
+backend_stats = {"degraded_answers": 0}
+
+# Local warmer/colder guidance against the library's reference views
+guidance_sessions = GuidanceSessions(navigation_library.references)
+guidance_latency = LatencyTracker()
+
+# Server-side follow-up chat. Each call sends at most CHAT_HISTORY_TOKENS of
+# recent turns plus a CHAT_SUMMARY_TOKENS summary of older ones, so its size
+# stays flat as the conversation grows.
+chat_sessions = ChatSessions(
+    history_tokens=int(os.getenv("CHAT_HISTORY_TOKENS", "1500")),
+    summary_tokens=int(os.getenv("CHAT_SUMMARY_TOKENS", "300")),
+    max_sessions=int(os.getenv("CHAT_MAX_SESSIONS", "500")),
+)
+
+# Frame-to-feedback latency across all live connections
+live_local_latency = LatencyTracker()
+live_llm_latency = LatencyTracker()
+
 # Pydantic models for request validation
 class NavigateRequest(BaseModel):
     text: str
@@ -24,16 +200,23 @@ class NavigateRequest(BaseModel):
 class IdentifyImageRequest(BaseModel):
     entity_name: str
     image: Optional[str] = None  # Base64 encoded image
+    session_id: Optional[str] = None
+    priority: Optional[str] = None
 
 # Helper function to decode base64 images
 def decode_image(base64_string):
     try:
-        # Remove potential data URL prefix
-        if 'base64,' in base64_string:
-            base64_string = base64_string.split('base64,')[1]
+        # Skip a potential data URL prefix without splitting the string
+        start = base64_string.find('base64,')
+        start = start + len('base64,') if start != -1 else 0
+
+        # Base64 inflates by 4/3: reject oversized payloads before decoding
+        if (len(base64_string) - start) * 3 // 4 > MAX_IMAGE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Image exceeds the {MAX_IMAGE_BYTES} byte limit")
             
         # Decode base64 string to bytes
-        img_data = base64.b64decode(base64_string)
+        img_data = base64.b64decode(base64_string[start:] if start else base64_string)
+        check_image_header(img_data)
         
         # Convert bytes to numpy array
         nparr = np.frombuffer(img_data, np.uint8)
@@ -42,150 +225,725 @@ def decode_image(base64_string):
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
         return img
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image format: {str(e)}")
 
-# Helper function for image identification logic
-def identify_entity_in_image(image, entity_name):
+# Helper function for every upstream Claude call
+def upstream_call(fn):
     """
-    Identify if the specified entity is present in the image using Claude's API.
+    Run one upstream API call.
+
+    Connection failures mark the link down and raise LinkDown so callers
+    can fall back to store-and-forward. While the link is down, live calls
+    fail fast, except for an occasional probe; a call that gets through
+    marks the link up again.
     """
-    # Convert OpenCV image to base64 for API request
+    if not outbox.should_try_upstream():
+        raise LinkDown("Upstream link is down")
+    try:
+        # Waits for a slot of the current request's priority class
+        with scheduler.slot():
+            result = fn()
+    except APIConnectionError as e:
+        outbox.mark_down()
+        raise LinkDown(str(e))
+    if not outbox.link_up:
+        outbox.mark_up()
+    return result
+
+def create_message(task=None, organ=None, **kwargs):
+    """
+    Send a messages API request to the configured backend. Remote backends
+    go through upstream_call; the offline backend answers directly.
+    """
+    if backend is offline_backend:
+        return backend.create_message(task=task, organ=organ, **kwargs)
+    return upstream_call(lambda: backend.create_message(task=task, organ=organ, **kwargs))
+
+# Helper function to call the model tier routed for a task
+def call_model(task, messages, tier=None, organ=None, **kwargs):
+    """
+    Send a request to the model configured for `task` (or an explicit tier)
+    and record latency, token usage and cost for that tier, the current
+    request, its session and the organ. `organ` is the target, used by the
+    offline backend. The usage budgets may shorten max_tokens, move the call
+    to the cheapest tier or answer it offline. Returns (response, tier).
+    """
+    rule = router.rule(task)
+    tier, max_tokens, mode = usage_ledger.plan(
+        tier or rule["tier"], kwargs.pop("max_tokens", rule["max_tokens"]), router.cheapest_tier()
+    )
+
+    started = time.perf_counter()
+    if mode == OFFLINE:
+        response = offline_backend.create_message(
+            task=task, organ=organ, model="offline", messages=messages, max_tokens=max_tokens, **kwargs
+        )
+        backend_stats["degraded_answers"] += 1
+        return response, tier
+
+    response = create_message(
+        task=task, organ=organ, model=router.model(tier), messages=messages, max_tokens=max_tokens, **kwargs
+    )
+    usage = getattr(response, "usage", None)
+    router.record(tier, started, usage)
+    usage_ledger.record(
+        task, tier, organ, usage, image_tokens(messages), time.perf_counter() - started, router.cost(tier, usage)
+    )
+    return response, tier
+
+# Helper function to validate a request's priority class
+def check_priority(priority):
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(PRIORITY_CLASSES)}")
+
+# Helper function to run blocking upstream work off the event loop
+async def run_upstream(priority, fn, *args):
+    """
+    Run `fn(*args)` in the threadpool under the given priority class, so
+    that waiting for an upstream slot never blocks the event loop.
+    """
+    check_priority(priority)
+
+    def call():
+        with priority_class(priority):
+            return fn(*args)
+
+    return await run_in_threadpool(call)
+
+# Helper function to turn a shed request into a retryable error
+def overloaded(e):
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+# Helper function to encode images for the Claude API
+def encode_image_base64(image):
+    """
+    Encode an OpenCV (BGR) or PIL image as a base64 JPEG string.
+    Already-encoded JPEG bytes are passed through without re-encoding.
+    """
+    if isinstance(image, bytes):
+        return base64.b64encode(image).decode("utf-8")
     if isinstance(image, np.ndarray):
         # Convert from BGR to RGB (OpenCV uses BGR by default)
         image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
         image_pil = Image.fromarray(image_rgb)
     else:
         image_pil = image
-    
-    # Convert image to base64
+
     buffer = io.BytesIO()
     image_pil.save(buffer, format="JPEG")
-    base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-    
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+# Helper function for image identification logic
+def identify_entity_in_image(image, entity_name):
+    """
+    Identify if the specified entity is present in the image using Claude's API.
+    """
+    return identify_with_confidence(image, entity_name)[0]
+
+def identify_with_confidence(image, entity_name):
+    """
+    Identify the entity and return only (found, confidence).
+    """
+    result = identify_structured(image, entity_name)
+    return result["found"], result["confidence"]
+
+def identify_structured(image, entity_name):
+    """
+    Identify the entity on the fast tier and escalate to the larger model
+    when the answer's confidence is below the routing threshold.
+
+    The model answers through a forced tool call. Returns a dict with
+    found, confidence, visibility ("full", "partial" or "absent"), an
+    approximate bbox (fractions of the image) and image_quality.
+    """
     # Using Claude Vision API for identification
     try:
-        response = claude_client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=10,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"Is there a {entity_name} in this image? Please respond with only 'true' or 'false'."
-                        },
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": base64_image
-                            }
-                        }
-                    ]
-                }
-            ]
-        )
-        response_text = response.content[0].text
-        
-        # Determine if the entity was found based on the response
-        if "true" in response_text.lower():
-            return True
-        elif "false" in response_text.lower():
-            return False
-        else:
-            # If response is unclear, default to False
-            return False
+        return run_identification(image, entity_name)
             
+    except (LinkDown, Overloaded):
+        raise
     except Exception as e:
         # Log the error (in a production environment)
         print(f"Error in Claude API call: {str(e)}")
-        # Default to False on error
-        return False
+        # Default to not found, with no confidence, on error
+        return dict(UNKNOWN_IDENTIFICATION)
 
-# Helper function for image description
-def generate_description(image):
+def identify_request(image, entity_name):
     """
-    Generate a detailed description of the image content using Claude's API.
+    Return the messages and tool arguments of an identification call.
     """
-    # Convert OpenCV image to base64 for API request
-    if isinstance(image, np.ndarray):
-        # Convert from BGR to RGB (OpenCV uses BGR by default)
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        image_pil = Image.fromarray(image_rgb)
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt_registry.get("identify", entity_name).text},
+                image_block(image)
+            ]
+        }
+    ]
+    return messages, {"tools": [IDENTIFY_TOOL], "tool_choice": {"type": "tool", "name": IDENTIFY_TOOL_NAME}}
+
+def run_identification(image, entity_name):
+    """
+    identify_structured without the error fallback: API errors propagate.
+    """
+    messages, tool_kwargs = identify_request(image, entity_name)
+    response, tier = call_model("identify", messages, organ=entity_name, **tool_kwargs)
+    return escalate_identification(parse_identification(response), tier, messages, tool_kwargs, entity_name)
+
+def escalate_identification(result, tier, messages, tool_kwargs, entity_name):
+    """
+    Re-ask on the escalation tier when the routing rule says the answer is not confident enough.
+    """
+    escalate_to = usage_ledger.escalation_allowed() and router.escalation("identify", tier, result["confidence"])
+    if not escalate_to:
+        return result
+    response, _ = call_model("identify", messages, tier=escalate_to, organ=entity_name, **tool_kwargs)
+    return parse_identification(response)
+
+# Helper function to look up the prompt version behind a task's answers
+def prompt_version(task):
+    return prompt_registry.version(TASK_PROMPTS[task])
+
+# Helper function for the multi-organ sweep
+def sweep_organs(images, organs):
+    """
+    Check every organ across one or more images in a single model call,
+    escalating when the least confident organ is below the routing
+    threshold. Returns the parsed sweep plus the tier that answered.
+    """
+    content = [{"type": "text", "text": prompt_registry.get("sweep", ", ".join(organs)).text}]
+    content.extend(image_block(image) for image in images)
+    messages = [{"role": "user", "content": content}]
+    tool_kwargs = {"tools": [sweep_tool(organs)], "tool_choice": {"type": "tool", "name": SWEEP_TOOL_NAME}}
+
+    response, tier = call_model("sweep", messages, organ=organs, **tool_kwargs)
+    result = parse_sweep(response, organs)
+
+    lowest = min(d["confidence"] for d in result["organs"].values())
+    escalate_to = usage_ledger.escalation_allowed() and router.escalation("sweep", tier, lowest)
+    if escalate_to:
+        response, tier = call_model("sweep", messages, tier=escalate_to, organ=organs, **tool_kwargs)
+        result = parse_sweep(response, organs)
+
+    result["tier"] = tier
+    return result
+
+# Helper functions for bulk identification
+def batch_mode(requested):
+    mode = requested or BATCH_MODE
+    if mode == "auto":
+        return "batch" if backend.supports_batches else "concurrent"
+    return mode
+
+def identify_concurrently(items, priority):
+    """
+    Yield (index, result, error) for items identified with individual calls,
+    at most BATCH_CONCURRENCY at a time.
+    """
+    def identify(item):
+        with priority_class(priority):
+            return run_identification(item["jpeg"], item["organ"])
+
+    yield from run_concurrent(((item["index"], item) for item in items), identify, BATCH_CONCURRENCY)
+
+def identify_via_message_batch(items, priority):
+    """
+    Yield (index, result, error) for items identified through one Message
+    Batch on the identify tier. Answers below the escalation threshold are
+    re-asked individually, with bounded concurrency, once the batch ends.
+    The batch is planned against the usage budgets like a single call; with
+    the budget spent the items are answered offline one by one.
+    """
+    rule = router.rule("identify")
+    tier, max_tokens, mode = usage_ledger.plan(rule["tier"], rule["max_tokens"], router.cheapest_tier())
+    if mode == OFFLINE:
+        yield from identify_concurrently(items, priority)
+        return
+    requests, calls = [], {}
+    for item in items:
+        messages, tool_kwargs = identify_request(item["jpeg"], item["organ"])
+        calls[item["index"]] = (messages, tool_kwargs, item["organ"])
+        requests.append({
+            "custom_id": f"item-{item['index']}",
+            "params": {"model": router.model(tier), "max_tokens": max_tokens, "messages": messages, **tool_kwargs},
+        })
+
+    answered = []
+    for custom_id, message, error in run_message_batch(
+        backend.client, requests, BATCH_POLL_INTERVAL, BATCH_TIMEOUT, submit=upstream_call
+    ):
+        index = int(custom_id.split("-", 1)[1])
+        if error is not None:
+            yield index, None, error
+            continue
+        usage = getattr(message, "usage", None)
+        router.record(tier, None, usage)
+        # Message Batches are billed at half price
+        usage_ledger.record(
+            "identify", tier, calls[index][2], usage, image_tokens(calls[index][0]), 0.0, router.cost(tier, usage) / 2
+        )
+        answered.append((index, parse_identification(message)))
+
+    def escalate(answer):
+        index, result = answer
+        with priority_class(priority):
+            return escalate_identification(result, tier, *calls[index])
+
+    yield from run_concurrent(answered, escalate, BATCH_CONCURRENCY)
+
+def identify_batch(items, mode, priority):
+    """
+    Identify many (image, organ) items, yielding one result dict per item as
+    it finishes and a summary dict at the end. A failed item yields its
+    error; it never stops the rest of the batch.
+    """
+    started = time.perf_counter()
+    failed = 0
+    pending = {}
+    for item in items:
+        if "error" in item:
+            failed += 1
+            yield {"index": item["index"], "organ": item["organ"], "error": item["error"]}
+        else:
+            pending[item["index"]] = item
+
+    if mode == "batch" and pending:
+        try:
+            with priority_class(priority):
+                for index, result, error in identify_via_message_batch(list(pending.values()), priority):
+                    item = pending.pop(index)
+                    line = {"index": index, "image_id": item["image_id"], "organ": item["organ"]}
+                    if error is not None:
+                        failed += 1
+                        yield {**line, "error": str(error)}
+                    else:
+                        yield {**line, **result}
+        except Exception as e:
+            # Batches unavailable or the batch itself failed: finish the rest with individual calls
+            print(f"Message batch failed, falling back to concurrent calls: {str(e)}")
+            mode = "concurrent"
+
+    if pending:
+        for index, result, error in identify_concurrently(list(pending.values()), priority):
+            item = pending.pop(index)
+            line = {"index": index, "image_id": item["image_id"], "organ": item["organ"]}
+            if error is not None:
+                failed += 1
+                yield {**line, "error": str(error)}
+            else:
+                yield {**line, **result}
+
+    yield {"summary": batch_stats.record(mode, len(items), failed, time.perf_counter() - started)}
+
+# Helper function to stream a blocking generator from a worker thread
+async def iterate_in_thread(iterator):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    done = object()
+    # The generator runs with the request's context, e.g. its usage scope
+    context = contextvars.copy_context()
+
+    def produce():
+        try:
+            for item in iterator:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, {"error": str(e)})
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    loop.run_in_executor(None, context.run, produce)
+    while True:
+        item = await queue.get()
+        if item is done:
+            return
+        yield item
+
+# Helper function to tell a real LLM identification from the error fallback
+def usable_identification(result):
+    # The LLM always reports visibility; UNKNOWN_IDENTIFICATION has none
+    return result.get("visibility") is not None
+
+# Helper function to reuse results for near-duplicate frames
+def cached_call(session_id, img, task, organ, compute, cacheable=None):
+    """
+    Return (result, deduplicated). Without a session_id the result is always
+    computed; with one, a perceptually near-identical frame seen earlier in
+    the session reuses its result for the same task, organ and prompt version.
+    Results `cacheable(result)` rejects (e.g. error fallbacks) are returned
+    but not kept, so the next similar frame asks again.
+    """
+    if not session_id:
+        return compute(), False
+
+    track_session(session_id)
+    frame_hash = dhash(img)
+    key = (task, organ.lower(), prompt_version(task))
+    cached = dedup_cache.lookup(session_id, frame_hash, key)
+    if cached is not None:
+        return cached, True
+
+    result = compute()
+    if cacheable is None or cacheable(result):
+        dedup_cache.add(session_id, frame_hash, key, result)
+    return result, False
+
+# Helper functions for the local classifier pre-filter
+def local_identification(img, entity_name):
+    """
+    Classify the frame locally. Returns (result, audit): result is None when
+    the classifier is missing, does not know the organ or is not confident;
+    audit is True when a confident answer should also be checked by the LLM.
+    """
+    organ = entity_name.strip().lower()
+    if organ_classifier is None or organ not in organ_classifier.classes:
+        return None, False
+
+    started = time.perf_counter()
+    probs = organ_classifier.predict_proba(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+    best = int(np.argmax(probs))
+    confident = probs[best] >= LOCAL_CLASSIFIER_THRESHOLD
+    audit = confident and random.random() < LOCAL_CLASSIFIER_AUDIT_RATE
+    prefilter_stats.record(started, confident and not audit)
+    if not confident:
+        return None, False
+
+    probability = float(probs[organ_classifier.classes.index(organ)])
+    found = organ_classifier.classes[best] == organ
+    result = {**UNKNOWN_IDENTIFICATION, "found": found, "confidence": round(probability if found else 1.0 - probability, 3)}
+    return result, audit
+
+def identify_with_prefilter(img, upload, entity_name):
+    """
+    Identify locally when the classifier is confident, otherwise through
+    the LLM. The result's `source` says which one answered.
+    """
+    local, audit = local_identification(img, entity_name)
+    if local is not None and not audit:
+        return {**local, "source": "local"}
+
+    result = identify_structured(upload, entity_name)
+    # A failed LLM call says nothing about agreement
+    if audit and usable_identification(result):
+        prefilter_stats.audit(result["found"] == local["found"])
+    return {**result, "source": "llm"}
+
+# Helper function for session-aware identification
+def identify_for_session(session_id, img, entity_name, jpeg_bytes=None):
+    """
+    Identify an entity, fusing the result with the session's recent history.
+
+    Without a session_id this is a single identification. With one, the
+    voting engine only calls upstream when the image has changed enough or
+    the evidence has gone stale, and returns a debounced `stable_found`.
+    Confident frames are answered by the local classifier either way. A
+    skipped call answers from the vote ("source": "vote"), with the last
+    identification's visibility, bbox and image quality.
+    """
+    upload = jpeg_bytes if jpeg_bytes is not None else img
+    track_session(session_id)
+    if not session_id:
+        return {**identify_with_prefilter(img, upload, entity_name), "entity": entity_name, "deduplicated": False}
+
+    dedup = {"hit": False}
+    detail = {}
+
+    def identify():
+        result, dedup["hit"] = cached_call(
+            session_id, img, "identify", entity_name,
+            lambda: identify_with_prefilter(img, upload, entity_name),
+            cacheable=lambda result: result["source"] == "local" or usable_identification(result),
+        )
+        detail.update(result)
+        return result["found"], result["confidence"]
+
+    stable, score, upstream, raw = voting_engine.decide(session_id, entity_name, dhash(img), identify)
+    voter = voting_engine.voter(session_id, entity_name)
+    if upstream:
+        voter.last_result = dict(detail)
+        source = "cache" if dedup["hit"] else detail["source"]
     else:
-        image_pil = image
-    
-    # Convert image to base64
-    buffer = io.BytesIO()
-    image_pil.save(buffer, format="JPEG")
-    base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-    
-    # Using Claude Vision API for image description
+        # The vote stands in for this frame: its confidence is the evidence for the stable answer
+        detail = {**UNKNOWN_IDENTIFICATION, **(voter.last_result or {})}
+        detail["confidence"] = round(score if stable else 1.0 - score, 3)
+        source = "vote"
+    return {
+        **{k: detail[k] for k in UNKNOWN_IDENTIFICATION},
+        "found": raw if upstream else stable,
+        "stable_found": stable,
+        "score": round(score, 3),
+        "upstream": upstream and source == "llm",
+        "source": source,
+        "entity": entity_name,
+        "deduplicated": dedup["hit"],
+    }
+
+# Helper function to normalise and register an image
+def store_image(content):
+    """
+    Decode raw image bytes, normalise them to JPEG and register them in the
+    image store. Returns (img, jpeg_bytes, image_id).
+    """
+    # Reject oversized images from their header before decoding any pixels
+    check_image_header(content)
+    nparr = np.frombuffer(content, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise HTTPException(status_code=400, detail="Invalid image format")
+
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    if not ok:
+        raise HTTPException(status_code=400, detail="Could not encode image")
+    jpeg_bytes = encoded.tobytes()
+    return img, jpeg_bytes, image_store.put(jpeg_bytes)
+
+# Helper function to resolve an uploaded image or a stored image ID
+async def load_image(image: Optional[UploadFile], image_id: Optional[str]):
+    """
+    Return (img, jpeg_bytes, image_id) for a request that carries either the
+    image itself or the ID of an image registered through /images.
+    """
+    if image is not None:
+        return store_image(await read_upload_limited(image))
+
+    if not image_id:
+        raise HTTPException(status_code=400, detail="Either image or image_id is required")
+
+    jpeg_bytes = image_store.get(image_id)
+    if jpeg_bytes is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired image_id")
+
+    img = cv2.imdecode(np.frombuffer(jpeg_bytes, np.uint8), cv2.IMREAD_COLOR)
+    return img, jpeg_bytes, image_id
+
+# Helper function to build a Claude image content block
+def image_block(image):
+    return {
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": "image/jpeg",
+            "data": encode_image_base64(image)
+        }
+    }
+
+# Helper functions for the long-running generations
+def generate_navigation(image, entity_name):
+    """
+    Generate probe navigation instructions towards an entity. Raises on API errors.
+    """
+    prompt = prompt_registry.get("navigation", entity_name)
+    response, _ = call_model(
+        "navigate",
+        [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt.suffix},
+                    image_block(image)
+                ]
+            }
+        ],
+        organ=entity_name,
+        system=prompt.prefix
+    )
+    return response.content[0].text
+
+def generate_diagnosis(image, target_organ):
+    """
+    Generate a diagnostic assessment of the target organ. Raises on API errors.
+    """
+    prompt = prompt_registry.get("diagnostic", target_organ)
+    response, _ = call_model(
+        "describe",
+        [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt.suffix},
+                    image_block(image)
+                ]
+            }
+        ],
+        organ=target_organ,
+        system=prompt.prefix
+    )
+    return response.content[0].text
+
+# Helper function for follow-up chat turns
+def generate_chat_reply(context, question, organ, image):
+    """
+    Answer a follow-up question from the session's compacted context and,
+    when available, its newest image. Raises on API errors.
+    """
+    prompt = prompt_registry.get("chat", organ or "scanned organ")
+    history = [prompt.suffix]
+    if context["summary"]:
+        history.append("Summary of earlier turns:\n" + "\n".join(context["summary"]))
+    if context["turns"]:
+        history.append("Recent turns:\n" + "\n\n".join(f"{role}: {text}" for role, text in context["turns"]))
+
+    content = [{"type": "text", "text": "\n\n".join(history)}]
+    if image is not None:
+        content.append(image_block(image))
+    content.append({"type": "text", "text": f"New question: {question}"})
+
+    response, _ = call_model(
+        "chat", [{"role": "user", "content": content}], organ=organ, system=prompt.prefix
+    )
+    return response.content[0].text
+
+# Helper function for a local diagnosis while the upstream link is down
+def offline_diagnosis(image, target_organ):
+    prompt = prompt_registry.get("diagnostic", target_organ)
+    response = offline_backend.create_message(
+        task="describe", organ=target_organ, model="offline", max_tokens=0,
+        messages=[{"role": "user", "content": [{"type": "text", "text": prompt.suffix}, image_block(image)]}]
+    )
+    return response.content[0].text
+
+# Helper function to queue a request while the upstream link is down
+def queue_offline(kind, organ, img, jpeg_bytes, session_id=None):
+    """
+    Store a request for replay and return an immediate local result: the
+    frame's quality score and whatever the session already knows.
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    payload = {"organ": organ.lower(), "session_id": session_id, "frame_hash": dhash(gray)}
+    item_id = outbox.enqueue(kind, payload, jpeg_bytes, priority=OUTBOX_PRIORITY[kind])
+
+    result = {
+        "queued": True,
+        "outbox_id": item_id,
+        "link_up": False,
+        "quality": round(frame_quality(gray), 3),
+    }
+    if kind == "identify" and session_id:
+        result["stable_found"] = voting_engine.voter(session_id, organ).stable
+    return result
+
+# Middleware accounting each HTTP request's model usage
+@app.middleware("http")
+async def account_usage(request: Request, call_next):
+    """
+    Collect the usage of the model calls made for a request and report it
+    in an X-Usage header. Streamed responses keep accounting to their
+    session and organ, but finish after the header is sent.
+    """
+    scope = RequestUsage(request.url.path)
+    token = current_request.set(scope)
     try:
-        response = claude_client.messages.create(
-            model="claude-3-sonnet-20240229",
-            max_tokens=4096,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": get_ultrasound_diagnostic_prompt()
-                        },
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": base64_image
-                            }
-                        }
-                    ]
-                }
-            ]
+        response = await call_next(request)
+    finally:
+        current_request.reset(token)
+    if scope.totals["calls"]:
+        usage_ledger.finish_request(scope)
+        totals = scope.totals
+        response.headers["X-Usage"] = (
+            f"calls={totals['calls']}; input={totals['input_tokens']}; output={totals['output_tokens']}; "
+            f"images={totals['image_tokens']}; cost_usd={totals['cost_usd']:.6f}"
         )
-        description = response.content[0].text
-        return description
-            
-    except Exception as e:
-        # Log the error (in a production environment)
-        print(f"Error in Claude API call: {str(e)}")
-        
-        # Fallback to basic description on error
-        width, height = image_pil.size
-        return f"Error generating AI description. Basic info: {width}x{height} image."
+    return response
+
+# Helper function for the largest multipart body an endpoint accepts
+def multipart_limit(path):
+    if path == "/analyze_clip":
+        files = MAX_CLIP_BYTES
+    elif path == "/sweep":
+        files = MAX_SWEEP_IMAGES * MAX_IMAGE_BYTES
+    elif path == "/identify_batch":
+        files = MAX_BATCH_ITEMS * MAX_IMAGE_BYTES
+    else:
+        files = MAX_IMAGE_BYTES
+    # Room for the form fields and part headers
+    return files + UPLOAD_CHUNK_SIZE
+
+# Middleware bounding multipart uploads before the form is parsed
+@app.middleware("http")
+async def limit_multipart_body(request: Request, call_next):
+    """
+    The form parser spools a whole multipart body before any endpoint runs,
+    so its size is checked here against the declared Content-Length (which
+    the server enforces while reading). Multipart requests without one are
+    refused.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        if request.headers.get("content-length") is None:
+            return JSONResponse({"detail": "Content-Length is required for uploads"}, status_code=411)
+        try:
+            check_content_length(request.headers, multipart_limit(request.url.path))
+        except HTTPException as e:
+            return JSONResponse({"detail": e.detail}, status_code=e.status_code)
+    return await call_next(request)
+
+# Endpoint 0: Register an image once and refer to it by ID
+@app.post("/images", response_class=JSONResponse)
+async def upload_image(request: Request):
+    """
+    Store a normalised copy of an image and return its content-hash ID.
+
+    The ID can be passed as `image_id` to /identify, /navigate and /describe
+    instead of uploading the image again. The image is sent either as the
+    raw request body (Content-Type: application/octet-stream) or as the
+    `image` field of a multipart form. Bodies over MAX_IMAGE_BYTES are
+    rejected before they are read, and images over MAX_IMAGE_PIXELS are rejected
+    from their header before decoding.
+
+    Returns:
+    - JSON with the image ID, dimensions and stored size
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("image")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Form field 'image' is required")
+        content = await read_upload_limited(upload)
+    else:
+        content = await read_body_limited(request)
+
+    img, jpeg_bytes, image_id = store_image(content)
+    height, width = img.shape[:2]
+    return {"image_id": image_id, "width": width, "height": height, "bytes": len(jpeg_bytes)}
 
 # Endpoint 1: Identify image
 @app.post("/identify", response_class=JSONResponse)
-async def identify_image(entity_name: str = Form(...), image: UploadFile = File(...)):
+async def identify_image(
+    entity_name: str = Form(...),
+    image: Optional[UploadFile] = File(None),
+    image_id: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+    priority: Optional[str] = Form(None),
+):
     """
     Identify if a specific entity exists in an image.
     
     Parameters:
     - entity_name (str): The name of the entity to search for
     - image (File): The uploaded image file
+    - image_id (str): ID from /images, used instead of image
+    - session_id (str): Optional session; near-duplicate frames reuse earlier results
+    - priority (str): Scheduling class, defaults to "navigation"
     
     Returns:
-    - JSON with identification result (True/False)
+    - JSON with found, confidence, visibility, an approximate bbox and image_quality
     """
+    img, jpeg_bytes, image_id = await load_image(image, image_id)
+
     try:
-        # Read image file
-        content = await image.read()
-        nparr = np.frombuffer(content, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
-        
         # Perform entity identification
-        result = identify_entity_in_image(img, entity_name)
-        
-        return {"found": result, "entity": entity_name}
+        return await run_upstream(priority or "navigation", identify_for_session, session_id, img, entity_name, jpeg_bytes)
     
+    except LinkDown:
+        return {"found": None, "entity": entity_name, **queue_offline("identify", entity_name, img, jpeg_bytes, session_id)}
+    except Overloaded as e:
+        raise overloaded(e)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -199,7 +957,7 @@ async def identify_image_base64(request: IdentifyImageRequest):
     - request (IdentifyImageRequest): Contains entity_name and base64-encoded image
     
     Returns:
-    - JSON with identification result (True/False)
+    - JSON with found, confidence, visibility, an approximate bbox and image_quality
     """
     try:
         if not request.image:
@@ -212,135 +970,996 @@ async def identify_image_base64(request: IdentifyImageRequest):
             raise HTTPException(status_code=400, detail="Invalid image format")
         
         # Perform entity identification
-        result = identify_entity_in_image(img, request.entity_name)
-        
-        return {"found": result, "entity": request.entity_name}
+        return await run_upstream(
+            request.priority or "navigation", identify_for_session, request.session_id, img, request.entity_name
+        )
     
+    except LinkDown:
+        jpeg_bytes = cv2.imencode(".jpg", img)[1].tobytes()
+        return {"found": None, "entity": request.entity_name, **queue_offline("identify", request.entity_name, img, jpeg_bytes, request.session_id)}
+    except Overloaded as e:
+        raise overloaded(e)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Endpoint 2: Navigate - FIXED to correctly handle image UploadFile
+# Endpoint 1 Alternative: Identify image sent as a raw binary body
+@app.post("/identify_raw", response_class=JSONResponse)
+async def identify_image_raw(
+    request: Request, entity_name: str, session_id: Optional[str] = None, priority: Optional[str] = None
+):
+    """
+    Identify if a specific entity exists in an image sent as the raw request
+    body (Content-Type: application/octet-stream).
+
+    Avoids the base64 inflation of /identify_base64. The body is read
+    incrementally and rejected once it exceeds MAX_IMAGE_BYTES.
+
+    Parameters:
+    - entity_name (str): Query parameter, the name of the entity to search for
+    - session_id (str): Optional query parameter for near-duplicate reuse
+    - priority (str): Optional query parameter, scheduling class
+
+    Returns:
+    - JSON with found, confidence, visibility, an approximate bbox and image_quality
+    """
+    img, jpeg_bytes, image_id = store_image(await read_body_limited(request))
+
+    try:
+        return await run_upstream(priority or "navigation", identify_for_session, session_id, img, entity_name, jpeg_bytes)
+
+    except LinkDown:
+        return {"found": None, "entity": entity_name, **queue_offline("identify", entity_name, img, jpeg_bytes, session_id)}
+    except Overloaded as e:
+        raise overloaded(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Endpoint 2: Navigate
 @app.post("/navigate", response_class=JSONResponse)
-async def navigate(entity_name: str = Form(...), image: UploadFile = File(...)):
+async def navigate(
+    entity_name: str = Form(...),
+    image: Optional[UploadFile] = File(None),
+    image_id: Optional[str] = Form(None),
+    priority: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+):
     """
     Process image and provide navigation instructions to locate a specific entity.
     
     Parameters:
     - entity_name (str): The name of the entity to navigate to
     - image (File): The uploaded image file
+    - image_id (str): ID from /images, used instead of image
+    - priority (str): Scheduling class, defaults to "navigation"
+    - session_id (str): Optional session the usage is accounted and budgeted to
     
     Returns:
-    - JSON with navigation response
+    - JSON with navigation response, its source ("library" or "llm"), the
+      local view classification and, for LLM answers, a candidate_id for vetting
     """
+    img, jpeg_bytes, image_id = await load_image(image, image_id)
+    track_session(session_id)
+
+    # Known transitions from a confidently classified view skip the LLM
+    signature = frame_signature(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+    version = prompt_version("navigate")
+    text, view = navigation_library.lookup(signature, entity_name, version)
+    if text is not None:
+        chat_sessions.add_turn(session_id, "assistant", text, image_id=image_id, organ=entity_name)
+        return {"response": text, "source": "library", "view": view}
+
     try:
-        # Read image file
-        content = await image.read()
-        nparr = np.frombuffer(content, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
-        
-        # Convert OpenCV image to base64 for API request
-        image_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        image_pil = Image.fromarray(image_rgb)
-        
-        buffer = io.BytesIO()
-        image_pil.save(buffer, format="JPEG")
-        base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-        
-        # This would typically connect to a navigation service or NLP model
-        payload = {
-            "model": "claude-3-7-sonnet-20250219",  # or the latest vision model
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": get_navigation_prompt(entity_name)
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "max_tokens": 4096  # Adjust based on desired description length
-        }
-        
-        response = claude_client.messages.create(**payload)
-        
-        return {"response": response.content[0].text}
+        response = await run_upstream(priority or "navigation", generate_navigation, jpeg_bytes, entity_name)
+        candidate_id = navigation_library.add_candidate(entity_name, version, signature, view, response, image_id)
+        chat_sessions.add_turn(session_id, "assistant", response, image_id=image_id, organ=entity_name)
+        return {"response": response, "source": "llm", "view": view, "candidate_id": candidate_id}
     
+    except LinkDown:
+        return {"response": None, **queue_offline("navigate", entity_name, img, jpeg_bytes)}
+    except Overloaded as e:
+        raise overloaded(e)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in navigate endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 # Endpoint 3: Describe
 @app.post("/describe", response_class=JSONResponse)
-async def describe_image(target_organ: str = Form(...), image: UploadFile = File(...)):
+async def describe_image(
+    target_organ: str = Form(...),
+    image: Optional[UploadFile] = File(None),
+    image_id: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+    priority: Optional[str] = Form(None),
+):
     """
     Generate a description of an uploaded image.
     
     Parameters:
+    - target_organ (str): The organ the image should show
     - image (File): The uploaded image file
+    - image_id (str): ID from /images, used instead of image
+    - session_id (str): Optional session; near-duplicate frames reuse earlier results
+    - priority (str): Scheduling class, defaults to "diagnostic"
     
     Returns:
     - JSON with image description
     """
+    img, jpeg_bytes, image_id = await load_image(image, image_id)
+
     try:
-        # Read image file
-        content = await image.read()
-        nparr = np.frombuffer(content, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        description, deduplicated = await run_upstream(
+            priority or "diagnostic", cached_call, session_id, img, "describe", target_organ,
+            lambda: generate_diagnosis(jpeg_bytes, target_organ)
+        )
+        # Follow-up questions in /chat start from this diagnosis and image
+        chat_sessions.add_turn(session_id, "assistant", description, image_id=image_id, organ=target_organ)
         
+        return {"description": description, "deduplicated": deduplicated}
+    
+    except LinkDown:
+        queued = queue_offline("describe", target_organ, img, jpeg_bytes, session_id)
+        if not LLM_OFFLINE_FALLBACK:
+            return {"description": None, **queued}
+        backend_stats["degraded_answers"] += 1
+        return {"description": offline_diagnosis(jpeg_bytes, target_organ), "degraded": True, **queued}
+    except Overloaded as e:
+        raise overloaded(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in describe endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Endpoint 4: Analyze a cine-loop clip through its keyframes
+@app.post("/analyze_clip", response_class=JSONResponse)
+async def analyze_clip(
+    entity_name: str = Form(...),
+    clip: UploadFile = File(...),
+    task: str = Form("identify"),
+    top_k: int = Form(4),
+    stride: int = Form(5),
+    priority: Optional[str] = Form(None),
+):
+    """
+    Pick the best keyframes from an MP4/AVI clip and run a task on them.
+
+    The clip is streamed to a temporary file and decoded frame by frame, so
+    it is never fully held in memory. Frames are scored for quality and
+    novelty and only the top-k are forwarded to the model.
+
+    Parameters:
+    - entity_name (str): The target organ
+    - clip (File): The uploaded video clip
+    - task (str): One of "identify", "navigate" or "describe"
+    - top_k (int): Maximum number of keyframes sent to the model (at most MAX_CLIP_KEYFRAMES)
+    - stride (int): Only every `stride`-th frame is scored
+    - priority (str): Scheduling class, defaults by task
+
+    Returns:
+    - JSON with the task result and the keyframes that were used
+    """
+    if task not in ("identify", "navigate", "describe"):
+        raise HTTPException(status_code=400, detail="task must be identify, navigate or describe")
+    if top_k < 1 or stride < 1:
+        raise HTTPException(status_code=400, detail="top_k and stride must be positive")
+    if top_k > MAX_CLIP_KEYFRAMES:
+        raise HTTPException(status_code=400, detail=f"top_k must be at most {MAX_CLIP_KEYFRAMES}")
+
+    suffix = os.path.splitext(clip.filename or "")[1] or ".mp4"
+    tmp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        with tmp:
+            written = 0
+            while True:
+                chunk = await clip.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > MAX_CLIP_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Clip exceeds the {MAX_CLIP_BYTES} byte limit")
+                tmp.write(chunk)
+
+        try:
+            keyframes, frames_scanned = await run_in_threadpool(select_keyframes, tmp.name, top_k, stride)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        os.remove(tmp.name)
+
+    if not keyframes:
+        raise HTTPException(status_code=400, detail="No decodable frames in clip")
+
+    frame_info = [
+        {"frame": k["index"], "quality": round(k["quality"], 3), "novelty": round(k["novelty"], 3), "score": round(k["score"], 3)}
+        for k in keyframes
+    ]
+    result = {"entity": entity_name, "task": task, "frames_scanned": frames_scanned, "keyframes": frame_info}
+
+    def run_task():
+        if task == "identify":
+            # Best keyframe first; stop as soon as the organ is found
+            used = []
+            found = False
+            for k in keyframes:
+                used.append(k["index"])
+                if identify_entity_in_image(k["frame"], entity_name):
+                    found = True
+                    break
+            return {"found": found, "frames_used": used}
+
+        prompt = prompt_registry.get(TASK_PROMPTS[task], entity_name)
+        content = [{"type": "text", "text": prompt.suffix}]
+        for k in keyframes:
+            content.append(image_block(k["frame"]))
+
+        response, _ = call_model(
+            "clip", [{"role": "user", "content": content}], organ=entity_name, system=prompt.prefix
+        )
+        key = "response" if task == "navigate" else "description"
+        return {key: response.content[0].text, "frames_used": [k["index"] for k in keyframes]}
+
+    try:
+        default_priority = "diagnostic" if task == "describe" else "navigation"
+        result.update(await run_upstream(priority or default_priority, run_task))
+        return result
+
+    except LinkDown as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except Overloaded as e:
+        raise overloaded(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in analyze_clip endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Endpoint 5: Live probe guidance over a WebSocket
+@app.websocket("/ws/guide")
+async def guide_socket(websocket: WebSocket):
+    """
+    Stream frames in, get incremental guidance back.
+
+    The client sends encoded frames (JPEG/PNG) as binary messages and may send
+    a JSON text message {"entity_name": ...} to change the target organ. The
+    target can also be given as the `entity_name` query parameter.
+
+    Frames are handled latest-frame-wins: if processing falls behind, stale
+    frames are dropped. Every processed frame gets a cheap local check
+    ("local" messages), including warmer/colder guidance towards the target's
+    reference views once any are labelled; the LLM is called at most once every
+    LIVE_LLM_INTERVAL seconds with the newest good frame, and only when the
+    view has changed since the last call ("identify" messages, including the
+    debounced `stable_found`). Every message carries the frame-to-feedback
+    latency.
+    """
+    await websocket.accept()
+
+    entity = {"name": websocket.query_params.get("entity_name", "")}
+    session_key = websocket.query_params.get("session_id") or f"ws-{id(websocket)}"
+    # HTTP middleware does not see websockets, so account the connection here
+    current_request.set(RequestUsage("/ws/guide"))
+    track_session(session_key)
+    slot = LatestFrameSlot()
+    send_lock = asyncio.Lock()
+    llm_state = {"last_call": 0.0, "task": None, "calls": 0}
+    guidance = {"tracker": None}
+
+    async def send(message):
+        async with send_lock:
+            await websocket.send_text(json.dumps(message))
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                slot.put(message["bytes"])
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    continue
+                if control.get("entity_name"):
+                    entity["name"] = control["entity_name"]
+
+    async def call_llm(seq, img, frame_hash, received_at):
+        try:
+            voter = voting_engine.voter(session_key, entity["name"])
+            result = await run_upstream("navigation", identify_structured, img, entity["name"])
+            stable = voter.observe(result["found"], result["confidence"], frame_hash=frame_hash)
+            latency = elapsed_ms(received_at)
+            live_llm_latency.record(latency)
+            await send({
+                "type": "identify",
+                "seq": seq,
+                "entity": entity["name"],
+                "found": result["found"],
+                "stable_found": stable,
+                "visibility": result["visibility"],
+                "bbox": result["bbox"],
+                "latency_ms": round(latency, 1),
+            })
+        except Exception as e:
+            print(f"Error in live identify call: {str(e)}")
+
+    def analyze_frame(data, target):
+        # Decoding and the local checks are CPU-bound, so they run off the event loop
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
         if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format")
-        
-        # Convert OpenCV image to base64 for API request
-        image_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        image_pil = Image.fromarray(image_rgb)
-        
-        buffer = io.BytesIO()
-        image_pil.save(buffer, format="JPEG")
-        base64_image = base64.b64encode(buffer.getvalue()).decode("utf-8")
-        
-        # This would typically connect to a navigation service or NLP model
+            return None
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        feedback = None
+        if target:
+            if guidance["tracker"] is None or guidance["tracker"].target != target.lower():
+                guidance["tracker"] = GuidanceTracker(target.lower(), navigation_library.references)
+            feedback = guidance["tracker"].update(gray)
+        return img, frame_quality(gray), frame_signature(gray), dhash(gray), feedback
+
+    async def process_frame(seq, data, received_at, previous):
+        analysis = await run_in_threadpool(analyze_frame, data, entity["name"])
+        if analysis is None:
+            await send({"type": "error", "seq": seq, "detail": "Invalid image format"})
+            return
+
+        img, quality, signature, frame_hash, feedback = analysis
+        stable = previous["signature"] is not None and float(np.dot(signature, previous["signature"])) > 0.9
+        previous["signature"] = signature
+        if feedback is not None:
+            guidance_latency.record(feedback["latency_ms"])
+
+        if quality < LIVE_MIN_QUALITY:
+            hint = "Image is unclear: check probe contact and gel, then adjust gain"
+        elif feedback is not None and feedback["warmth"] is not None:
+            hint = feedback["hint"]
+        elif not stable:
+            hint = "Probe moving"
+        else:
+            hint = "Hold still"
+
+        latency = elapsed_ms(received_at)
+        live_local_latency.record(latency)
+        await send({
+            "type": "local",
+            "seq": seq,
+            "quality": round(quality, 3),
+            "stable": stable,
+            "hint": hint,
+            "guidance": feedback,
+            "latency_ms": round(latency, 1),
+            "received": slot.received,
+            "dropped": slot.dropped,
+        })
+
+        # Throttled upstream call on a good, steady frame; never more than one in flight,
+        # and only when the view has changed since the last identification
+        now = asyncio.get_running_loop().time()
+        llm_idle = llm_state["task"] is None or llm_state["task"].done()
+        if (entity["name"] and llm_idle and quality >= LIVE_MIN_QUALITY and stable
+                and now - llm_state["last_call"] >= LIVE_LLM_INTERVAL):
+            if voting_engine.voter(session_key, entity["name"]).needs_upstream(frame_hash):
+                llm_state["last_call"] = now
+                llm_state["calls"] += 1
+                llm_state["task"] = asyncio.create_task(call_llm(seq, img, frame_hash, received_at))
+
+    async def process_frames():
+        previous = {"signature": None}
+        while True:
+            seq, data, received_at = await slot.take()
+            try:
+                await process_frame(seq, data, received_at, previous)
+            except Exception as e:
+                # A bad frame must not end the session's processing silently
+                print(f"Error processing live frame {seq}: {str(e)}")
+                await send({"type": "error", "seq": seq, "detail": f"Frame processing failed: {str(e)}"})
+
+    receiver = asyncio.create_task(receive_frames())
+    processor = asyncio.create_task(process_frames())
+    try:
+        await receiver
+    finally:
+        processor.cancel()
+        if llm_state["task"] is not None:
+            llm_state["task"].cancel()
+        print(f"Live session closed: {slot.received} frames, {slot.dropped} dropped, {llm_state['calls']} LLM calls")
+
+# Asynchronous job handlers: (payload, image bytes) -> JSON result
+def navigate_job(payload, image):
+    # Vetted library answers cost nothing, which also makes prefetching them free
+    gray = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_GRAYSCALE)
+    signature = frame_signature(gray)
+    version = prompt_version("navigate")
+    text, view = navigation_library.lookup(signature, payload["organ"], version)
+    if text is not None:
+        return {"response": text, "source": "library", "view": view}
+
+    with priority_class(payload.get("priority", "navigation")):
+        response = generate_navigation(image, payload["organ"])
+    candidate_id = navigation_library.add_candidate(payload["organ"], version, signature, view, response)
+    return {"response": response, "source": "llm", "view": view, "candidate_id": candidate_id}
+
+def describe_job(payload, image):
+    with priority_class(payload.get("priority", "diagnostic")):
+        return {"description": generate_diagnosis(image, payload["organ"])}
+
+def accounted_job(handler, kind):
+    """
+    Run a job handler under its own usage scope and add the job's usage
+    (tokens and cost) to its result.
+    """
+    def run(payload, image):
+        scope = RequestUsage(f"/jobs ({kind})")
+        scope.session_id = payload.get("session_id")
+        token = current_request.set(scope)
+        try:
+            result = handler(payload, image)
+        finally:
+            current_request.reset(token)
+        usage_ledger.finish_request(scope)
+        return {**result, "usage": scope.summary()}
+    return run
+
+def job_finished(job_id, kind, status, result):
+    speculation_stats.finished(job_id, (result or {}).get("usage") or {})
+
+# Navigation prefetched while identification is pending, and what it cost
+speculation_stats = SpeculationStats()
+
+job_queue = JobQueue(
+    JOB_DB_PATH,
+    handlers={"navigate": accounted_job(navigate_job, "navigate"), "describe": accounted_job(describe_job, "describe")},
+    workers=JOB_WORKERS,
+    on_finish=job_finished,
+)
+
+def identify_batch_job(payload, image):
+    # The item images are stored back to back in the job's image
+    items, offset = [], 0
+    for item in payload["items"]:
+        item = dict(item)
+        if "error" not in item:
+            item["jpeg"] = image[offset:offset + item["size"]]
+            offset += item["size"]
+        items.append(item)
+    lines = list(identify_batch(items, "batch", payload.get("priority", "routine")))
+    return {"items": lines[:-1], "summary": lines[-1]["summary"]}
+
+# Message Batches can take hours, so they get their own workers on the job database
+batch_queue = JobQueue(
+    JOB_DB_PATH,
+    handlers={"identify_batch": accounted_job(identify_batch_job, "identify_batch")},
+    workers=BATCH_JOB_WORKERS,
+)
+
+# Store-and-forward replay handlers: (payload, image bytes) -> JSON result
+def identify_replay(payload, image):
+    return identify_structured(image, payload["organ"])
+
+def replayed_result(kind, payload, result):
+    """
+    Feed a replayed answer into the session's near-duplicate cache, so the
+    same view uploaded again returns it without another upstream call.
+    """
+    if payload.get("session_id") and kind in ("identify", "describe"):
+        if kind == "identify" and not usable_identification(result):
+            return
+        value = result if kind == "identify" else result["description"]
+        key = (kind, payload["organ"], prompt_version(kind))
+        dedup_cache.add(payload["session_id"], payload["frame_hash"], key, value)
+
+outbox = Outbox(
+    OUTBOX_DB_PATH,
+    handlers={"identify": identify_replay, "navigate": navigate_job, "describe": describe_job},
+    rate=OUTBOX_RATE_BPS,
+    on_result=replayed_result,
+)
+
+@app.on_event("startup")
+async def start_job_workers():
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = max(limiter.total_tokens, scheduler.max_blocked() + THREADPOOL_HEADROOM)
+    job_queue.start()
+    batch_queue.start()
+    outbox.start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    job_queue.stop()
+    batch_queue.stop()
+    outbox.stop()
+
+# Endpoint 6: Submit a long-running generation as a job
+@app.post("/jobs", response_class=JSONResponse, status_code=202)
+async def submit_job(
+    kind: str = Form(...),
+    organ: str = Form(...),
+    image: Optional[UploadFile] = File(None),
+    image_id: Optional[str] = Form(None),
+    speculative: bool = Form(False),
+    session_id: Optional[str] = Form(None),
+):
+    """
+    Queue a navigate or describe generation and return at once.
+
+    Results are fetched with GET /jobs/{job_id} (optionally long-polling
+    with `wait`) or streamed with GET /jobs/{job_id}/events. Submitting the
+    same kind, organ and image again (under the same prompt version)
+    returns the existing job, so a client that reconnects never triggers a
+    recomputation.
+
+    A speculative job (e.g. navigation prefetched while identification is
+    pending) runs in the lowest priority class and is declined once the
+    usage budget is under pressure. Fetching its finished result counts it
+    as used; DELETE discards it and counts any cost it had as wasted.
+
+    Parameters:
+    - kind (str): "navigate" or "describe"
+    - organ (str): The target organ
+    - image (File): The uploaded image file
+    - image_id (str): ID from /images, used instead of image
+    - speculative (bool): Whether the result may turn out not to be needed
+    - session_id (str): Optional session the usage is accounted and budgeted to
+
+    Returns:
+    - JSON with the job ID and its current status ("declined", with no job
+      ID, for a speculative job the budget does not allow)
+    """
+    if kind not in ("navigate", "describe"):
+        raise HTTPException(status_code=400, detail="kind must be navigate or describe")
+    if speculative and usage_ledger.pressure(session_id) >= usage_ledger.soft_limit:
+        return {"job_id": None, "status": "declined", "created": False}
+
+    img, jpeg_bytes, image_id = await load_image(image, image_id)
+    # The prompt version is part of the job key, so a changed prompt is recomputed
+    payload = {"organ": organ.lower(), "prompt_version": prompt_version(kind)}
+    # Scheduling and accounting only: the same work dedupes whoever submits it
+    context = {"session_id": session_id} if session_id else {}
+    if speculative:
+        context["priority"] = "routine"
+        # Tracked before it is queued, so a fast finish is not missed
+        speculation_stats.submit(JobQueue.job_id(kind, payload, jpeg_bytes))
+    job_id, created = job_queue.submit(kind, payload, jpeg_bytes, context)
+    job = job_queue.get(job_id)
+    return {"job_id": job_id, "status": job["status"], "created": created}
+
+# Endpoint 6: Poll or long-poll a job
+@app.get("/jobs/{job_id}", response_class=JSONResponse)
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Return a job's status and, once finished, its result.
+
+    Parameters:
+    - wait (float): Seconds to wait for the job to finish before returning (max 60)
+    """
+    deadline = asyncio.get_running_loop().time() + min(max(wait, 0), JOB_MAX_WAIT)
+    while True:
+        job = job_queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown job_id")
+        if job["status"] in FINISHED or asyncio.get_running_loop().time() >= deadline:
+            if job["status"] == DONE:
+                speculation_stats.use(job_id)
+            return job
+        await asyncio.sleep(0.25)
+
+# Endpoint 6: Stream a job's progress as server-sent events
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Server-sent events: a "status" event whenever the status changes and a
+    final "result" event with the finished job.
+    """
+    if job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job_id")
+
+    async def events():
+        last_status = None
+        while True:
+            job = job_queue.get(job_id)
+            if job is None:
+                return
+            if job["status"] in FINISHED:
+                yield f"event: result\ndata: {json.dumps(job)}\n\n"
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield f"event: status\ndata: {json.dumps({'job_id': job_id, 'status': last_status})}\n\n"
+            else:
+                # Keep idle proxies from closing the stream
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(1.0)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+# Endpoint 6: Cancel a queued job
+@app.delete("/jobs/{job_id}", response_class=JSONResponse)
+async def cancel_job(job_id: str):
+    """
+    Cancel a job that has not started yet. A speculative job that already
+    started is discarded, and its cost counted as wasted.
+    """
+    if job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job_id")
+    cancelled = job_queue.cancel(job_id)
+    speculative = speculation_stats.tracks(job_id)
+    if speculative:
+        speculation_stats.discard(job_id, cancelled)
+    return {"job_id": job_id, "cancelled": cancelled, "discarded": speculative and not cancelled}
+
+# Endpoint 7: Result of a store-and-forward request
+@app.get("/outbox/{item_id}", response_class=JSONResponse)
+async def get_outbox_item(item_id: int):
+    """
+    Return the status of a request queued while the link was down and,
+    once replayed, its result.
+    """
+    item = outbox.get(item_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Unknown outbox item")
+    return item
+
+# Endpoint 8: Check several organs in one call
+@app.post("/sweep", response_class=JSONResponse)
+async def sweep(
+    organs: str = Form(...),
+    images: Optional[List[UploadFile]] = File(None),
+    image_ids: Optional[str] = Form(None),
+    priority: Optional[str] = Form(None),
+):
+    """
+    Report the presence of several organs from a single model call.
+
+    Each image is ingested once, whether uploaded or referenced by ID, and
+    all of them go into the same request together with the organ list.
+
+    Parameters:
+    - organs (str): Comma-separated organ names, e.g. "liver,kidneys,heart"
+    - images (File): Up to MAX_SWEEP_IMAGES uploaded image files
+    - image_ids (str): Comma-separated IDs from /images, used with or instead of images
+    - priority (str): Scheduling class, defaults to "routine"
+
+    Returns:
+    - JSON with found, confidence, visibility and bbox per organ, plus image_quality
+    """
+    organ_list = list(dict.fromkeys(o.strip().lower() for o in organs.split(",") if o.strip()))
+    if not organ_list:
+        raise HTTPException(status_code=400, detail="At least one organ is required")
+    if len(organ_list) > MAX_SWEEP_ORGANS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SWEEP_ORGANS} organs per sweep")
+
+    ids = [i.strip() for i in (image_ids or "").split(",") if i.strip()]
+    uploads = images or []
+    if not uploads and not ids:
+        raise HTTPException(status_code=400, detail="Either images or image_ids is required")
+    if len(uploads) + len(ids) > MAX_SWEEP_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SWEEP_IMAGES} images per sweep")
+
+    jpegs, stored_ids = [], []
+    for upload in uploads:
+        _, jpeg_bytes, image_id = await load_image(upload, None)
+        jpegs.append(jpeg_bytes)
+        stored_ids.append(image_id)
+    for image_id in ids:
+        _, jpeg_bytes, image_id = await load_image(None, image_id)
+        jpegs.append(jpeg_bytes)
+        stored_ids.append(image_id)
+
+    try:
+        result = await run_upstream(priority or "routine", sweep_organs, jpegs, organ_list)
+        return {**result, "image_ids": stored_ids}
+
+    except LinkDown as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    except Overloaded as e:
+        raise overloaded(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in sweep endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Endpoint 9: Identify many (image, organ) pairs, streaming results
+@app.post("/identify_batch")
+async def identify_batch_endpoint(
+    organs: str = Form(...),
+    images: Optional[List[UploadFile]] = File(None),
+    image_ids: Optional[str] = Form(None),
+    mode: Optional[str] = Form(None),
+    priority: Optional[str] = Form(None),
+):
+    """
+    Identify organs in many images for offline review.
+
+    Items are the uploaded images followed by the referenced image IDs.
+    With individual calls (bounded concurrency) the results stream back as
+    newline-delimited JSON, one line per item as it finishes, and the last
+    line is a summary with the run's throughput. A Message Batch can take
+    hours to end, so it is queued as an "identify_batch" job instead and
+    its items and summary are fetched with GET /jobs/{job_id}. An item
+    that fails to decode or to be identified gets an error line; the rest
+    continue.
+
+    Parameters:
+    - organs (str): One organ for every item, or a comma-separated organ per item
+    - images (File): Uploaded image files
+    - image_ids (str): Comma-separated IDs from /images
+    - mode (str): "batch", "concurrent" or "auto" (default from BATCH_MODE)
+    - priority (str): Scheduling class, defaults to "routine"
+
+    Returns:
+    - NDJSON stream of per-item results followed by {"summary": ...}, or in
+      batch mode JSON with the job ID (HTTP 202)
+    """
+    priority = priority or "routine"
+    check_priority(priority)
+    mode = batch_mode(mode)
+    if mode not in ("batch", "concurrent"):
+        raise HTTPException(status_code=400, detail="mode must be batch, concurrent or auto")
+
+    uploads = images or []
+    ids = [i.strip() for i in (image_ids or "").split(",") if i.strip()]
+    count = len(uploads) + len(ids)
+    if count == 0:
+        raise HTTPException(status_code=400, detail="Either images or image_ids is required")
+    if count > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ITEMS} items per batch")
+
+    organ_list = [o.strip() for o in organs.split(",") if o.strip()]
+    if len(organ_list) == 1:
+        organ_list = organ_list * count
+    if len(organ_list) != count:
+        raise HTTPException(status_code=400, detail="Give one organ, or one organ per item")
+
+    # Each image is ingested once; a bad image only fails its own item
+    items = []
+    sources = [(upload, None) for upload in uploads] + [(None, image_id) for image_id in ids]
+    for index, ((upload, image_id), organ) in enumerate(zip(sources, organ_list)):
+        item = {"index": index, "organ": organ, "image_id": image_id}
+        try:
+            _, item["jpeg"], item["image_id"] = await load_image(upload, image_id)
+        except HTTPException as e:
+            item["error"] = e.detail
+        items.append(item)
+
+    if mode == "batch":
         payload = {
-            "model": "claude-3-7-sonnet-20250219",  # or the latest vision model
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": get_ultrasound_diagnostic_prompt(target_organ)
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "max_tokens": 4096  # Adjust based on desired description length
+            "items": [{k: v for k, v in item.items() if k != "jpeg"} for item in items],
+            "prompt_version": prompt_version("identify"),
         }
-        
-        response = claude_client.messages.create(**payload)
-        print(response.content[0].text)
-        
-        return {"description": response.content[0].text}
-    
+        for item in payload["items"]:
+            if "error" not in item:
+                item["size"] = len(items[item["index"]]["jpeg"])
+        image = b"".join(item["jpeg"] for item in items if "error" not in item)
+        job_id, created = batch_queue.submit("identify_batch", payload, image, {"priority": priority})
+        job = batch_queue.get(job_id)
+        return JSONResponse(
+            {"job_id": job_id, "status": job["status"], "created": created, "mode": mode}, status_code=202
+        )
+
+    async def lines():
+        async for line in iterate_in_thread(identify_batch(items, mode, priority)):
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# Endpoint 11: Local closed-loop guidance for one frame
+@app.post("/guidance", response_class=JSONResponse)
+async def guidance_feedback(
+    target_organ: str = Form(...),
+    session_id: str = Form(...),
+    image: UploadFile = File(...),
+):
+    """
+    Warmer/colder feedback for a frame, computed locally without the LLM.
+
+    The frame is compared with the session's previous frame (probe motion)
+    and with the target organ's reference views, which are labelled through
+    /navigation_library/views or by vetting navigation answers.
+
+    Parameters:
+    - target_organ (str): The organ being navigated to
+    - session_id (str): Identifies the frame sequence
+    - image (File): The current frame
+
+    Returns:
+    - JSON with warmth, trend ("warmer", "colder", "steady"), hold_still,
+      direction, probe motion, a spoken hint and the processing latency
+    """
+    content = await read_upload_limited(image)
+    check_image_header(content)
+
+    def compute():
+        gray = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise HTTPException(status_code=400, detail="Invalid image format")
+        return guidance_sessions.tracker(session_id, target_organ.strip().lower()).update(gray)
+
+    feedback = await run_in_threadpool(compute)
+    guidance_latency.record(feedback["latency_ms"])
+    return feedback
+
+# Endpoint 10: Navigation library review
+@app.get("/navigation_library", response_class=JSONResponse)
+async def get_navigation_library(status: str = "pending", limit: int = 50):
+    """
+    List the vetted library entries and the LLM answers with the given
+    review status ("pending", "approved" or "rejected").
+    """
+    return {
+        "entries": navigation_library.entries(),
+        "candidates": navigation_library.candidates(status, min(max(limit, 1), 500)),
+    }
+
+# Endpoint 10: Approve or reject an LLM navigation answer
+@app.post("/navigation_library/vet", response_class=JSONResponse)
+async def vet_navigation(
+    candidate_id: int = Form(...),
+    view_class: str = Form(...),
+    approve: bool = Form(True),
+):
+    """
+    Review an LLM navigation answer returned by /navigate.
+
+    Parameters:
+    - candidate_id (int): The candidate_id returned by /navigate
+    - view_class (str): What the image actually showed, e.g. "liver"
+    - approve (bool): Whether the instructions are correct for that transition
+
+    Returns:
+    - JSON with the candidate's new status
+    """
+    result = navigation_library.vet(candidate_id, view_class, approve)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Unknown candidate_id")
+    return result
+
+# Endpoint 10: Label a reference view for the local view classifier
+@app.post("/navigation_library/views", response_class=JSONResponse)
+async def add_navigation_view(
+    view_class: str = Form(...),
+    image: Optional[UploadFile] = File(None),
+    image_id: Optional[str] = Form(None),
+):
+    """
+    Add an image as an exemplar of a view class, so that /navigate can
+    recognise that view without an LLM call.
+    """
+    img, _, image_id = await load_image(image, image_id)
+    navigation_library.add_view(view_class, frame_signature(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)))
+    return {"view_class": navigation_library.normalize(view_class), "image_id": image_id}
+
+# Endpoint 12: Follow-up chat about a session's scans
+@app.post("/chat", response_class=JSONResponse)
+async def chat(
+    session_id: str = Form(...),
+    message: str = Form(...),
+    image_id: Optional[str] = Form(None),
+    target_organ: Optional[str] = Form(None),
+    priority: Optional[str] = Form(None),
+):
+    """
+    Answer a follow-up question with server-side conversation state.
+
+    Diagnoses and navigation answers given to the session (with a session_id)
+    are already part of the conversation, so the client only sends the new
+    question. Older turns are summarised to keep each request within a fixed
+    token budget. Follow-ups are checked against the usage budgets first:
+    past the soft limit the image is left out (it is most of a turn's input
+    tokens), and once a budget is spent the question is refused with 429.
+
+    Parameters:
+    - session_id (str): The conversation to continue
+    - message (str): The question
+    - image_id (str): Optional ID from /images that becomes the session's current image
+    - target_organ (str): Optional organ, defaults to the session's last one
+    - priority (str): Scheduling class, defaults to "navigation"
+
+    Returns:
+    - JSON with the response, whether the image was left out for the
+      budget, the number of turns summarised so far and the context's
+      token estimate
+    """
+    message = message.strip()
+    if not message:
+        raise HTTPException(status_code=400, detail="message must not be empty")
+    track_session(session_id)
+    pressure = usage_ledger.pressure(session_id)
+    if pressure >= 1.0:
+        raise HTTPException(status_code=429, detail="The usage budget for follow-up questions is spent")
+    context = chat_sessions.context(session_id)
+    organ = target_organ or context["organ"]
+
+    if image_id:
+        image = image_store.get(image_id)
+        if image is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired image_id")
+    else:
+        # A session image that has since expired is left out rather than failing the turn
+        image_id = context["image_id"]
+        image = image_store.get(image_id) if image_id else None
+    image_omitted = image is not None and pressure >= usage_ledger.soft_limit
+    if image_omitted:
+        image = None
+
+    try:
+        response = await run_upstream(priority or "navigation", generate_chat_reply, context, message, organ, image)
+    except LinkDown:
+        raise HTTPException(status_code=503, detail="The analysis link is down", headers={"Retry-After": "30"})
+    except Overloaded as e:
+        raise overloaded(e)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in describe endpoint: {str(e)}")
+        print(f"Error in chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    chat_sessions.add_turn(session_id, "user", message, image_id=image_id, organ=organ)
+    chat_sessions.add_turn(session_id, "assistant", response)
+    return {
+        "response": response,
+        "image_id": image_id if image is not None else None,
+        "image_omitted": image_omitted,
+        "summarised_turns": context["summarised_turns"],
+        "context_tokens": context["tokens"],
+    }
+
+# Usage accounting
+@app.get("/usage", response_class=JSONResponse)
+async def usage(session_id: Optional[str] = None, organ: Optional[str] = None, recent: int = 20):
+    """
+    Token, cost and latency usage.
+
+    Parameters:
+    - session_id (str): Optional session to include totals for
+    - organ (str): Optional organ to include totals for
+    - recent (int): Number of recent requests to list
+
+    Returns:
+    - JSON with total, per-task and per-organ usage, today's cost, recent
+      requests, the budgets, the current budget pressure and the outcome and
+      cost of speculative jobs
+    """
+    return {
+        **usage_ledger.summary(session_id, organ, max(0, min(recent, 200))),
+        "speculation": speculation_stats.stats(),
+    }
+
+# Service statistics
+@app.get("/stats", response_class=JSONResponse)
+async def stats():
+    """
+    Return runtime statistics for the optimisation layers.
+    """
+    return {
+        "images": image_store.stats(),
+        "jobs": job_queue.stats(),
+        "speculation": speculation_stats.stats(),
+        "outbox": outbox.stats(),
+        "scheduler": scheduler.stats(),
+        "backend": {"name": backend.name, "offline_fallback": LLM_OFFLINE_FALLBACK, **backend_stats},
+        "routing": router.stats(),
+        "usage": usage_ledger.summary(recent=0),
+        "batch": batch_stats.stats(),
+        "navigation_library": navigation_library.stats(),
+        "local_classifier": {"loaded": organ_classifier is not None, **prefilter_stats.stats()},
+        "prompts": prompt_registry.stats(),
+        "dedup": dedup_cache.stats(),
+        "voting": voting_engine.stats(),
+        "chat": chat_sessions.stats(),
+        "live": {
+            "local_feedback": live_local_latency.summary(),
+            "llm_feedback": live_llm_latency.summary(),
+            "guidance": guidance_latency.summary(),
+        }
+    }
 
 # Root endpoint for API information
 @app.get("/", response_class=JSONResponse)
@@ -352,10 +1971,25 @@ async def root():
         "api": "Image and Text Processing API",
         "version": "1.0",
         "endpoints": [
+            {"path": "/images", "method": "POST", "description": "Register an image once and get a reusable image_id"},
             {"path": "/identify", "method": "POST", "description": "Identify entities in images"},
             {"path": "/identify_base64", "method": "POST", "description": "Identify entities in base64-encoded images"},
+            {"path": "/identify_raw", "method": "POST", "description": "Identify entities in images sent as a raw binary body"},
+            {"path": "/sweep", "method": "POST", "description": "Check several organs in one or more images with a single call"},
+            {"path": "/identify_batch", "method": "POST", "description": "Identify many (image, organ) pairs; results stream back as NDJSON"},
             {"path": "/navigate", "method": "POST", "description": "Process navigation for entities in images"},
-            {"path": "/describe", "method": "POST", "description": "Generate descriptions for images"}
+            {"path": "/describe", "method": "POST", "description": "Generate descriptions for images"},
+            {"path": "/guidance", "method": "POST", "description": "Local warmer/colder probe feedback for a frame, no LLM call"},
+            {"path": "/navigation_library", "method": "GET", "description": "Vetted navigation entries and answers awaiting review"},
+            {"path": "/navigation_library/vet", "method": "POST", "description": "Approve or reject an LLM navigation answer"},
+            {"path": "/navigation_library/views", "method": "POST", "description": "Label a reference view for local view classification"},
+            {"path": "/analyze_clip", "method": "POST", "description": "Identify, navigate or describe from the keyframes of a video clip"},
+            {"path": "/chat", "method": "POST", "description": "Follow-up questions with server-side, token-bounded conversation state"},
+            {"path": "/usage", "method": "GET", "description": "Token, cost and latency usage per request, session, organ and task"},
+            {"path": "/jobs", "method": "POST", "description": "Submit a navigate or describe job; poll, long-poll or stream /jobs/{job_id}"},
+            {"path": "/outbox/{item_id}", "method": "GET", "description": "Result of a request queued while the link was down"},
+            {"path": "/ws/guide", "method": "WEBSOCKET", "description": "Live probe guidance from a continuous frame stream"},
+            {"path": "/stats", "method": "GET", "description": "Runtime statistics"}
         ]
     }
 
@@ -0,0 +1,99 @@
+"""
+Benchmark bulk identification throughput.
+
+Registers every image in a folder through /images, then runs
+/identify_batch over them in each requested mode and reports items per
+minute, failures and time to the first result (streamed in concurrent
+mode; in batch mode all results arrive when the batch job finishes).
+
+Usage:
+    python benchmark_batch.py IMAGE_DIR --organ liver --modes concurrent batch
+
+Point --api-url at a running backend. Batch mode needs the hosted API;
+against a stand-in server use --modes concurrent.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import requests
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def register_images(api_url, image_dir):
+    image_ids = []
+    for name in sorted(os.listdir(image_dir)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(os.path.join(image_dir, name), "rb") as f:
+            response = requests.post(f"{api_url}/images", data=f.read(), headers={"Content-Type": "application/octet-stream"})
+        if response.ok:
+            image_ids.append(response.json()["image_id"])
+        else:
+            print(f"Skipping {name}: {response.text}", file=sys.stderr)
+    return image_ids
+
+
+def wait_for_job(api_url, job_id):
+    # Batch mode returns a job; its items arrive together once the batch ends
+    while True:
+        job = requests.get(f"{api_url}/jobs/{job_id}", params={"wait": 60}).json()
+        if job["status"] == "done":
+            return job["result"]["items"] + [{"summary": job["result"]["summary"]}]
+        if job["status"] in ("failed", "cancelled"):
+            sys.exit(f"Batch job {job_id} {job['status']}: {job.get('error')}")
+
+
+def run(api_url, image_ids, organ, mode):
+    started = time.perf_counter()
+    first = None
+    results = failed = 0
+    summary = None
+    data = {"organs": organ, "image_ids": ",".join(image_ids), "mode": mode}
+    with requests.post(f"{api_url}/identify_batch", data=data, stream=True) as response:
+        response.raise_for_status()
+        if response.status_code == 202:
+            lines = wait_for_job(api_url, response.json()["job_id"])
+        else:
+            lines = (json.loads(raw) for raw in response.iter_lines() if raw)
+        for line in lines:
+            if "summary" in line:
+                summary = line["summary"]
+                continue
+            if first is None:
+                first = time.perf_counter() - started
+            results += 1
+            failed += "error" in line
+
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "items": results,
+        "failed": failed,
+        "elapsed_s": round(elapsed, 1),
+        "first_result_s": round(first, 2) if first is not None else None,
+        "items_per_min": round(results / elapsed * 60, 1) if elapsed > 0 else None,
+        "server_summary": summary,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /identify_batch throughput")
+    parser.add_argument("image_dir", help="Folder of images to identify")
+    parser.add_argument("--organ", default="liver", help="Organ to look for in every image")
+    parser.add_argument("--api-url", default="http://localhost:8000", help="Backend base URL")
+    parser.add_argument("--modes", nargs="+", default=["concurrent"], choices=["batch", "concurrent"])
+    args = parser.parse_args()
+
+    image_ids = register_images(args.api_url, args.image_dir)
+    if not image_ids:
+        sys.exit(f"No images found in {args.image_dir}")
+
+    print(json.dumps([run(args.api_url, image_ids, args.organ, mode) for mode in args.modes], indent=2))
+
+
+if __name__ == "__main__":
+    main()
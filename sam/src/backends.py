@@ -0,0 +1,189 @@
+"""
+Inference backends behind the API's model calls.
+
+Every backend answers `create_message(task, organ, **kwargs)`, where the
+keyword arguments are those of the Anthropic messages API and the result
+looks like an Anthropic Message (content blocks and usage):
+
+- HostedBackend: the Anthropic API, with the client built on first use so a
+  missing or wrong key surfaces on the first call rather than at import.
+- StandInBackend: an Anthropic-compatible local server at a base URL.
+- OfflineBackend: rule-based answers computed on the CPU from the image
+  itself, used when configured or when the link is down.
+"""
+import base64
+import threading
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from src.keyframes import frame_quality
+
+BACKENDS = ("hosted", "standin", "offline")
+
+# Where to start scanning for each organ when no model is available
+ORGAN_LANDMARKS = {
+    "liver": "the right upper abdomen, just below the ribs in line with the middle of the right collarbone",
+    "kidneys": "the flank, between the lowest ribs and the hip, towards the back",
+    "pancreas": "the upper middle abdomen, just below the breastbone, with the probe held crosswise",
+    "bladder": "the lower middle abdomen, just above the pubic bone",
+    "thyroid": "the front of the neck, just below the Adam's apple, with the probe held crosswise",
+    "heart": "just below the breastbone, with the probe angled up towards the left shoulder",
+    "lungs": "the front of the chest, between the ribs below the collarbone",
+}
+
+
+class HostedBackend:
+    """
+    The Anthropic messages API.
+    """
+
+    name = "hosted"
+    supports_batches = True
+
+    def __init__(self, api_key, base_url=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from anthropic import Anthropic
+                self._client = Anthropic(api_key=self.api_key, base_url=self.base_url)
+            return self._client
+
+    def create_message(self, task=None, organ=None, **kwargs):
+        return self.client.messages.create(**kwargs)
+
+
+class StandInBackend(HostedBackend):
+    """
+    An Anthropic-compatible local server, e.g. for validation runs.
+    """
+
+    name = "standin"
+    supports_batches = False
+
+    def __init__(self, base_url, api_key=None):
+        super().__init__(api_key or "stand-in", base_url)
+
+
+def _text(text):
+    return SimpleNamespace(type="text", text=text)
+
+
+def _tool_use(name, data):
+    return SimpleNamespace(type="tool_use", id="offline", name=name, input=data)
+
+
+def _message(model, blocks):
+    return SimpleNamespace(
+        model=model, role="assistant", content=blocks, stop_reason="end_turn",
+        usage=SimpleNamespace(input_tokens=0, output_tokens=0, cache_read_input_tokens=0, cache_creation_input_tokens=0),
+    )
+
+
+def _first_image(messages):
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for block in content:
+            if block.get("type") == "image":
+                data = base64.b64decode(block["source"]["data"])
+                return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    return None
+
+
+def _quality_verdict(score):
+    if score >= 0.6:
+        return "good"
+    return "acceptable" if score >= 0.35 else "poor"
+
+
+class OfflineBackend:
+    """
+    Rule-based answers that need no network.
+
+    Image quality comes from the local frame-quality score. Identification
+    uses the local organ classifier when one is loaded and otherwise says
+    "not found" with zero confidence. Navigation and diagnosis are
+    templated from the organ's scanning landmark and the measured image
+    quality, and say plainly that they are not an AI review. Any other text
+    task (e.g. a clip) gets the diagnosis template.
+    """
+
+    name = "offline"
+    supports_batches = False
+
+    def __init__(self, classifier=None):
+        self.classifier = classifier
+
+    def _detection(self, gray, organ):
+        if gray is None or self.classifier is None or organ not in self.classifier.classes:
+            return {"found": False, "confidence": 0.0, "visibility": "absent"}
+        probs = self.classifier.predict_proba(gray)
+        probability = float(probs[self.classifier.classes.index(organ)])
+        found = self.classifier.classes[int(np.argmax(probs))] == organ
+        return {
+            "found": found,
+            "confidence": round(probability if found else 1.0 - probability, 3),
+            "visibility": "full" if found else "absent",
+        }
+
+    def create_message(self, task=None, organ=None, model="offline", messages=(), tools=None, tool_choice=None, **kwargs):
+        gray = _first_image(messages)
+        score = frame_quality(gray) if gray is not None else 0.0
+        quality = _quality_verdict(score)
+
+        if tools and tool_choice and tool_choice.get("type") == "tool":
+            name = tool_choice["name"]
+            if isinstance(organ, (list, tuple)):
+                data = {"organs": {o: self._detection(gray, o) for o in organ}, "image_quality": quality}
+            else:
+                data = {**self._detection(gray, (organ or "").lower()), "image_quality": quality}
+            return _message(model, [_tool_use(name, data)])
+
+        organ_name = (organ or "target organ").lower()
+        landmark = ORGAN_LANDMARKS.get(organ_name, "the area where it is usually found")
+        if task == "navigate":
+            text = (
+                "Offline guidance (the AI assistant is not reachable, so these are standard steps).\n\n"
+                "1. Secure yourself and the ultrasound unit so both hands are free.\n"
+                "2. Apply a generous amount of gel to the probe.\n"
+                f"3. Place the probe on {landmark}.\n"
+                "4. Tilt and slide the probe slowly, a few millimetres at a time, while watching the screen.\n"
+                f"5. Stop and hold still once the {organ_name} fills most of the image, then upload a new image.\n\n"
+                "Is the probe in position and ready?"
+            )
+        else:
+            text = (
+                "Offline assessment (the AI assistant is not reachable; this is not a diagnostic review).\n\n"
+                f"Image quality: {quality} (score {score:.2f}).\n"
+                f"The {organ_name} cannot be assessed for abnormalities without the AI review. "
+                "The scan has been kept and will be reviewed automatically when the link returns.\n\n"
+                + ("Recommendations: improve probe contact with more gel, and adjust gain before capturing another view.\n"
+                   if quality == "poor" else
+                   f"Recommendations: keep the probe on {landmark} and capture one more steady view for the full review.\n")
+                + "\nAre you ready to continue?"
+            )
+        return _message(model, [_text(text)])
+
+
+def make_backend(name, api_key=None, base_url=None, classifier=None):
+    """
+    Build the backend selected by configuration.
+    """
+    if name == "hosted":
+        return HostedBackend(api_key, base_url)
+    if name == "standin":
+        if not base_url:
+            raise ValueError("The standin backend needs ANTHROPIC_BASE_URL")
+        return StandInBackend(base_url, api_key)
+    if name == "offline":
+        return OfflineBackend(classifier)
+    raise ValueError(f"Unknown backend: {name} (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,94 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Terminal processing status of a Message Batch
+BATCH_ENDED = "ended"
+
+
+def run_concurrent(items, fn, concurrency):
+    """
+    Call fn(item) for each (key, item) pair with at most `concurrency` calls
+    in flight, yielding (key, result, error) as each one finishes. A failing
+    item yields its error instead of stopping the others. Each call runs in
+    a copy of the caller's context (e.g. its usage scope and priority).
+    """
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(contextvars.copy_context().run, fn, item): key for key, item in items}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+
+def run_message_batch(client, requests, poll_interval=5.0, timeout=None, submit=None):
+    """
+    Submit `requests` ({"custom_id", "params"} dicts) as one Message Batch,
+    wait for it to end and yield (custom_id, message, error) per request.
+
+    `submit` wraps the create call (e.g. to hold a scheduler slot). Errored,
+    cancelled and expired requests yield an error string instead of a
+    message. Raises TimeoutError if the batch has not ended after `timeout`
+    seconds; the batch is cancelled in that case.
+    """
+    create = lambda: client.messages.batches.create(requests=requests)
+    batch = submit(create) if submit is not None else create()
+
+    deadline = time.monotonic() + timeout if timeout else None
+    while batch.processing_status != BATCH_ENDED:
+        if deadline is not None and time.monotonic() > deadline:
+            client.messages.batches.cancel(batch.id)
+            raise TimeoutError(f"Batch {batch.id} did not finish within {timeout}s")
+        time.sleep(poll_interval)
+        batch = client.messages.batches.retrieve(batch.id)
+
+    for entry in client.messages.batches.results(batch.id):
+        result = entry.result
+        if result.type == "succeeded":
+            yield entry.custom_id, result.message, None
+        elif result.type == "errored":
+            yield entry.custom_id, None, str(getattr(result, "error", "errored"))
+        else:
+            yield entry.custom_id, None, result.type
+
+
+class BatchStats:
+    """
+    Throughput of recent bulk runs, in items per minute.
+    """
+
+    def __init__(self, history=50):
+        self._lock = threading.Lock()
+        self._runs = deque(maxlen=history)
+
+    def record(self, mode, items, failed, seconds):
+        run = {
+            "mode": mode,
+            "items": items,
+            "failed": failed,
+            "seconds": round(seconds, 2),
+            "items_per_min": round(items / seconds * 60, 1) if seconds > 0 else None,
+        }
+        with self._lock:
+            self._runs.append(run)
+        return run
+
+    def stats(self):
+        with self._lock:
+            runs = list(self._runs)
+        result = {"runs": len(runs)}
+        for mode in sorted({r["mode"] for r in runs}):
+            mode_runs = [r for r in runs if r["mode"] == mode]
+            items = sum(r["items"] for r in mode_runs)
+            seconds = sum(r["seconds"] for r in mode_runs)
+            result[mode] = {
+                "items": items,
+                "failed": sum(r["failed"] for r in mode_runs),
+                "items_per_min": round(items / seconds * 60, 1) if seconds > 0 else None,
+            }
+        if runs:
+            result["last"] = runs[-1]
+        return result
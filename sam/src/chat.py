@@ -0,0 +1,136 @@
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from src.prompts import estimate_tokens
+
+# Longest excerpt of a turn kept in the running summary
+SUMMARY_LINE_CHARS = 200
+
+
+def _excerpt(text):
+    """
+    First sentence of a turn, shortened for the running summary.
+    """
+    text = " ".join(text.split())
+    match = re.search(r"(?<=[.!?])\s", text)
+    first = text[:match.start()] if match else text
+    return first if len(first) <= SUMMARY_LINE_CHARS else first[:SUMMARY_LINE_CHARS - 1] + "…"
+
+
+class ChatSession:
+    def __init__(self):
+        self.turns = deque()
+        self.turn_tokens = 0
+        self.summary = deque()
+        self.summary_tokens = 0
+        self.summarised = 0
+        self.image_id = None
+        self.organ = None
+        self.updated = time.time()
+
+
+class ChatSessions:
+    """
+    Server-side follow-up conversations, one per session.
+
+    Each session keeps its recent turns within `history_tokens` and a
+    running summary of older turns within `summary_tokens`. Turns that fall
+    out of the window are folded into the summary as a one-sentence
+    excerpt, and the oldest summary lines are dropped once it is full, so a
+    request's context never exceeds the two budgets. Only the newest image
+    of a session is sent, by reference to its image_id. Sessions are
+    evicted least-recently-used beyond `max_sessions` or after `ttl` idle
+    seconds.
+    """
+
+    def __init__(self, history_tokens=1500, summary_tokens=300, max_sessions=500, ttl=3600):
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.summarised = 0
+
+    def _session(self, session_id):
+        now = time.time()
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if now - oldest.updated <= self.ttl:
+                break
+            del self._sessions[oldest_id]
+
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = ChatSession()
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        session.updated = now
+        return session
+
+    def _fold(self, session):
+        # Always keep the newest turn, even if it alone exceeds the budget
+        while len(session.turns) > 1 and session.turn_tokens > self.history_tokens:
+            role, text, tokens = session.turns.popleft()
+            session.turn_tokens -= tokens
+            line = f"{role}: {_excerpt(text)}"
+            line_tokens = estimate_tokens(line)
+            session.summary.append((line, line_tokens))
+            session.summary_tokens += line_tokens
+            session.summarised += 1
+            self.summarised += 1
+        while session.summary and session.summary_tokens > self.summary_tokens:
+            _, line_tokens = session.summary.popleft()
+            session.summary_tokens -= line_tokens
+
+    def add_turn(self, session_id, role, text, image_id=None, organ=None):
+        """
+        Append a turn ("user" or "assistant") and compact the history.
+        An image_id or organ becomes the session's current one.
+        """
+        if not session_id or not text:
+            return
+        tokens = estimate_tokens(text)
+        with self._lock:
+            session = self._session(session_id)
+            session.turns.append((role, text, tokens))
+            session.turn_tokens += tokens
+            if image_id:
+                session.image_id = image_id
+            if organ:
+                session.organ = organ.strip().lower()
+            self.turns += 1
+            self._fold(session)
+
+    def context(self, session_id):
+        """
+        Return the session's context: summary lines, recent (role, text)
+        turns, the current image_id and organ, and the context's token
+        estimate.
+        """
+        with self._lock:
+            session = self._session(session_id)
+            return {
+                "summary": [line for line, _ in session.summary],
+                "turns": [(role, text) for role, text, _ in session.turns],
+                "image_id": session.image_id,
+                "organ": session.organ,
+                "tokens": session.turn_tokens + session.summary_tokens,
+                "summarised_turns": session.summarised,
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "turns": self.turns,
+                "summarised_turns": self.summarised,
+                "history_tokens": self.history_tokens,
+                "summary_tokens": self.summary_tokens,
+            }
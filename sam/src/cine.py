@@ -0,0 +1,244 @@
+import os
+import json
+import shutil
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+
+from sam2.build_sam import build_sam2, build_sam2_video_predictor
+from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
+
+# Same checkpoint and config as the still-image pipeline in model.py
+CHECKPOINT = os.getenv("SAM2_CHECKPOINT", "finetuned_models/sam2_hiera_small.pt")
+MODEL_CFG = os.getenv("SAM2_MODEL_CFG", "../sam2/configs/sam2/sam2_hiera_s.yaml")
+
+# Number of frames handed to the video predictor at once. Memory use is bounded
+# by this window rather than by the length of the cine loop.
+DEFAULT_CHUNK_SIZE = int(os.getenv("CINE_CHUNK_SIZE", "32"))
+
+_video_predictor = None
+_mask_generator = None
+
+
+def _device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _autocast():
+    """
+    bfloat16 autocast on GPU, a no-op context on CPU.
+    """
+    if torch.cuda.is_available():
+        return torch.autocast("cuda", dtype=torch.bfloat16)
+    return torch.autocast("cpu", enabled=False)
+
+
+def get_video_predictor():
+    """
+    Lazily build the SAM2 video predictor so importing this module is cheap.
+    """
+    global _video_predictor
+    if _video_predictor is None:
+        _video_predictor = build_sam2_video_predictor(MODEL_CFG, CHECKPOINT, device=_device())
+    return _video_predictor
+
+
+def get_mask_generator():
+    """
+    Lazily build the automatic mask generator used to segment the keyframe
+    when no point or box prompt is given.
+    """
+    global _mask_generator
+    if _mask_generator is None:
+        _mask_generator = SAM2AutomaticMaskGenerator(build_sam2(MODEL_CFG, CHECKPOINT, device=_device()))
+    return _mask_generator
+
+
+def segment_keyframe(frame_rgb):
+    """
+    Segment a single RGB frame once and return the organ mask.
+    The largest automatically generated mask is taken as the organ.
+    """
+    with torch.inference_mode(), _autocast():
+        masks = get_mask_generator().generate(frame_rgb)
+
+    if not masks:
+        return np.zeros(frame_rgb.shape[:2], dtype=bool)
+
+    best = max(masks, key=lambda m: m["area"])
+    return best["segmentation"].astype(bool)
+
+
+def iter_frames(video_path):
+    """
+    Yield RGB frames one at a time so the clip is never fully held in memory.
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video: {video_path}")
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        capture.release()
+
+
+def _write_chunk(frames, directory):
+    """
+    Write a chunk of frames as numbered JPEGs, the layout SAM2's init_state expects.
+    """
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    for i, frame in enumerate(frames):
+        Image.fromarray(frame).save(os.path.join(directory, f"{i:05d}.jpg"), quality=95)
+
+
+def _propagate_chunk(predictor, frames, seed_mask, directory, point=None, box=None):
+    """
+    Propagate the organ mask through one chunk of frames.
+
+    The chunk is seeded on its first frame, either with the mask carried over
+    from the previous chunk or with the keyframe prompt. Returns the masks for
+    every frame in the chunk in order.
+    """
+    _write_chunk(frames, directory)
+
+    with torch.inference_mode(), _autocast():
+        state = predictor.init_state(
+            video_path=directory,
+            offload_video_to_cpu=True,
+            offload_state_to_cpu=True,
+        )
+
+        if seed_mask is not None:
+            predictor.add_new_mask(state, frame_idx=0, obj_id=1, mask=seed_mask)
+        else:
+            points = np.array([point], dtype=np.float32) if point is not None else None
+            labels = np.array([1], dtype=np.int32) if point is not None else None
+            box_arr = np.array(box, dtype=np.float32) if box is not None else None
+            predictor.add_new_points_or_box(
+                state, frame_idx=0, obj_id=1, points=points, labels=labels, box=box_arr
+            )
+
+        masks = [None] * len(frames)
+        for frame_idx, _, mask_logits in predictor.propagate_in_video(state):
+            masks[frame_idx] = (mask_logits[0] > 0.0).squeeze(0).cpu().numpy()
+
+        predictor.reset_state(state)
+
+    empty = np.zeros(frames[0].shape[:2], dtype=bool)
+    return [m if m is not None else empty for m in masks]
+
+
+def segment_cine(video_path, keyframe=0, point=None, box=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Segment a cine loop by segmenting one keyframe and propagating the mask.
+
+    Frames are streamed from disk and handed to the video predictor in chunks
+    of `chunk_size`. Each chunk overlaps the previous one by a single frame so
+    the last mask of one chunk seeds the next. Propagation runs forward from
+    the keyframe; frames before it are skipped.
+
+    Parameters:
+    - video_path (str): Path to an MP4/AVI clip
+    - keyframe (int): Index of the frame to segment first
+    - point (tuple): Optional (x, y) positive click on the organ in the keyframe
+    - box (tuple): Optional (x0, y0, x1, y1) box around the organ in the keyframe
+    - chunk_size (int): Frames per propagation window
+
+    Yields:
+    - dict per frame with the frame index, mask area in pixels and area fraction
+    """
+    if chunk_size < 2:
+        raise ValueError("chunk_size must be at least 2")
+
+    predictor = get_video_predictor()
+    workdir = tempfile.mkdtemp(prefix="cine_")
+
+    try:
+        chunk = []
+        chunk_start = keyframe
+        seed_mask = None
+
+        for idx, frame in enumerate(iter_frames(video_path)):
+            if idx < keyframe:
+                continue
+
+            if idx == keyframe and point is None and box is None:
+                # No prompt given: segment the keyframe once with the automatic generator
+                seed_mask = segment_keyframe(frame)
+
+            chunk.append(frame)
+            if len(chunk) < chunk_size:
+                continue
+
+            masks = _propagate_chunk(predictor, chunk, seed_mask, workdir, point, box)
+            # The first frame of every chunk after the first was already reported
+            skip = 0 if chunk_start == keyframe else 1
+            for offset, mask in enumerate(masks[skip:], start=skip):
+                yield _frame_stats(chunk_start + offset, mask)
+
+            # Carry the last frame and its mask into the next chunk
+            seed_mask = masks[-1]
+            chunk_start += len(chunk) - 1
+            chunk = [chunk[-1]]
+
+        if len(chunk) > 1 or (chunk and chunk_start == keyframe):
+            masks = _propagate_chunk(predictor, chunk, seed_mask, workdir, point, box)
+            skip = 0 if chunk_start == keyframe else 1
+            for offset, mask in enumerate(masks[skip:], start=skip):
+                yield _frame_stats(chunk_start + offset, mask)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _frame_stats(frame_idx, mask):
+    area = int(mask.sum())
+    return {
+        "frame": frame_idx,
+        "area_px": area,
+        "area_fraction": area / mask.size,
+    }
+
+
+def summarize_motion(frames):
+    """
+    Summarise per-frame organ areas into a simple motion profile.
+    The relative area change is a cheap proxy for heart or lung motion.
+    """
+    areas = np.array([f["area_px"] for f in frames], dtype=np.float64)
+    if areas.size == 0:
+        return {"frames": 0}
+
+    mean_area = float(areas.mean())
+    return {
+        "frames": int(areas.size),
+        "min_area_px": int(areas.min()),
+        "max_area_px": int(areas.max()),
+        "mean_area_px": mean_area,
+        "relative_change": float((areas.max() - areas.min()) / mean_area) if mean_area else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Propagate an organ mask across a cine loop with SAM2")
+    parser.add_argument("video", help="Path to the cine loop (MP4/AVI)")
+    parser.add_argument("--keyframe", type=int, default=0, help="Frame index to segment first")
+    parser.add_argument("--point", type=float, nargs=2, metavar=("X", "Y"), help="Positive click on the organ")
+    parser.add_argument("--box", type=float, nargs=4, metavar=("X0", "Y0", "X1", "Y1"), help="Box around the organ")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Frames per propagation window")
+    args = parser.parse_args()
+
+    results = []
+    for stats in segment_cine(args.video, args.keyframe, args.point, args.box, args.chunk_size):
+        print(json.dumps(stats))
+        results.append(stats)
+
+    print(json.dumps({"summary": summarize_motion(results)}))
@@ -0,0 +1,149 @@
+"""
+Local organ classifier used as a pre-filter in front of the vision LLM.
+
+Frames are embedded with cheap handcrafted features (a coarse intensity
+layout, the intensity histogram and per-cell gradient orientation
+histograms) and classified by a softmax head trained with numpy. An
+embedding plus prediction takes around a millisecond on CPU.
+"""
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+LAYOUT_SIZE = 16
+HISTOGRAM_BINS = 32
+GRADIENT_CELLS = 4
+GRADIENT_BINS = 8
+EMBED_SIZE = 128
+
+
+def embed(gray):
+    """
+    Return the feature vector of a grayscale frame.
+    """
+    small = cv2.resize(gray, (EMBED_SIZE, EMBED_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    layout = cv2.resize(small, (LAYOUT_SIZE, LAYOUT_SIZE), interpolation=cv2.INTER_AREA).ravel()
+    layout = (layout - layout.mean()) / (layout.std() + 1e-6)
+
+    histogram, _ = np.histogram(small, bins=HISTOGRAM_BINS, range=(0, 256))
+    histogram = histogram.astype(np.float32) / small.size
+
+    gx = cv2.Sobel(small, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(small, cv2.CV_32F, 0, 1, ksize=3)
+    magnitude, angle = cv2.cartToPolar(gx, gy)
+    # Orientation without sign, so edges count the same in both directions
+    bins = (np.mod(angle, np.pi) / np.pi * GRADIENT_BINS).astype(np.int32) % GRADIENT_BINS
+    cell = EMBED_SIZE // GRADIENT_CELLS
+    gradients = []
+    for i in range(GRADIENT_CELLS):
+        for j in range(GRADIENT_CELLS):
+            window = (slice(i * cell, (i + 1) * cell), slice(j * cell, (j + 1) * cell))
+            gradients.append(np.bincount(bins[window].ravel(), magnitude[window].ravel(), GRADIENT_BINS))
+    gradients = np.concatenate(gradients).astype(np.float32)
+    gradients /= np.linalg.norm(gradients) + 1e-6
+
+    return np.concatenate([layout, histogram, gradients])
+
+
+class OrganClassifier:
+    """
+    Softmax regression over frame embeddings.
+    """
+
+    def __init__(self, classes, weights, bias, mean, std):
+        self.classes = list(classes)
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.std = std
+
+    @classmethod
+    def fit(cls, features, labels, classes, epochs=300, lr=0.5, l2=1e-3):
+        """
+        Train on an (n, d) feature matrix and integer labels with full-batch
+        gradient descent.
+        """
+        mean = features.mean(axis=0)
+        std = features.std(axis=0) + 1e-6
+        x = (features - mean) / std
+        n, d = x.shape
+        k = len(classes)
+        onehot = np.eye(k, dtype=np.float32)[labels]
+
+        weights = np.zeros((d, k), dtype=np.float32)
+        bias = np.zeros(k, dtype=np.float32)
+        for _ in range(epochs):
+            probs = _softmax(x @ weights + bias)
+            error = (probs - onehot) / n
+            weights -= lr * (x.T @ error + l2 * weights)
+            bias -= lr * error.sum(axis=0)
+        return cls(classes, weights, bias, mean, std)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path, allow_pickle=False)
+        return cls([str(c) for c in data["classes"]], data["weights"], data["bias"], data["mean"], data["std"])
+
+    def save(self, path):
+        np.savez(path, classes=np.array(self.classes), weights=self.weights, bias=self.bias, mean=self.mean, std=self.std)
+
+    def predict_features(self, features):
+        return _softmax(((features - self.mean) / self.std) @ self.weights + self.bias)
+
+    def predict_proba(self, gray):
+        """
+        Return the class probabilities of one grayscale frame.
+        """
+        return self.predict_features(embed(gray)[None, :])[0]
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class PrefilterStats:
+    """
+    How often the local classifier answered on its own, how fast, and how
+    often it agreed with the LLM on the audited share of confident frames.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.local = 0
+        self.forwarded = 0
+        self.audited = 0
+        self.agreed = 0
+        self._latencies = deque(maxlen=1000)
+
+    def record(self, started, answered):
+        with self._lock:
+            self._latencies.append((time.perf_counter() - started) * 1000.0)
+            if answered:
+                self.local += 1
+            else:
+                self.forwarded += 1
+
+    def audit(self, agreed):
+        with self._lock:
+            self.audited += 1
+            self.agreed += agreed
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies, dtype=np.float64)
+            total = self.local + self.forwarded
+            return {
+                "local_answers": self.local,
+                "forwarded": self.forwarded,
+                "calls_avoided": round(self.local / total, 3) if total else None,
+                "audited": self.audited,
+                "llm_agreement": round(self.agreed / self.audited, 3) if self.audited else None,
+                "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2) if latencies.size else None,
+                "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2) if latencies.size else None,
+            }
@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from src.keyframes import SIGNATURE_SIZE, frame_signature
+
+# Frames are compared at this size for motion estimation
+MOTION_SIZE = 128
+
+_window = None
+
+
+def _hanning():
+    global _window
+    if _window is None:
+        _window = cv2.createHanningWindow((MOTION_SIZE, MOTION_SIZE), cv2.CV_32F)
+    return _window
+
+
+def direction(dx, dy, minimum):
+    """
+    Name the dominant axis of a shift given in image coordinates (y down),
+    or None when it is smaller than `minimum`.
+    """
+    if max(abs(dx), abs(dy)) < minimum:
+        return None
+    if abs(dx) >= abs(dy):
+        return "right" if dx > 0 else "left"
+    return "down" if dy > 0 else "up"
+
+
+OPPOSITE = {"right": "left", "left": "right", "up": "down", "down": "up"}
+
+
+class GuidanceTracker:
+    """
+    Closed-loop probe feedback for one target organ, computed locally per
+    frame.
+
+    Frame-to-frame motion comes from phase correlation of downsampled
+    frames. Closeness to the target ("warmth") is the best cosine
+    similarity between the frame signature and the target's reference view
+    signatures, smoothed over frames; its trend gives warmer/colder. When a
+    reference is reasonably close, phase correlation against it gives the
+    direction to move the view. Directions are in screen terms (the view
+    moves right = image content moves left), assuming the probe marker is
+    aligned with the right of the screen. Everything runs on small arrays,
+    so a frame takes a few milliseconds on CPU.
+    """
+
+    def __init__(self, target, references, hold_similarity=0.85, align_similarity=0.5,
+                 trend_epsilon=0.01, still_fraction=0.01, smoothing=0.5):
+        self.target = target
+        self.references = references
+        self.hold_similarity = hold_similarity
+        self.align_similarity = align_similarity
+        self.trend_epsilon = trend_epsilon
+        self.still_fraction = still_fraction
+        self.smoothing = smoothing
+
+        self._previous = None
+        self._warmth = None
+
+    def _motion(self, small):
+        """
+        Return (dx, dy) of the view since the previous frame, as fractions of
+        the frame size.
+        """
+        if self._previous is None:
+            return 0.0, 0.0
+        (shift_x, shift_y), _ = cv2.phaseCorrelate(self._previous, small, _hanning())
+        # Content shifting left means the view moved right
+        return -shift_x / MOTION_SIZE, -shift_y / MOTION_SIZE
+
+    def _alignment(self, reference, signature):
+        """
+        Return (dx, dy) the view should move, as fractions of the frame
+        size, to line up with a reference signature.
+        """
+        grid = (SIGNATURE_SIZE, SIGNATURE_SIZE)
+        (shift_x, shift_y), _ = cv2.phaseCorrelate(
+            reference.reshape(grid).astype(np.float32), signature.reshape(grid).astype(np.float32)
+        )
+        return shift_x / SIGNATURE_SIZE, shift_y / SIGNATURE_SIZE
+
+    def update(self, gray):
+        """
+        Process a grayscale frame and return the feedback for it.
+        """
+        started = time.perf_counter()
+        small = cv2.resize(gray, (MOTION_SIZE, MOTION_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+        signature = frame_signature(gray)
+
+        move_x, move_y = self._motion(small)
+        self._previous = small
+        motion = direction(move_x, move_y, self.still_fraction)
+
+        feedback = {
+            "target": self.target,
+            "motion": {"dx": round(move_x, 4), "dy": round(move_y, 4), "moving": motion is not None},
+            "warmth": None,
+            "trend": None,
+            "hold_still": False,
+            "direction": None,
+        }
+
+        references = self.references(self.target)
+        if references is None or len(references) == 0:
+            feedback["hint"] = f"No reference view for the {self.target} yet: follow the navigation instructions"
+            feedback["latency_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+            return feedback
+
+        similarities = references @ signature
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+
+        previous = self._warmth
+        self._warmth = similarity if previous is None else self.smoothing * previous + (1 - self.smoothing) * similarity
+        feedback["warmth"] = round(self._warmth, 3)
+        if previous is not None:
+            delta = self._warmth - previous
+            feedback["trend"] = "warmer" if delta > self.trend_epsilon else "colder" if delta < -self.trend_epsilon else "steady"
+
+        if similarity >= self.align_similarity:
+            align_x, align_y = self._alignment(references[best], signature)
+            feedback["direction"] = direction(align_x, align_y, 1.0 / SIGNATURE_SIZE)
+
+        if similarity >= self.hold_similarity:
+            feedback["hold_still"] = True
+            feedback["hint"] = f"Hold still: this matches the {self.target} reference view"
+        elif feedback["trend"] == "warmer":
+            way = motion or feedback["direction"]
+            feedback["hint"] = f"Warmer: keep moving {way}" if way else "Warmer: keep going"
+        elif feedback["trend"] == "colder":
+            way = OPPOSITE.get(motion) or feedback["direction"]
+            feedback["hint"] = f"Colder: move back {way}" if way else "Colder: go back"
+        elif feedback["direction"]:
+            feedback["hint"] = f"Move the probe slightly {feedback['direction']}"
+        else:
+            feedback["hint"] = "Sweep slowly to find the target"
+
+        feedback["latency_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+        return feedback
+
+
+class GuidanceSessions:
+    """
+    One GuidanceTracker per session for the stateless HTTP endpoint, keeping
+    the most recently used `max_sessions`. Changing the target restarts it.
+    """
+
+    def __init__(self, references, max_sessions=256):
+        self.references = references
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._trackers = OrderedDict()
+
+    def tracker(self, session_id, target):
+        with self._lock:
+            tracker = self._trackers.get(session_id)
+            if tracker is None or tracker.target != target:
+                tracker = GuidanceTracker(target, self.references)
+                self._trackers[session_id] = tracker
+            self._trackers.move_to_end(session_id)
+            while len(self._trackers) > self.max_sessions:
+                self._trackers.popitem(last=False)
+            return tracker
@@ -0,0 +1,160 @@
+"""
+Schema-constrained identification.
+
+The model answers through a forced tool call, so every reply is a JSON
+object with the fields below instead of free text to be pattern-matched.
+"""
+
+IDENTIFY_TOOL_NAME = "report_identification"
+
+VISIBILITY = ("full", "partial", "absent")
+IMAGE_QUALITY = ("good", "acceptable", "poor")
+
+BBOX_SCHEMA = {
+    "type": "object",
+    "description": "Approximate location of the organ as fractions (0-1) of image width and height, "
+                   "origin at the top left. Omit when the organ is absent.",
+    "properties": {
+        "x": {"type": "number", "minimum": 0, "maximum": 1},
+        "y": {"type": "number", "minimum": 0, "maximum": 1},
+        "width": {"type": "number", "minimum": 0, "maximum": 1},
+        "height": {"type": "number", "minimum": 0, "maximum": 1},
+    },
+    "required": ["x", "y", "width", "height"],
+}
+
+DETECTION_PROPERTIES = {
+    "found": {"type": "boolean", "description": "Whether the organ is visible in the image"},
+    "confidence": {"type": "number", "minimum": 0, "maximum": 1, "description": "Confidence in `found`"},
+    "visibility": {"type": "string", "enum": list(VISIBILITY), "description": "How much of the organ is in view"},
+    "bbox": BBOX_SCHEMA,
+}
+
+IDENTIFY_TOOL = {
+    "name": IDENTIFY_TOOL_NAME,
+    "description": "Report whether the requested organ is visible in the ultrasound image.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            **DETECTION_PROPERTIES,
+            "image_quality": {
+                "type": "string",
+                "enum": list(IMAGE_QUALITY),
+                "description": "Whether the image is good enough for a diagnostic assessment",
+            },
+        },
+        "required": ["found", "confidence", "visibility", "image_quality"],
+    },
+}
+
+# Returned when the model could not be asked or gave no usable answer
+UNKNOWN_IDENTIFICATION = {"found": False, "confidence": 0.0, "visibility": None, "bbox": None, "image_quality": None}
+
+
+def _clamp(value):
+    try:
+        return min(max(float(value), 0.0), 1.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def parse_bbox(bbox):
+    """
+    Validate a bounding box, clipping it to the image. Returns None if unusable.
+    """
+    if not isinstance(bbox, dict) or not all(k in bbox for k in ("x", "y", "width", "height")):
+        return None
+    x, y = _clamp(bbox["x"]), _clamp(bbox["y"])
+    width, height = min(_clamp(bbox["width"]), 1.0 - x), min(_clamp(bbox["height"]), 1.0 - y)
+    if width <= 0 or height <= 0:
+        return None
+    return {"x": round(x, 3), "y": round(y, 3), "width": round(width, 3), "height": round(height, 3)}
+
+
+def parse_detection(data):
+    """
+    Normalise one organ's tool input to found, confidence, visibility and bbox.
+    """
+    found = data.get("found") is True
+    visibility = data.get("visibility")
+    if visibility not in VISIBILITY:
+        visibility = "full" if found else "absent"
+    if visibility == "absent":
+        found = False
+    return {
+        "found": found,
+        "confidence": _clamp(data.get("confidence", 0.0)),
+        "visibility": visibility,
+        "bbox": parse_bbox(data.get("bbox")) if found else None,
+    }
+
+
+def tool_input(response, name):
+    """
+    Return the input of the named tool_use block in a response, or None.
+    """
+    for block in getattr(response, "content", []):
+        if getattr(block, "type", None) == "tool_use" and block.name == name:
+            return block.input
+    return None
+
+
+def parse_identification(response):
+    """
+    Turn a forced report_identification call into a result dict. A reply
+    without the tool call is UNKNOWN_IDENTIFICATION, so that it gets escalated.
+    """
+    data = tool_input(response, IDENTIFY_TOOL_NAME)
+    if not isinstance(data, dict):
+        return dict(UNKNOWN_IDENTIFICATION)
+    result = parse_detection(data)
+    quality = data.get("image_quality")
+    result["image_quality"] = quality if quality in IMAGE_QUALITY else None
+    return result
+
+
+SWEEP_TOOL_NAME = "report_sweep"
+
+
+def sweep_tool(organs):
+    """
+    Tool whose input has one detection object per requested organ, so a
+    single call reports on all of them.
+    """
+    return {
+        "name": SWEEP_TOOL_NAME,
+        "description": "Report, for every listed organ, whether it is visible in the ultrasound image(s).",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "organs": {
+                    "type": "object",
+                    "properties": {
+                        organ: {"type": "object", "properties": DETECTION_PROPERTIES, "required": ["found", "confidence", "visibility"]}
+                        for organ in organs
+                    },
+                    "required": list(organs),
+                },
+                "image_quality": {"type": "string", "enum": list(IMAGE_QUALITY)},
+            },
+            "required": ["organs", "image_quality"],
+        },
+    }
+
+
+def parse_sweep(response, organs):
+    """
+    Turn a forced report_sweep call into {"organs": {organ: detection}, "image_quality": ...}.
+    Organs missing from the reply are reported as not found with zero confidence.
+    """
+    data = tool_input(response, SWEEP_TOOL_NAME)
+    if not isinstance(data, dict):
+        data = {}
+    reported = data.get("organs") if isinstance(data.get("organs"), dict) else {}
+    missing = {k: UNKNOWN_IDENTIFICATION[k] for k in ("found", "confidence", "visibility", "bbox")}
+    detections = {
+        organ: parse_detection(reported[organ]) if isinstance(reported.get(organ), dict) else dict(missing)
+        for organ in organs
+    }
+    quality = data.get("image_quality")
+    return {"organs": detections, "image_quality": quality if quality in IMAGE_QUALITY else None}
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class ImageStore:
+    """
+    Content-addressed store for normalised (JPEG) images.
+
+    Images are kept in memory up to `max_memory_bytes`; beyond that the least
+    recently used images are spilled to `spill_dir` and read back on demand.
+    Images not accessed for `ttl` seconds expire from both tiers. The ID is
+    derived from the image bytes, so uploading the same image twice yields
+    the same ID and is stored once.
+    """
+
+    def __init__(self, max_memory_bytes, spill_dir, ttl):
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.ttl = ttl
+        os.makedirs(spill_dir, exist_ok=True)
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.spills = 0
+
+    @staticmethod
+    def image_id(data):
+        return hashlib.sha256(data).hexdigest()[:32]
+
+    def _path(self, image_id):
+        return os.path.join(self.spill_dir, f"{image_id}.jpg")
+
+    def put(self, data):
+        """
+        Store JPEG bytes and return their ID.
+        """
+        image_id = self.image_id(data)
+        with self._lock:
+            if image_id in self._memory:
+                self._memory.move_to_end(image_id)
+                self._memory[image_id]["accessed"] = time.time()
+            else:
+                self._memory[image_id] = {"data": data, "accessed": time.time()}
+                self._memory_bytes += len(data)
+                self._spill_over_budget()
+            self._maybe_sweep()
+        return image_id
+
+    def get(self, image_id):
+        """
+        Return the stored bytes, or None if the ID is unknown or expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(image_id)
+            if entry is not None:
+                if now - entry["accessed"] > self.ttl:
+                    self._drop(image_id)
+                    self.misses += 1
+                    return None
+                entry["accessed"] = now
+                self._memory.move_to_end(image_id)
+                self.hits += 1
+                return entry["data"]
+
+        # Not in memory: try the spill directory
+        if not all(c in "0123456789abcdef" for c in image_id):
+            return None
+        path = self._path(image_id)
+        try:
+            if now - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "rb") as f:
+                data = f.read()
+            os.remove(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Promote back to memory; it is written out again if spilled later
+        with self._lock:
+            self.hits += 1
+            if image_id not in self._memory:
+                self._memory[image_id] = {"data": data, "accessed": now}
+                self._memory_bytes += len(data)
+                self._spill_over_budget()
+        return data
+
+    def _drop(self, image_id):
+        entry = self._memory.pop(image_id)
+        self._memory_bytes -= len(entry["data"])
+
+    def _spill_over_budget(self):
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            image_id, entry = self._memory.popitem(last=False)
+            self._memory_bytes -= len(entry["data"])
+            path = self._path(image_id)
+            with open(path, "wb") as f:
+                f.write(entry["data"])
+            os.utime(path, (entry["accessed"], entry["accessed"]))
+            self.spills += 1
+
+    def _maybe_sweep(self):
+        # Expire at most once a minute, piggybacking on writes
+        if time.monotonic() - self._last_sweep < 60:
+            return
+        self._last_sweep = time.monotonic()
+        now = time.time()
+        for image_id in [i for i, e in self._memory.items() if now - e["accessed"] > self.ttl]:
+            self._drop(image_id)
+        for name in os.listdir(self.spill_dir):
+            path = os.path.join(self.spill_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_images": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "spills": self.spills,
+            }
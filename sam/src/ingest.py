@@ -0,0 +1,96 @@
+"""
+Bounded image ingestion.
+
+Raw request bodies are read incrementally and rejected with 413 as soon as
+they exceed MAX_IMAGE_BYTES (or immediately, when Content-Length already says
+so). Multipart bodies are parsed before the endpoint runs, so the app bounds
+them by their Content-Length first; each file is then read with the same
+per-image limit. Image dimensions are read from the file header before any
+pixels are decoded, so a small but huge-resolution image is rejected without
+allocating its bitmap.
+
+Peak memory per image request is therefore bounded by roughly
+MAX_IMAGE_BYTES (encoded body) + 3 * MAX_IMAGE_PIXELS (decoded BGR bitmap)
++ the normalised JPEG copy, about 10 MB + 48 MB + ~2 MB with the defaults.
+"""
+import io
+import os
+
+from fastapi import HTTPException
+from PIL import Image
+
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(4096 * 4096)))
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def _too_large(limit):
+    return HTTPException(status_code=413, detail=f"Image exceeds the {limit} byte limit")
+
+
+def check_content_length(headers, limit=MAX_IMAGE_BYTES):
+    """
+    Reject a request up front when its declared length is over the limit.
+    """
+    declared = headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise _too_large(limit)
+
+
+async def read_body_limited(request, limit=MAX_IMAGE_BYTES):
+    """
+    Read a raw (application/octet-stream) request body in chunks, stopping
+    as soon as it grows past `limit`.
+    """
+    check_content_length(request.headers, limit)
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > limit:
+            raise _too_large(limit)
+    return bytes(body)
+
+
+async def read_upload_limited(upload, limit=MAX_IMAGE_BYTES):
+    """
+    Read one file of an already parsed multipart form, stopping as soon as
+    it grows past `limit`. The spooled size is checked first when known.
+    The form body as a whole must be bounded before parsing (see
+    check_content_length).
+    """
+    if getattr(upload, "size", None) is not None and upload.size > limit:
+        raise _too_large(limit)
+    body = bytearray()
+    while True:
+        chunk = await upload.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        body.extend(chunk)
+        if len(body) > limit:
+            raise _too_large(limit)
+    return bytes(body)
+
+
+def check_image_header(data, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Read the image dimensions from the header without decoding pixels and
+    reject images whose decoded bitmap would be too large.
+
+    Returns (width, height).
+    """
+    try:
+        # Image.open only parses the header; pixel data is decoded lazily
+        with Image.open(io.BytesIO(data)) as probe:
+            width, height = probe.size
+    except Image.DecompressionBombError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid image format")
+
+    if width * height > max_pixels:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image is {width}x{height}; the limit is {max_pixels} pixels"
+        )
+    return width, height
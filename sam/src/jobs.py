@@ -0,0 +1,194 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobQueue:
+    """
+    Persistent job queue backed by SQLite and drained by a worker pool.
+
+    Jobs are keyed by a hash of their kind, payload and image, so submitting
+    the same work twice returns the existing job instead of recomputing it,
+    and a client that reconnects can always fetch a finished result. Jobs
+    left running by a previous process are re-queued on start. Several
+    queues can share one database (e.g. to give long jobs their own
+    workers); each only runs the kinds it has handlers for. `on_finish`,
+    if given, is called with (job_id, kind, status, result) after each job.
+    """
+
+    def __init__(self, path, handlers, workers=2, retention=86400, on_finish=None):
+        self.handlers = handlers
+        self.on_finish = on_finish
+        self.workers = workers
+        self.retention = retention
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                image BLOB,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+        self._db.commit()
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads = []
+        self._stopping = False
+
+    @staticmethod
+    def job_id(kind, payload, image=None):
+        digest = hashlib.sha256()
+        digest.update(kind.encode())
+        digest.update(json.dumps(payload, sort_keys=True).encode())
+        if image is not None:
+            digest.update(image)
+        return digest.hexdigest()[:24]
+
+    def start(self):
+        with self._lock:
+            # Work interrupted by a restart is picked up again
+            self._db.execute("UPDATE jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING))
+            self._db.commit()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+
+    def submit(self, kind, payload, image=None, context=None):
+        """
+        Queue a job and return (job_id, created). Finished jobs are returned
+        as they are; failed or cancelled ones are queued again. `context`
+        (e.g. priority or session) is passed to the handler with the payload
+        but is not part of the job key.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = self.job_id(kind, payload, image)
+        payload = {**payload, **(context or {})}
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is not None and row[0] not in (FAILED, CANCELLED):
+                return job_id, False
+
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, kind, payload, image, status, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), image, QUEUED, now, now),
+            )
+            self._db.commit()
+            self._wakeup.notify()
+        return job_id, True
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, status, result, error, created, updated FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = {"job_id": row[0], "kind": row[1], "status": row[2], "created": row[5], "updated": row[6]}
+        if row[3] is not None:
+            job["result"] = json.loads(row[3])
+        if row[4] is not None:
+            job["error"] = row[4]
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancel a job that has not started yet. Returns True if it was cancelled.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, updated = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+            self._db.commit()
+            return cursor.rowcount > 0
+
+    def _claim(self):
+        kinds = list(self.handlers)
+        row = self._db.execute(
+            f"SELECT id, kind, payload, image FROM jobs WHERE status = ? AND kind IN ({', '.join('?' * len(kinds))}) "
+            "ORDER BY created LIMIT 1",
+            (QUEUED, *kinds),
+        ).fetchone()
+        if row is None:
+            return None
+        self._db.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ?", (RUNNING, time.time(), row[0]))
+        self._db.commit()
+        return row
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+            # Finished jobs no longer need their image
+            self._db.execute("UPDATE jobs SET image = NULL WHERE id = ?", (job_id,))
+            self._db.execute(
+                "DELETE FROM jobs WHERE updated < ? AND status IN (?, ?, ?)",
+                (time.time() - self.retention, *FINISHED),
+            )
+            self._db.commit()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                job = self._claim()
+                while job is None and not self._stopping:
+                    self._wakeup.wait(timeout=1.0)
+                    job = self._claim()
+                if self._stopping:
+                    return
+
+            job_id, kind, payload, image = job
+            try:
+                result, status = self.handlers[kind](json.loads(payload), image), DONE
+                self._finish(job_id, DONE, result=result)
+            except Exception as e:
+                print(f"Job {job_id} ({kind}) failed: {str(e)}")
+                result, status = None, FAILED
+                self._finish(job_id, FAILED, error=str(e))
+            if self.on_finish is not None:
+                try:
+                    self.on_finish(job_id, kind, status, result)
+                except Exception as e:
+                    print(f"Job {job_id} finish hook failed: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+        counts.update(dict(rows))
+        counts["workers"] = self.workers
+        return counts
@@ -0,0 +1,139 @@
+import cv2
+import numpy as np
+
+# Frames whose signatures are more similar than this are treated as the same view
+DUPLICATE_SIMILARITY = 0.95
+
+# Size of the downsampled grayscale signature used for novelty scoring
+SIGNATURE_SIZE = 32
+
+
+def frame_quality(gray):
+    """
+    Score a grayscale frame for image quality in the range [0, 1].
+
+    Combines sharpness (variance of the Laplacian), contrast (intensity
+    standard deviation) and exposure (distance of the mean from mid-grey).
+    Blurred, washed-out and near-black frames score low.
+    """
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+    sharp = 1.0 - np.exp(-sharpness / 200.0)
+    contrast = min(float(gray.std()) / 64.0, 1.0)
+    exposure = max(0.0, 1.0 - abs(float(gray.mean()) - 110.0) / 110.0)
+    return float(0.5 * sharp + 0.3 * contrast + 0.2 * exposure)
+
+
+def frame_signature(gray):
+    """
+    Return a small zero-mean, unit-norm vector describing the frame layout.
+    The dot product of two signatures is their cosine similarity.
+    """
+    small = cv2.resize(gray, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA)
+    vec = small.astype(np.float32).ravel()
+    vec -= vec.mean()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+
+class KeyframeSelector:
+    """
+    Online top-k keyframe selection over a stream of frames.
+
+    Only the current k keyframes are kept in memory. Each frame is scored as
+    quality weighted by novelty, where novelty is how different the frame is
+    from the keyframes already selected. A near-duplicate of a selected frame
+    only replaces it when its quality is higher.
+    """
+
+    def __init__(self, top_k=4):
+        self.top_k = top_k
+        self.selected = []
+
+    def _novelty(self, signature, exclude=None):
+        sims = [float(np.dot(signature, k["signature"])) for k in self.selected if k is not exclude]
+        return 1.0 - max(sims) if sims else 1.0
+
+    def offer(self, index, frame):
+        """
+        Consider a BGR frame for selection.
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        quality = frame_quality(gray)
+        signature = frame_signature(gray)
+
+        # Near-duplicate of an existing keyframe: keep whichever is sharper
+        for kept in self.selected:
+            if float(np.dot(signature, kept["signature"])) >= DUPLICATE_SIMILARITY:
+                if quality > kept["quality"]:
+                    kept.update(frame=frame, index=index, quality=quality, signature=signature)
+                    self._rescore()
+                return
+
+        novelty = self._novelty(signature)
+        candidate = {
+            "index": index,
+            "frame": frame,
+            "quality": quality,
+            "signature": signature,
+            "novelty": novelty,
+            "score": quality * (0.5 + 0.5 * novelty),
+        }
+
+        if len(self.selected) < self.top_k:
+            self.selected.append(candidate)
+            self._rescore()
+            return
+
+        weakest = min(self.selected, key=lambda k: k["score"])
+        if candidate["score"] > weakest["score"]:
+            self.selected.remove(weakest)
+            self.selected.append(candidate)
+            self._rescore()
+
+    def _rescore(self):
+        for kept in self.selected:
+            kept["novelty"] = self._novelty(kept["signature"], exclude=kept)
+            kept["score"] = kept["quality"] * (0.5 + 0.5 * kept["novelty"])
+
+    def keyframes(self):
+        """
+        Return the selected keyframes, best first.
+        """
+        return sorted(self.selected, key=lambda k: k["score"], reverse=True)
+
+
+def select_keyframes(video_path, top_k=4, stride=5, max_frames=3000):
+    """
+    Stream a clip from disk and pick its top-k keyframes.
+
+    Parameters:
+    - video_path (str): Path to an MP4/AVI clip
+    - top_k (int): Number of keyframes to keep
+    - stride (int): Only every `stride`-th frame is scored
+    - max_frames (int): Stop decoding after this many frames
+
+    Returns:
+    - (keyframes, frames_scanned) where keyframes is a list of dicts with the
+      frame index, BGR frame and its quality/novelty/score
+    """
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError("Could not decode video")
+
+    selector = KeyframeSelector(top_k=top_k)
+    scanned = 0
+    try:
+        while scanned < max_frames:
+            # grab() still decodes (later frames depend on earlier ones) but skips
+            # retrieve()'s conversion to a BGR array for frames that are not scored
+            if not capture.grab():
+                break
+            if scanned % stride == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    selector.offer(scanned, frame)
+            scanned += 1
+    finally:
+        capture.release()
+
+    return selector.keyframes(), scanned
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class LatestFrameSlot:
+    """
+    Single-slot mailbox for a live frame stream (latest frame wins).
+
+    Putting a frame overwrites any frame that has not been taken yet, so a
+    slow consumer always works on the most recent frame and stale frames are
+    dropped instead of queueing up.
+    """
+
+    def __init__(self):
+        self._frame = None
+        self._received_at = 0.0
+        self._seq = 0
+        self._event = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self._received_at = time.perf_counter()
+        self._seq += 1
+        self.received += 1
+        self._event.set()
+
+    async def take(self):
+        """
+        Wait for a frame and return (seq, frame, received_at).
+        """
+        await self._event.wait()
+        self._event.clear()
+        frame, self._frame = self._frame, None
+        return self._seq, frame, self._received_at
+
+
+class LatencyTracker:
+    """
+    Rolling window of frame-to-feedback latencies in milliseconds.
+    """
+
+    def __init__(self, window=500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def record(self, latency_ms):
+        with self._lock:
+            self._samples.append(latency_ms)
+            self.count += 1
+
+    def summary(self):
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64)
+            count = self.count
+        if samples.size == 0:
+            return {"count": count}
+        return {
+            "count": count,
+            "p50_ms": round(float(np.percentile(samples, 50)), 1),
+            "p95_ms": round(float(np.percentile(samples, 95)), 1),
+            "max_ms": round(float(samples.max()), 1),
+        }
+
+
+def elapsed_ms(since):
+    return (time.perf_counter() - since) * 1000.0
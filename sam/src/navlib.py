@@ -0,0 +1,241 @@
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from src.keyframes import SIGNATURE_SIZE
+
+PENDING = "pending"
+APPROVED = "approved"
+REJECTED = "rejected"
+
+
+def _to_blob(signature):
+    return np.asarray(signature, dtype=np.float32).tobytes()
+
+
+def _from_blob(blob):
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+class NavigationLibrary:
+    """
+    Vetted navigation instructions keyed by (view class, target organ,
+    prompt version).
+
+    The current view is classified locally by nearest labelled exemplar:
+    a frame signature is compared with the stored signatures of each view
+    class, and the best class is trusted only when its cosine similarity is
+    at least `min_similarity` and beats the runner-up by `min_margin`.
+    Trusted views with a vetted entry for the target are served from the
+    library. Everything else goes to the LLM, and the answer is kept as a
+    candidate until a reviewer approves it with its true view class, which
+    also adds the frame as an exemplar of that class.
+    """
+
+    def __init__(self, path, min_similarity=0.8, min_margin=0.05, max_exemplars=50):
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.max_exemplars = max_exemplars
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS nav_entries (
+                view_class TEXT NOT NULL,
+                target TEXT NOT NULL,
+                version TEXT NOT NULL,
+                text TEXT NOT NULL,
+                candidate_id INTEGER,
+                vetted REAL NOT NULL,
+                PRIMARY KEY (view_class, target, version)
+            );
+            CREATE TABLE IF NOT EXISTS nav_candidates (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                target TEXT NOT NULL,
+                version TEXT NOT NULL,
+                predicted_view TEXT,
+                similarity REAL,
+                text TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                image_id TEXT,
+                status TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS nav_exemplars (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                view_class TEXT NOT NULL,
+                signature BLOB NOT NULL
+            );
+            """
+        )
+        self._db.commit()
+
+        self._lock = threading.Lock()
+        self._exemplars = {}
+        for view_class, blob in self._db.execute("SELECT view_class, signature FROM nav_exemplars ORDER BY id"):
+            self._remember(view_class, _from_blob(blob))
+        self._entries = {
+            (row[0], row[1], row[2]): row[3]
+            for row in self._db.execute("SELECT view_class, target, version, text FROM nav_entries")
+        }
+
+        self.lookups = 0
+        self.hits = 0
+        self.misses = {"no_exemplars": 0, "low_confidence": 0, "unseen_transition": 0}
+
+    @staticmethod
+    def normalize(name):
+        return name.strip().lower()
+
+    def _remember(self, view_class, signature):
+        signatures = self._exemplars.get(view_class)
+        row = signature.reshape(1, -1)
+        signatures = row if signatures is None else np.vstack([signatures, row])[-self.max_exemplars:]
+        self._exemplars[view_class] = signatures
+
+    def classify(self, signature):
+        """
+        Return (view_class, similarity, margin) for the nearest exemplar, or
+        (None, 0.0, 0.0) when no views have been labelled yet.
+        """
+        with self._lock:
+            scores = {c: float(np.max(s @ signature)) for c, s in self._exemplars.items()}
+        if not scores:
+            return None, 0.0, 0.0
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        best_class, best = ranked[0]
+        margin = best - ranked[1][1] if len(ranked) > 1 else best
+        return best_class, best, margin
+
+    def references(self, view_class):
+        """
+        Return the exemplar signatures of a view class, or None if it has none.
+        """
+        with self._lock:
+            return self._exemplars.get(self.normalize(view_class))
+
+    def lookup(self, signature, target, version):
+        """
+        Return (text, view) where text is the vetted instruction for this
+        view and target, or None on a miss. `view` describes the local
+        classification and, on a miss, why the library could not answer.
+        """
+        view_class, similarity, margin = self.classify(signature)
+        view = {"view_class": view_class, "similarity": round(similarity, 3), "margin": round(margin, 3)}
+        target = self.normalize(target)
+
+        with self._lock:
+            self.lookups += 1
+            if view_class is None:
+                reason = "no_exemplars"
+            elif similarity < self.min_similarity or margin < self.min_margin:
+                reason = "low_confidence"
+            else:
+                text = self._entries.get((view_class, target, version))
+                if text is not None:
+                    self.hits += 1
+                    return text, view
+                reason = "unseen_transition"
+            self.misses[reason] += 1
+        view["miss"] = reason
+        return None, view
+
+    def add_candidate(self, target, version, signature, view, text, image_id=None):
+        """
+        Keep an LLM-generated instruction for review. Returns the candidate ID.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO nav_candidates (target, version, predicted_view, similarity, text, signature, image_id, status, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.normalize(target), version, view.get("view_class"), view.get("similarity"), text,
+                 _to_blob(signature), image_id, PENDING, time.time()),
+            )
+            self._db.commit()
+            return cursor.lastrowid
+
+    def add_view(self, view_class, signature):
+        """
+        Label a frame as an exemplar of a view class.
+        """
+        view_class = self.normalize(view_class)
+        signature = np.asarray(signature, dtype=np.float32)
+        if signature.size != SIGNATURE_SIZE * SIGNATURE_SIZE:
+            raise ValueError("Signature has the wrong size")
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO nav_exemplars (view_class, signature) VALUES (?, ?)", (view_class, _to_blob(signature))
+            )
+            self._db.commit()
+            self._remember(view_class, signature)
+
+    def vet(self, candidate_id, view_class, approve=True):
+        """
+        Approve or reject a candidate. An approved candidate becomes the
+        library entry for (view_class, target, version) and its frame an
+        exemplar of view_class. Returns the candidate's new state, or None
+        if it does not exist.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT target, version, text, signature FROM nav_candidates WHERE id = ?", (candidate_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        target, version, text, blob = row
+        view_class = self.normalize(view_class)
+        if approve:
+            self.add_view(view_class, _from_blob(blob))
+        with self._lock:
+            if approve:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO nav_entries (view_class, target, version, text, candidate_id, vetted) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (view_class, target, version, text, candidate_id, time.time()),
+                )
+                self._entries[(view_class, target, version)] = text
+            self._db.execute(
+                "UPDATE nav_candidates SET status = ? WHERE id = ?", (APPROVED if approve else REJECTED, candidate_id)
+            )
+            self._db.commit()
+        return {"candidate_id": candidate_id, "status": APPROVED if approve else REJECTED,
+                "view_class": view_class, "target": target, "version": version}
+
+    def candidates(self, status=PENDING, limit=50):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, target, version, predicted_view, similarity, text, image_id, created "
+                "FROM nav_candidates WHERE status = ? ORDER BY created DESC LIMIT ?",
+                (status, limit),
+            ).fetchall()
+        return [
+            {"candidate_id": r[0], "target": r[1], "version": r[2], "predicted_view": r[3],
+             "similarity": r[4], "text": r[5], "image_id": r[6], "created": r[7]}
+            for r in rows
+        ]
+
+    def entries(self):
+        with self._lock:
+            return [
+                {"view_class": k[0], "target": k[1], "version": k[2], "text": v}
+                for k, v in sorted(self._entries.items())
+            ]
+
+    def stats(self):
+        with self._lock:
+            pending = self._db.execute(
+                "SELECT COUNT(*) FROM nav_candidates WHERE status = ?", (PENDING,)
+            ).fetchone()[0]
+            return {
+                "entries": len(self._entries),
+                "pending_candidates": pending,
+                "exemplars": {c: len(s) for c, s in self._exemplars.items()},
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "misses": dict(self.misses),
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else None,
+            }
@@ -0,0 +1,243 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from src.scheduler import Overloaded
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+
+class LinkDown(Exception):
+    """
+    Raised when the upstream LLM backend cannot be reached.
+    """
+
+
+class Pacer:
+    """
+    Token bucket limiting replay traffic to `rate` bytes per second, so a
+    draining backlog does not saturate a freshly restored link.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self._tokens = self.burst
+        self._last = time.monotonic()
+
+    def delay(self, nbytes):
+        """
+        Consume `nbytes` and return how long to sleep before sending them.
+        """
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        self._tokens -= nbytes
+        return max(0.0, -self._tokens / self.rate)
+
+
+class Outbox:
+    """
+    Durable store-and-forward queue for upstream LLM requests.
+
+    While the link is down, requests are written to SQLite together with
+    their image and replayed by a background thread once it is back, in
+    priority order (lower number first) and paced to `rate` bytes per
+    second. Replays that find the link down or upstream overloaded stay
+    queued and back off exponentially up to `max_backoff` seconds; each
+    replay attempt doubles as the link probe. With nothing
+    to replay, the first live request after the backoff probes the link
+    instead, so it recovers whether or not anything was queued.
+    """
+
+    def __init__(self, path, handlers, rate, max_backoff=60.0, on_result=None):
+        self.handlers = handlers
+        self.on_result = on_result
+        self.max_backoff = max_backoff
+        self.pacer = Pacer(rate)
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                image BLOB,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created REAL NOT NULL,
+                sent REAL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (status, priority, created)")
+        self._db.commit()
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopping = False
+        self._thread = None
+
+        self.link_up = True
+        self._down_since = None
+        self._backoff = 1.0
+        self._next_probe = 0.0
+
+        # (finished_at, bytes) of recent replays for throughput reporting
+        self._drained = deque(maxlen=256)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="outbox-replay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify_all()
+
+    def mark_down(self):
+        with self._lock:
+            if self.link_up:
+                self.link_up = False
+                self._down_since = time.time()
+                self._backoff = 1.0
+            self._next_probe = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def mark_up(self):
+        with self._lock:
+            self.link_up = True
+            self._down_since = None
+            self._backoff = 1.0
+            self._next_probe = 0.0
+            self._wakeup.notify_all()
+
+    def defer(self):
+        """
+        Hold replays back for the current backoff, e.g. while upstream is
+        overloaded; the link itself stays up.
+        """
+        with self._lock:
+            self._next_probe = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def should_try_upstream(self):
+        """
+        Whether a request should attempt the upstream call. While the link
+        is down, the replay thread probes it, and one live request is let
+        through once per backoff period; the caller reports the outcome
+        with mark_up() or mark_down().
+        """
+        if self.link_up or threading.current_thread() is self._thread:
+            return True
+        with self._lock:
+            if self.link_up:
+                return True
+            now = time.monotonic()
+            if now < self._next_probe:
+                return False
+            # Hold off other live probes until this one has had its chance
+            self._next_probe = now + self._backoff
+            return True
+
+    def enqueue(self, kind, payload, image=None, priority=5):
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO outbox (kind, payload, image, priority, status, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), image, priority, PENDING, time.time()),
+            )
+            self._db.commit()
+            self._wakeup.notify()
+            return cursor.lastrowid
+
+    def get(self, item_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, priority, status, result, error, created, sent FROM outbox WHERE id = ?", (item_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        item = {"id": row[0], "kind": row[1], "priority": row[2], "status": row[3], "created": row[6], "sent": row[7]}
+        if row[4] is not None:
+            item["result"] = json.loads(row[4])
+        if row[5] is not None:
+            item["error"] = row[5]
+        return item
+
+    def _next(self):
+        return self._db.execute(
+            "SELECT id, kind, payload, image FROM outbox WHERE status = ? ORDER BY priority, created LIMIT 1",
+            (PENDING,),
+        ).fetchone()
+
+    def _finish(self, item_id, status, result=None, error=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, result = ?, error = ?, sent = ?, image = NULL WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), item_id),
+            )
+            self._db.commit()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                item = self._next()
+                while not self._stopping and (item is None or time.monotonic() < self._next_probe):
+                    timeout = 5.0 if item is None else self._next_probe - time.monotonic()
+                    self._wakeup.wait(timeout=max(timeout, 0.05))
+                    item = self._next()
+                if self._stopping:
+                    return
+
+            item_id, kind, payload, image = item
+            size = len(payload) + (len(image) if image else 0)
+            time.sleep(self.pacer.delay(size))
+
+            try:
+                result = self.handlers[kind](json.loads(payload), image)
+            except LinkDown:
+                # The failed attempt may already have marked the link down
+                if self.link_up:
+                    self.mark_down()
+                continue
+            except Overloaded:
+                # Typical of the burst right after reconnecting: retry later
+                self.defer()
+                continue
+            except Exception as e:
+                print(f"Outbox item {item_id} ({kind}) failed: {str(e)}")
+                self._finish(item_id, FAILED, error=str(e))
+                continue
+
+            self.mark_up()
+            self._finish(item_id, SENT, result=result)
+            self._drained.append((time.time(), size))
+            if self.on_result is not None:
+                try:
+                    self.on_result(kind, json.loads(payload), result)
+                except Exception as e:
+                    print(f"Outbox result callback failed: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            depth = self._db.execute("SELECT COUNT(*) FROM outbox WHERE status = ?", (PENDING,)).fetchone()[0]
+            drained = list(self._drained)
+            link_up = self.link_up
+            down_since = self._down_since
+
+        stats = {"link_up": link_up, "depth": depth, "recently_drained": len(drained)}
+        if down_since is not None:
+            stats["down_for_s"] = round(time.time() - down_since, 1)
+        if len(drained) >= 2:
+            span = max(drained[-1][0] - drained[0][0], 1e-6)
+            stats["drain_items_per_min"] = round((len(drained) - 1) / span * 60, 1)
+            stats["drain_bytes_per_s"] = round(sum(b for _, b in drained[1:]) / span, 1)
+        return stats
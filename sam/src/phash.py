@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict, deque
+
+import cv2
+import numpy as np
+
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash of an image as a 64-bit integer.
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale thumbnail
+    and each bit records whether a pixel is brighter than its right-hand
+    neighbour. Re-encoding, small noise and gain changes leave most bits
+    untouched, unlike a hash of the raw bytes.
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class FrameIndex:
+    """
+    Recent frame hashes for one session and the results computed for them.
+    """
+
+    def __init__(self, size):
+        self._entries = deque(maxlen=size)
+
+    def lookup(self, frame_hash, key, threshold):
+        # Newest first so the most recent matching result wins
+        for entry_hash, results in reversed(self._entries):
+            if key in results and hamming(frame_hash, entry_hash) <= threshold:
+                return results[key]
+        return None
+
+    def add(self, frame_hash, key, result):
+        for entry_hash, results in self._entries:
+            if entry_hash == frame_hash:
+                results[key] = result
+                return
+        self._entries.append((frame_hash, {key: result}))
+
+
+class DedupCache:
+    """
+    Per-session near-duplicate frame cache.
+
+    A frame whose dHash is within `threshold` bits of a recent frame in the
+    same session reuses that frame's result for the same key (task and
+    organ) instead of triggering a new upstream call. Sessions are evicted
+    least-recently-used beyond `max_sessions`.
+    """
+
+    def __init__(self, threshold=6, frames_per_session=32, max_sessions=256):
+        self.threshold = threshold
+        self.frames_per_session = frames_per_session
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+
+    def _index(self, session_id):
+        index = self._sessions.get(session_id)
+        if index is None:
+            index = FrameIndex(self.frames_per_session)
+            self._sessions[session_id] = index
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return index
+
+    def lookup(self, session_id, frame_hash, key):
+        with self._lock:
+            self.lookups += 1
+            result = self._index(session_id).lookup(frame_hash, key, self.threshold)
+            if result is not None:
+                self.hits += 1
+            return result
+
+    def add(self, session_id, frame_hash, key, result):
+        with self._lock:
+            self._index(session_id).add(frame_hash, key, result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "skip_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "sessions": len(self._sessions),
+            }
@@ -1,18 +1,15 @@
+import sys
+from collections import OrderedDict
 
-def get_navigation_prompt(target_organ):
-    """
-    Returns the LLM prompt as a multi-line string.
-    This prompt guides the LLM to generate a step-by-step voice instruction transcript
-    that helps astronauts transition the ultrasound probe from imaging the current area
-    to imaging a desired organ in a microgravity environment.
-    """
-    prompt = (
+
+# Static instruction block for navigation, sent as the system prompt; only the
+# suffix varies per request.
+NAVIGATION_PROMPT_PREFIX = (
         "You are an astronaut assistant providing real-time, voice-based instructions to non-expert astronauts "
         "in space who are operating the NASA Ultrasound-2 system. Your task is to guide them step-by-step on how to "
         "smoothly transition the ultrasound probe from imaging the current anatomical area to imaging a desired area. "
         "The astronauts work in a microgravity environment, so your instructions must address key challenges such as "
         "securing equipment and maintaining stability.\n\n"
-        "Desired Organ: {target_organ}\n\n"
         "Your instructions should include the following details:\n\n"
         
         "1. Current Image Verification:\n"
@@ -41,23 +38,20 @@ def get_navigation_prompt(target_organ):
         
         "The tone of the instructions should be calm, confident, and clear, using non-technical language whenever possible. "
         "The output must be a transcript that can be read aloud, with each step clearly separated. The transcript should "
-        "include occasional reflective questions to confirm the astronaut's understanding.\n\n"
-        
-        "Now, generate the complete voice instruction transcript based on these guidelines."
-    )
-    return prompt.format(target_organ=target_organ)
+        "include occasional reflective questions to confirm the astronaut's understanding."
+)
 
 
-def get_ultrasound_diagnostic_prompt(target_organ):
-    """
-    Returns the LLM prompt as a multi-line string.
-    This prompt directs a voice agent to review an ultrasound image provided by an astronaut.
-    The voice agent should evaluate image quality, comment on the viewable area, and offer an initial diagnostic assessment.
-    """
-    prompt = """
-    You are an agent reviewing an ultrasound scan sent by an astronaut. Your task is to provide a clear and supportive written transcript focused on evaluating the organ shown in the image.
+NAVIGATION_SUFFIX_TEMPLATE = (
+    "Desired Organ: {target_organ}\n\n"
+    "Now, generate the complete voice instruction transcript based on these guidelines."
+)
 
-    The target organ appears to be {target_organ}.
+
+# Static instruction block for the organ-specific diagnosis, sent as the
+# system prompt. The target organ goes in the per-request suffix.
+DIAGNOSTIC_PROMPT_PREFIX = """
+    You are an agent reviewing an ultrasound scan sent by an astronaut. Your task is to provide a clear and supportive written transcript focused on evaluating the organ shown in the image.
 
     Your response should include the following sections:
 
@@ -83,6 +77,159 @@ def get_ultrasound_diagnostic_prompt(target_organ):
 
     Keep the response concise, medically appropriate, and easy for the astronaut to follow in a high-stress environment. Format the output in plain text.
     """
-    return prompt.format(target_organ=target_organ)
 
 
+DIAGNOSTIC_SUFFIX_TEMPLATE = "The target organ appears to be {target_organ}."
+
+
+IDENTIFY_SUFFIX_TEMPLATE = (
+    "Is there a {target_organ} in this ultrasound image? Report your answer with the "
+    "report_identification tool: whether it is visible, your confidence, whether it is fully "
+    "or only partly in view, its approximate bounding box, and whether the image quality is "
+    "good enough for a diagnostic assessment."
+)
+
+
+SWEEP_SUFFIX_TEMPLATE = (
+    "Check the ultrasound image(s) for each of these organs: {target_organ}. Report every organ in "
+    "a single report_sweep call: whether it is visible, your confidence, whether it is fully or only "
+    "partly in view and its approximate bounding box, plus whether the image quality is good enough "
+    "for a diagnostic assessment."
+)
+
+
+# Static instruction block for follow-up questions after a diagnosis, sent
+# as the system prompt
+CHAT_PROMPT_PREFIX = (
+    "You are an ultrasound assistant answering an astronaut's follow-up questions about a scan "
+    "they have just taken in a microgravity environment. The conversation so far is given first: "
+    "a summary of older turns, then the most recent turns, then the latest image when there is one. "
+    "Answer the new question briefly and in plain text, based on the image and the earlier "
+    "assessment. Say so when a question cannot be answered from the scan, and recommend contacting "
+    "the flight surgeon for anything that needs a clinical decision."
+)
+
+CHAT_SUFFIX_TEMPLATE = "The scan is of the {target_organ}."
+
+
+# Organs offered by the UI; their prompts are rendered once at import
+KNOWN_ORGANS = ("liver", "kidneys", "pancreas", "bladder", "thyroid", "heart", "lungs")
+
+
+def estimate_tokens(text):
+    """
+    Rough token count for English prompt text (about 4 characters per token).
+    """
+    return max(1, round(len(text) / 4))
+
+
+class RenderedPrompt:
+    """
+    One prompt rendered for one organ: the static prefix (sent as the
+    system prompt), the per-request suffix, and their
+    concatenation for callers that send a single text block.
+    """
+
+    __slots__ = ("name", "version", "organ", "prefix", "suffix", "text", "tokens")
+
+    def __init__(self, name, version, organ, prefix, suffix, separator):
+        self.name = name
+        self.version = version
+        self.organ = organ
+        self.prefix = prefix
+        self.suffix = suffix
+        self.text = prefix + separator + suffix if prefix else suffix
+        self.tokens = estimate_tokens(self.text)
+
+
+class PromptRegistry:
+    """
+    Prompt templates keyed by (name, version, organ).
+
+    Every registered version is rendered for the known organs up front and
+    the strings are interned, so a request only does a dict lookup. Organs
+    outside the known list (free-text entity names) are rendered on first
+    use and kept in a small LRU. The current version of each prompt is part
+    of every cache key built from its output, so changing a prompt (and
+    bumping its version) invalidates earlier cached answers.
+    """
+
+    def __init__(self, organs=KNOWN_ORGANS, max_dynamic=256):
+        self.organs = tuple(organs)
+        self.max_dynamic = max_dynamic
+        self._templates = {}
+        self._current = {}
+        self._rendered = {}
+        self._dynamic = OrderedDict()
+
+    @staticmethod
+    def normalize(organ):
+        return organ.strip().lower()
+
+    def register(self, name, version, prefix, suffix_template, separator="\n\n"):
+        """
+        Add a prompt version, pre-render it for every known organ and make it
+        the current version of that prompt.
+        """
+        self._templates[(name, version)] = (sys.intern(prefix), suffix_template, separator)
+        for organ in self.organs:
+            rendered = self._render(name, version, organ)
+            rendered.suffix = sys.intern(rendered.suffix)
+            rendered.text = sys.intern(rendered.text)
+            self._rendered[(name, version, organ)] = rendered
+        self._current[name] = version
+
+    def _render(self, name, version, organ):
+        prefix, suffix_template, separator = self._templates[(name, version)]
+        suffix = suffix_template.format(target_organ=organ)
+        return RenderedPrompt(name, version, organ, prefix, suffix, separator)
+
+    def version(self, name):
+        return self._current[name]
+
+    def get(self, name, organ, version=None):
+        """
+        Return the RenderedPrompt for an organ, by default at the current version.
+        """
+        version = version or self._current[name]
+        key = (name, version, self.normalize(organ))
+        rendered = self._rendered.get(key)
+        if rendered is not None:
+            return rendered
+
+        rendered = self._dynamic.get(key)
+        if rendered is None:
+            rendered = self._render(*key)
+            self._dynamic[key] = rendered
+            if len(self._dynamic) > self.max_dynamic:
+                self._dynamic.popitem(last=False)
+        else:
+            self._dynamic.move_to_end(key)
+        return rendered
+
+    def stats(self):
+        """
+        Current version and token counts of each prompt. Prefix tokens are
+        the part that prompt caching can reuse across calls.
+        """
+        result = {}
+        for name, version in self._current.items():
+            prefix, _, _ = self._templates[(name, version)]
+            per_organ = {organ: self._rendered[(name, version, organ)].tokens for organ in self.organs}
+            result[name] = {
+                "version": version,
+                "versions": sorted(v for n, v in self._templates if n == name),
+                "prefix_tokens": estimate_tokens(prefix) if prefix else 0,
+                "tokens_by_organ": per_organ,
+            }
+        result["dynamic_renders"] = len(self._dynamic)
+        return result
+
+
+# Bump a version whenever its prompt text changes
+prompt_registry = PromptRegistry()
+prompt_registry.register("navigation", "1", NAVIGATION_PROMPT_PREFIX, NAVIGATION_SUFFIX_TEMPLATE)
+prompt_registry.register("diagnostic", "1", DIAGNOSTIC_PROMPT_PREFIX, DIAGNOSTIC_SUFFIX_TEMPLATE, separator="\n")
+prompt_registry.register("identify", "2", "", IDENTIFY_SUFFIX_TEMPLATE)
+prompt_registry.register("sweep", "1", "", SWEEP_SUFFIX_TEMPLATE)
+prompt_registry.register("chat", "1", CHAT_PROMPT_PREFIX, CHAT_SUFFIX_TEMPLATE)
@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class ModelRouter:
+    """
+    Tiered model routing driven by a JSON config.
+
+    The config maps tiers (e.g. "fast", "large") to model IDs and tasks to a
+    starting tier, a max_tokens value and an optional escalation rule: when
+    a task's answer comes back with a confidence below `escalate_below`, it
+    is retried on `escalate_to`. Latency and token usage, including prompt
+    cache reads and writes, are recorded per tier. Tiers may list their
+    prices in USD per million input and output tokens for cost accounting.
+    """
+
+    def __init__(self, config):
+        self.tiers = config["tiers"]
+        self.tasks = config["tasks"]
+        self._lock = threading.Lock()
+        self._stats = {
+            tier: {
+                "calls": 0, "escalations": 0, "input_tokens": 0, "output_tokens": 0,
+                "cache_read_tokens": 0, "cache_write_tokens": 0, "latencies": deque(maxlen=500)
+            }
+            for tier in self.tiers
+        }
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def rule(self, task):
+        if task not in self.tasks:
+            raise KeyError(f"No routing rule for task: {task}")
+        return self.tasks[task]
+
+    def model(self, tier):
+        return self.tiers[tier]["model"]
+
+    def cheapest_tier(self):
+        return min(self.tiers, key=lambda tier: self.tiers[tier].get("input_per_mtok", 0.0))
+
+    def cost(self, tier, usage):
+        """
+        Return the USD cost of one call's usage on a tier. Cache reads are
+        billed at a tenth of the input price and cache writes at 1.25 times.
+        """
+        if usage is None:
+            return 0.0
+        prices = self.tiers[tier]
+        input_price = prices.get("input_per_mtok", 0.0)
+        total = (
+            (getattr(usage, "input_tokens", 0) or 0) * input_price
+            + (getattr(usage, "cache_read_input_tokens", 0) or 0) * input_price * 0.1
+            + (getattr(usage, "cache_creation_input_tokens", 0) or 0) * input_price * 1.25
+            + (getattr(usage, "output_tokens", 0) or 0) * prices.get("output_per_mtok", 0.0)
+        )
+        return total / 1e6
+
+    def escalation(self, task, tier, confidence):
+        """
+        Return the tier to retry on, or None if the answer is good enough.
+        """
+        rule = self.rule(task)
+        target = rule.get("escalate_to")
+        if target is None or target == tier or confidence >= rule.get("escalate_below", 0.0):
+            return None
+        with self._lock:
+            self._stats[target]["escalations"] += 1
+        return target
+
+    def record(self, tier, started, usage):
+        """
+        Record one call. `started` is None for calls without a meaningful
+        latency (e.g. results of a Message Batch).
+        """
+        with self._lock:
+            stats = self._stats[tier]
+            stats["calls"] += 1
+            if started is not None:
+                stats["latencies"].append(time.perf_counter() - started)
+            if usage is not None:
+                stats["input_tokens"] += getattr(usage, "input_tokens", 0) or 0
+                stats["output_tokens"] += getattr(usage, "output_tokens", 0) or 0
+                stats["cache_read_tokens"] += getattr(usage, "cache_read_input_tokens", 0) or 0
+                stats["cache_write_tokens"] += getattr(usage, "cache_creation_input_tokens", 0) or 0
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for tier, stats in self._stats.items():
+                latencies = np.array(stats["latencies"], dtype=np.float64) * 1000.0
+                # input_tokens excludes cached tokens, so the prompt total is the sum of all three
+                cached = stats["cache_read_tokens"]
+                prompt_tokens = stats["input_tokens"] + cached + stats["cache_write_tokens"]
+                result[tier] = {
+                    "model": self.model(tier),
+                    "calls": stats["calls"],
+                    "escalations_in": stats["escalations"],
+                    "input_tokens": stats["input_tokens"],
+                    "output_tokens": stats["output_tokens"],
+                    "cache_read_tokens": stats["cache_read_tokens"],
+                    "cache_write_tokens": stats["cache_write_tokens"],
+                    "cache_hit_rate": round(cached / prompt_tokens, 3) if prompt_tokens else None,
+                    "latency_p50_ms": round(float(np.percentile(latencies, 50)), 1) if latencies.size else None,
+                    "latency_p95_ms": round(float(np.percentile(latencies, 95)), 1) if latencies.size else None,
+                }
+            return result
@@ -0,0 +1,190 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Highest priority first
+PRIORITY_CLASSES = ("emergency", "diagnostic", "navigation", "routine")
+
+# Priority class of the request being served on this thread/task
+current_class = contextvars.ContextVar("priority_class", default="routine")
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is shed or times out waiting for an upstream slot.
+    """
+
+    def __init__(self, priority, reason):
+        super().__init__(f"{priority} request {reason}")
+        self.priority = priority
+        self.reason = reason
+
+
+@contextmanager
+def priority_class(name):
+    """
+    Run the enclosed upstream calls under the given priority class.
+    """
+    if name not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {name}")
+    token = current_class.set(name)
+    try:
+        yield
+    finally:
+        current_class.reset(token)
+
+
+def parse_class_map(spec, default, cast=float):
+    """
+    Parse "emergency=8,routine=2" into a per-class dict, filling gaps from `default`.
+    """
+    values = dict(default)
+    for part in (spec or "").split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            if name.strip() in PRIORITY_CLASSES:
+                values[name.strip()] = cast(value)
+    return values
+
+
+class _Ticket:
+    __slots__ = ("priority", "enqueued", "shed")
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.shed = False
+
+
+class RequestScheduler:
+    """
+    Priority admission control in front of the upstream LLM calls.
+
+    At most `total_slots` upstream calls run at once, and each priority class
+    is capped by its quota. Waiting requests are admitted strictly by class,
+    FIFO within a class. A request that waits longer than its class's
+    timeout, or arrives to a full class queue, is rejected. When more than
+    `max_waiting` requests are queued overall, the newest waiter of the
+    lowest class below the newcomer is shed to make room, so routine work
+    goes first under overload.
+    """
+
+    def __init__(self, total_slots, quotas, timeouts, max_queue, max_waiting):
+        self.total_slots = total_slots
+        self.quotas = quotas
+        self.timeouts = timeouts
+        self.max_queue = max_queue
+        self.max_waiting = max_waiting
+
+        self._cond = threading.Condition()
+        self._running = {c: 0 for c in PRIORITY_CLASSES}
+        self._waiting = {c: deque() for c in PRIORITY_CLASSES}
+        self._metrics = {
+            c: {"admitted": 0, "shed": 0, "timed_out": 0, "waits": deque(maxlen=1000), "max_wait": 0.0}
+            for c in PRIORITY_CLASSES
+        }
+
+    def _eligible(self, priority):
+        return self._running[priority] < self.quotas[priority]
+
+    def _can_run(self, ticket):
+        if sum(self._running.values()) >= self.total_slots:
+            return False
+        if not self._eligible(ticket.priority) or self._waiting[ticket.priority][0] is not ticket:
+            return False
+        # A higher class that could run goes first
+        for higher in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(ticket.priority)]:
+            if self._waiting[higher] and self._eligible(higher):
+                return False
+        return True
+
+    def _shed_lower(self, priority):
+        rank = PRIORITY_CLASSES.index(priority)
+        for lower in reversed(PRIORITY_CLASSES[rank + 1:]):
+            if self._waiting[lower]:
+                victim = self._waiting[lower].pop()
+                victim.shed = True
+                self._metrics[lower]["shed"] += 1
+                # Wake the victim so it gives its thread back now, not at its timeout
+                self._cond.notify_all()
+                return True
+        return False
+
+    @contextmanager
+    def slot(self, priority=None):
+        """
+        Hold an upstream slot for the enclosed call. Raises Overloaded when
+        the request is shed or its queue timeout expires.
+        """
+        priority = priority or current_class.get()
+        metrics = self._metrics[priority]
+        ticket = _Ticket(priority)
+
+        with self._cond:
+            if len(self._waiting[priority]) >= self.max_queue[priority]:
+                metrics["shed"] += 1
+                raise Overloaded(priority, "shed: class queue full")
+            if sum(len(q) for q in self._waiting.values()) >= self.max_waiting and not self._shed_lower(priority):
+                metrics["shed"] += 1
+                raise Overloaded(priority, "shed: scheduler overloaded")
+
+            self._waiting[priority].append(ticket)
+            deadline = ticket.enqueued + self.timeouts[priority]
+            while not ticket.shed and not self._can_run(ticket):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting[priority].remove(ticket)
+                    metrics["timed_out"] += 1
+                    self._cond.notify_all()
+                    raise Overloaded(priority, "timed out waiting for an upstream slot")
+                self._cond.wait(timeout=remaining)
+
+            if ticket.shed:
+                self._cond.notify_all()
+                raise Overloaded(priority, "shed for a higher-priority request")
+
+            self._waiting[priority].popleft()
+            self._running[priority] += 1
+            wait = time.monotonic() - ticket.enqueued
+            metrics["admitted"] += 1
+            metrics["waits"].append(wait)
+            metrics["max_wait"] = max(metrics["max_wait"], wait)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[priority] -= 1
+                self._cond.notify_all()
+
+    def max_blocked(self):
+        """
+        Most callers the scheduler can hold at once: the running calls plus
+        every queued waiter. Waiters block their thread, so a thread pool
+        serving requests must be larger than this, or blocked waiters can
+        take every thread and a higher class never gets to queue.
+        """
+        return self.total_slots + self.max_waiting
+
+    def stats(self):
+        with self._cond:
+            classes = {}
+            for c in PRIORITY_CLASSES:
+                m = self._metrics[c]
+                waits = np.array(m["waits"], dtype=np.float64) * 1000.0
+                classes[c] = {
+                    "running": self._running[c],
+                    "waiting": len(self._waiting[c]),
+                    "quota": self.quotas[c],
+                    "admitted": m["admitted"],
+                    "shed": m["shed"],
+                    "timed_out": m["timed_out"],
+                    "wait_p50_ms": round(float(np.percentile(waits, 50)), 1) if waits.size else None,
+                    "wait_p95_ms": round(float(np.percentile(waits, 95)), 1) if waits.size else None,
+                    "wait_max_ms": round(m["max_wait"] * 1000.0, 1),
+                }
+            return {"total_slots": self.total_slots, "classes": classes}
@@ -0,0 +1,337 @@
+"""
+Token, cost and latency accounting with budget enforcement.
+
+Every model call is recorded against the HTTP request it was made for,
+the request's session (when it has one), the target organ and the
+service-wide daily total. Budgets turn that into back-pressure: past a
+soft limit responses get a smaller max_tokens, past the downgrade limit
+calls move to the cheapest tier without escalation, and once a budget is
+spent calls are answered by the offline backend.
+"""
+import base64
+import contextvars
+import io
+import threading
+import time
+from collections import OrderedDict, deque
+
+from PIL import Image
+
+# Usage of the HTTP request being served on this thread/task
+current_request = contextvars.ContextVar("usage_request", default=None)
+
+# Images are downscaled by the API to about this many tokens at most
+MAX_IMAGE_TOKENS = 1600
+
+NORMAL = "normal"
+SHORTENED = "shortened"
+DOWNGRADED = "downgraded"
+OFFLINE = "offline"
+
+
+def image_tokens(messages):
+    """
+    Estimate the image tokens of a request as width * height / 750 per
+    image, reading only the image headers.
+    """
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for block in content:
+            if block.get("type") != "image":
+                continue
+            try:
+                with Image.open(io.BytesIO(base64.b64decode(block["source"]["data"]))) as probe:
+                    width, height = probe.size
+            except Exception:
+                continue
+            total += min(round(width * height / 750), MAX_IMAGE_TOKENS)
+    return total
+
+
+def _totals():
+    return {
+        "calls": 0, "input_tokens": 0, "output_tokens": 0, "cache_read_tokens": 0,
+        "cache_write_tokens": 0, "image_tokens": 0, "cost_usd": 0.0, "latency_s": 0.0,
+    }
+
+
+def _add(totals, call):
+    totals["calls"] += 1
+    for key in ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens", "image_tokens"):
+        totals[key] += call[key]
+    totals["cost_usd"] += call["cost_usd"]
+    totals["latency_s"] += call["latency_s"]
+
+
+def _rounded(totals):
+    return {**totals, "cost_usd": round(totals["cost_usd"], 6), "latency_s": round(totals["latency_s"], 3)}
+
+
+class RequestUsage:
+    """
+    Usage of one HTTP request. The session is filled in by the handler
+    once it knows it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.session_id = None
+        self.started = time.time()
+        self.totals = _totals()
+
+    def summary(self):
+        return {"path": self.path, "session_id": self.session_id, "started": self.started, **_rounded(self.totals)}
+
+
+def track_session(session_id):
+    """
+    Attribute the current request's usage to a session.
+    """
+    scope = current_request.get()
+    if scope is not None and session_id:
+        scope.session_id = session_id
+
+
+class UsageLedger:
+    """
+    Aggregates call usage per request, session, organ and day, and plans
+    each call against the session token budget and the daily cost budget.
+
+    The budget pressure is the larger of the two fractions used. From
+    `soft_limit` on, max_tokens shrinks linearly towards `min_tokens`; from
+    `downgrade_at` on, calls use the cheapest tier and are not escalated;
+    at 1.0 they go to the offline backend.
+    """
+
+    def __init__(self, session_token_budget=None, daily_cost_budget=None, soft_limit=0.7,
+                 downgrade_at=0.9, min_tokens=256, max_sessions=1000, history=200):
+        self.session_token_budget = session_token_budget
+        self.daily_cost_budget = daily_cost_budget
+        self.soft_limit = soft_limit
+        self.downgrade_at = downgrade_at
+        self.min_tokens = min_tokens
+        self.max_sessions = max_sessions
+
+        self._lock = threading.Lock()
+        self._total = _totals()
+        self._by_task = {}
+        self._by_organ = {}
+        self._sessions = OrderedDict()
+        self._requests = deque(maxlen=history)
+        self._day = time.strftime("%Y-%m-%d", time.gmtime())
+        self._day_cost = 0.0
+        self._modes = {NORMAL: 0, SHORTENED: 0, DOWNGRADED: 0, OFFLINE: 0}
+
+    def _roll_day(self):
+        today = time.strftime("%Y-%m-%d", time.gmtime())
+        if today != self._day:
+            self._day = today
+            self._day_cost = 0.0
+
+    def _session_tokens(self, session_id):
+        totals = self._sessions.get(session_id)
+        return totals["input_tokens"] + totals["output_tokens"] if totals else 0
+
+    def pressure(self, session_id=None):
+        """
+        Fraction of the tightest applicable budget already used.
+        """
+        with self._lock:
+            self._roll_day()
+            fractions = [0.0]
+            if self.daily_cost_budget:
+                fractions.append(self._day_cost / self.daily_cost_budget)
+            if self.session_token_budget and session_id:
+                fractions.append(self._session_tokens(session_id) / self.session_token_budget)
+            return max(fractions)
+
+    def plan(self, tier, max_tokens, cheapest_tier):
+        """
+        Return (tier, max_tokens, mode) for the next call of the current request.
+        """
+        scope = current_request.get()
+        pressure = self.pressure(scope.session_id if scope else None)
+        if pressure >= 1.0:
+            mode = OFFLINE
+        elif pressure >= self.downgrade_at:
+            mode, tier = DOWNGRADED, cheapest_tier
+        elif pressure >= self.soft_limit and max_tokens > self.min_tokens:
+            mode = SHORTENED
+        else:
+            mode = NORMAL
+
+        if mode != NORMAL and pressure >= self.soft_limit and max_tokens > self.min_tokens:
+            remaining = max(0.0, 1.0 - pressure) / (1.0 - self.soft_limit)
+            max_tokens = max(self.min_tokens, int(max_tokens * remaining))
+        with self._lock:
+            self._modes[mode] += 1
+        return tier, max_tokens, mode
+
+    def escalation_allowed(self):
+        scope = current_request.get()
+        return self.pressure(scope.session_id if scope else None) < self.downgrade_at
+
+    def record(self, task, tier, organ, usage, images, latency, cost):
+        """
+        Record one model call against the current request, its session,
+        the organ and the day.
+        """
+        call = {
+            "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+            "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+            "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+            "image_tokens": images,
+            "cost_usd": cost,
+            "latency_s": latency,
+        }
+        scope = current_request.get()
+        organs = organ if isinstance(organ, (list, tuple)) else [organ] if organ else []
+        with self._lock:
+            self._roll_day()
+            self._day_cost += cost
+            _add(self._total, call)
+            _add(self._by_task.setdefault(task, _totals()), call)
+            for name in organs:
+                _add(self._by_organ.setdefault(name.strip().lower(), _totals()), call)
+            if scope is not None:
+                _add(scope.totals, call)
+                if scope.session_id:
+                    session = self._sessions.pop(scope.session_id, None) or _totals()
+                    _add(session, call)
+                    self._sessions[scope.session_id] = session
+                    while len(self._sessions) > self.max_sessions:
+                        self._sessions.popitem(last=False)
+        return call
+
+    def finish_request(self, scope):
+        with self._lock:
+            self._requests.append(scope.summary())
+
+    def summary(self, session_id=None, organ=None, recent=20):
+        with self._lock:
+            self._roll_day()
+            result = {
+                "total": _rounded(self._total),
+                "today": {"date": self._day, "cost_usd": round(self._day_cost, 6)},
+                "by_task": {k: _rounded(v) for k, v in self._by_task.items()},
+                "by_organ": {k: _rounded(v) for k, v in self._by_organ.items()},
+                "sessions": len(self._sessions),
+                "recent_requests": list(self._requests)[-recent:],
+                "budget_modes": dict(self._modes),
+                "budgets": {
+                    "session_tokens": self.session_token_budget,
+                    "daily_cost_usd": self.daily_cost_budget,
+                    "soft_limit": self.soft_limit,
+                    "downgrade_at": self.downgrade_at,
+                },
+            }
+            if session_id:
+                session = self._sessions.get(session_id)
+                result["session"] = _rounded(session) if session else None
+            if organ:
+                totals = self._by_organ.get(organ.strip().lower())
+                result["organ"] = _rounded(totals) if totals else None
+        result["pressure"] = round(self.pressure(session_id), 3)
+        return result
+
+
+class SpeculationStats:
+    """
+    Outcome and cost of speculative work, e.g. navigation prefetched while
+    identification is still pending.
+
+    A speculative job ends up used (its result was fetched), cancelled
+    before it started (free), or discarded after it ran, in which case its
+    cost is wasted. Its cost is known once it finishes, which may happen
+    before or after the client decides. Jobs never resolved are forgotten
+    beyond `max_open`.
+    """
+
+    def __init__(self, max_open=1000):
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._open = OrderedDict()
+        self.submitted = 0
+        self.used = 0
+        self.cancelled = 0
+        self.discarded = 0
+        self.used_cost = 0.0
+        self.wasted_cost = 0.0
+        self.wasted_tokens = 0
+
+    def submit(self, job_id):
+        with self._lock:
+            if job_id in self._open:
+                return
+            self.submitted += 1
+            self._open[job_id] = {"discarded": False, "usage": None}
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+
+    def tracks(self, job_id):
+        with self._lock:
+            return job_id in self._open
+
+    def _waste(self, usage):
+        self.discarded += 1
+        self.wasted_cost += usage.get("cost_usd", 0.0)
+        self.wasted_tokens += usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+    def finished(self, job_id, usage):
+        """
+        Record the finished job's usage (a dict with cost_usd and tokens).
+        """
+        with self._lock:
+            state = self._open.get(job_id)
+            if state is None:
+                return
+            if state["discarded"]:
+                del self._open[job_id]
+                self._waste(usage)
+            else:
+                state["usage"] = usage
+
+    def use(self, job_id):
+        with self._lock:
+            state = self._open.pop(job_id, None)
+            if state is None:
+                return
+            self.used += 1
+            self.used_cost += (state["usage"] or {}).get("cost_usd", 0.0)
+
+    def discard(self, job_id, cancelled):
+        """
+        The client no longer needs the job. `cancelled` says whether it was
+        stopped before starting; otherwise its cost is wasted once known.
+        """
+        with self._lock:
+            state = self._open.get(job_id)
+            if state is None:
+                return
+            if cancelled:
+                del self._open[job_id]
+                self.cancelled += 1
+            elif state["usage"] is not None:
+                del self._open[job_id]
+                self._waste(state["usage"])
+            else:
+                state["discarded"] = True
+
+    def stats(self):
+        with self._lock:
+            resolved = self.used + self.cancelled + self.discarded
+            return {
+                "submitted": self.submitted,
+                "used": self.used,
+                "cancelled_before_start": self.cancelled,
+                "discarded_after_start": self.discarded,
+                "pending": len(self._open),
+                "use_rate": round(self.used / resolved, 3) if resolved else None,
+                "used_cost_usd": round(self.used_cost, 6),
+                "wasted_cost_usd": round(self.wasted_cost, 6),
+                "wasted_tokens": self.wasted_tokens,
+            }
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+
+from src.phash import hamming
+
+
+class DetectionVoter:
+    """
+    Debounced "organ found" signal for one session and organ.
+
+    Identification results are fused into an evidence score in [0, 1]. The
+    score decays back towards 0.5 (unknown) with a fixed half-life, so old
+    results count for less over time. The stable signal uses hysteresis: it
+    turns on above `on_threshold` and only turns off again below
+    `off_threshold`, so a single contradicting frame does not make it flicker.
+    """
+
+    def __init__(self, half_life=10.0, on_threshold=0.65, off_threshold=0.35,
+                 change_threshold=12, learning_rate=0.5):
+        self.half_life = half_life
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.change_threshold = change_threshold
+        self.learning_rate = learning_rate
+
+        self.score = 0.5
+        self.stable = False
+        self.updated_at = None
+        self.last_hash = None
+        self.upstream_calls = 0
+        self.acquired = False
+        # Full result of the last identification, reused while calls are skipped
+        self.last_result = None
+
+    def current_score(self, now=None):
+        if self.updated_at is None:
+            return 0.5
+        now = time.monotonic() if now is None else now
+        decay = 0.5 ** ((now - self.updated_at) / self.half_life)
+        return 0.5 + (self.score - 0.5) * decay
+
+    def needs_upstream(self, frame_hash, now=None):
+        """
+        Whether a new upstream identification is worth making for this frame.
+
+        Only when there is no prior result, the image has changed by more than
+        `change_threshold` bits, or the evidence has decayed back into the
+        uncertain band between the two thresholds.
+        """
+        if self.last_hash is None:
+            return True
+        if hamming(frame_hash, self.last_hash) > self.change_threshold:
+            return True
+        score = self.current_score(now)
+        return self.off_threshold < score < self.on_threshold
+
+    def observe(self, found, confidence=1.0, frame_hash=None, now=None):
+        """
+        Fuse one identification result and return the stable signal.
+        """
+        now = time.monotonic() if now is None else now
+        score = self.current_score(now)
+        target = 1.0 if found else 0.0
+        self.score = score + self.learning_rate * confidence * (target - score)
+        self.updated_at = now
+        self.upstream_calls += 1
+        if frame_hash is not None:
+            self.last_hash = frame_hash
+
+        if not self.stable and self.score >= self.on_threshold:
+            self.stable = True
+        elif self.stable and self.score <= self.off_threshold:
+            self.stable = False
+        return self.stable
+
+
+class VotingEngine:
+    """
+    DetectionVoters keyed by (session, organ), evicted least-recently-used.
+    """
+
+    def __init__(self, max_voters=1024, **voter_kwargs):
+        self.max_voters = max_voters
+        self.voter_kwargs = voter_kwargs
+        self._voters = OrderedDict()
+        self._lock = threading.Lock()
+        self.decisions = 0
+        self.skipped = 0
+        self.acquisitions = 0
+        self.calls_to_acquire = 0
+
+    def voter(self, session_id, organ):
+        key = (session_id, organ.lower())
+        with self._lock:
+            voter = self._voters.get(key)
+            if voter is None:
+                voter = DetectionVoter(**self.voter_kwargs)
+                self._voters[key] = voter
+                while len(self._voters) > self.max_voters:
+                    self._voters.popitem(last=False)
+            else:
+                self._voters.move_to_end(key)
+            return voter
+
+    def decide(self, session_id, organ, frame_hash, identify):
+        """
+        Return (stable_found, score, upstream_called, raw_found).
+
+        `identify` is called only if the voter needs a fresh result for this
+        frame and returns either a bool or a (found, confidence) pair.
+        """
+        voter = self.voter(session_id, organ)
+        with self._lock:
+            self.decisions += 1
+
+        if not voter.needs_upstream(frame_hash):
+            with self._lock:
+                self.skipped += 1
+            return voter.stable, voter.current_score(), False, None
+
+        result = identify()
+        found, confidence = result if isinstance(result, tuple) else (result, 1.0)
+        stable = voter.observe(found, confidence, frame_hash)
+
+        if stable and not voter.acquired:
+            voter.acquired = True
+            with self._lock:
+                self.acquisitions += 1
+                self.calls_to_acquire += voter.upstream_calls
+        return stable, voter.current_score(), True, found
+
+    def stats(self):
+        with self._lock:
+            return {
+                "decisions": self.decisions,
+                "upstream_skipped": self.skipped,
+                "acquisitions": self.acquisitions,
+                "calls_per_acquisition": round(self.calls_to_acquire / self.acquisitions, 2) if self.acquisitions else None,
+            }
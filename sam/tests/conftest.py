@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Tests import the service the way it runs: from sam/, with src as a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep app imports offline and away from the default databases
+_state = tempfile.mkdtemp(prefix="space-triage-tests-")
+os.environ.setdefault("LLM_BACKEND", "offline")
+for name in ("OUTBOX_DB_PATH", "JOB_DB_PATH", "NAVLIB_DB_PATH"):
+    os.environ.setdefault(name, os.path.join(_state, name.lower() + ".sqlite3"))
+
+
+def wait_for(condition, timeout=5.0):
+    """
+    Poll `condition` until it holds; fail the test after `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached in time")
+        time.sleep(0.01)
+
+
+def in_thread(fn, *args):
+    """
+    Run `fn(*args)` on a thread; returns the thread and a dict that ends up
+    holding its "result" or "error".
+    """
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = fn(*args)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, outcome
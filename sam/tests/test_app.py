@@ -0,0 +1,41 @@
+import anyio
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import app as service
+from src.identification import UNKNOWN_IDENTIFICATION
+
+
+def test_startup_sizes_threadpool_above_blocked_callers():
+    with TestClient(service.app) as client:
+        tokens = client.portal.call(lambda: anyio.to_thread.current_default_thread_limiter().total_tokens)
+    assert tokens >= service.scheduler.max_blocked() + service.THREADPOOL_HEADROOM
+
+
+@pytest.fixture
+def llm_identification(monkeypatch):
+    calls = []
+
+    def identify(img, upload, entity_name):
+        calls.append(entity_name)
+        return {"found": True, "confidence": 0.9, "visibility": "partial",
+                "bbox": [0.1, 0.2, 0.5, 0.6], "image_quality": "good", "source": "llm"}
+
+    monkeypatch.setattr(service, "identify_with_prefilter", identify)
+    return calls
+
+
+def test_skipped_call_answers_from_the_vote(llm_identification):
+    frame = np.tile(np.arange(64, dtype=np.uint8) * 4, (64, 1))
+    first = service.identify_for_session("vote-session", frame, "liver")
+    assert first["source"] == "llm" and first["upstream"]
+
+    second = service.identify_for_session("vote-session", frame, "liver")
+    assert len(llm_identification) == 1
+    assert second["source"] == "vote" and not second["upstream"]
+    assert second["found"] is True and second["stable_found"] is True
+    # Same result shape as a real identification, never a missing field
+    assert set(UNKNOWN_IDENTIFICATION) <= set(second)
+    assert second["confidence"] == second["score"]
+    assert (second["visibility"], second["bbox"]) == ("partial", [0.1, 0.2, 0.5, 0.6])
@@ -0,0 +1,120 @@
+import pytest
+
+from conftest import wait_for
+from src.outbox import FAILED, SENT, LinkDown, Outbox
+from src.scheduler import Overloaded
+
+
+@pytest.fixture
+def make_outbox(tmp_path):
+    outboxes = []
+
+    def make(handler, **kwargs):
+        outbox = Outbox(str(tmp_path / "outbox.sqlite3"), {"identify": handler}, rate=10**9, **kwargs)
+        outboxes.append(outbox)
+        return outbox
+
+    yield make
+    for outbox in outboxes:
+        outbox.stop()
+
+
+def finished(outbox, item_id):
+    item = outbox.get(item_id)
+    return item if item["status"] in (SENT, FAILED) else None
+
+
+def failing(times, error):
+    """
+    Handler that raises `error` for its first `times` calls, then echoes the payload.
+    """
+    calls = []
+
+    def handler(payload, image):
+        calls.append(payload)
+        if len(calls) <= times:
+            raise error
+        return {"echo": payload, "image_bytes": len(image or b"")}
+
+    return handler, calls
+
+
+def test_replay_sends_and_reports_result(make_outbox):
+    replayed = []
+    handler, _ = failing(0, None)
+    outbox = make_outbox(handler, on_result=lambda kind, payload, result: replayed.append((kind, result)))
+    item_id = outbox.enqueue("identify", {"organ": "liver"}, image=b"jpeg")
+    outbox.start()
+
+    wait_for(lambda: finished(outbox, item_id))
+    item = outbox.get(item_id)
+    assert item["status"] == SENT
+    assert item["result"] == {"echo": {"organ": "liver"}, "image_bytes": 4}
+    assert replayed == [("identify", item["result"])]
+
+
+def test_replays_in_priority_order(make_outbox):
+    handler, calls = failing(0, None)
+    outbox = make_outbox(handler)
+    ids = [outbox.enqueue("identify", {"n": n}, priority=n) for n in (3, 1, 2)]
+    outbox.start()
+
+    wait_for(lambda: all(finished(outbox, i) for i in ids))
+    assert [payload["n"] for payload in calls] == [1, 2, 3]
+
+
+def test_link_down_keeps_item_queued_and_retries(make_outbox):
+    handler, calls = failing(1, LinkDown("no route"))
+    outbox = make_outbox(handler)
+    item_id = outbox.enqueue("identify", {"organ": "heart"})
+    outbox.start()
+
+    wait_for(lambda: len(calls) == 1)
+    assert outbox.get(item_id)["status"] == "pending"
+    assert not outbox.link_up
+
+    wait_for(lambda: finished(outbox, item_id))
+    assert outbox.get(item_id)["status"] == SENT
+    assert outbox.link_up
+
+
+def test_overloaded_replay_is_requeued_not_failed(make_outbox):
+    handler, calls = failing(1, Overloaded("routine", "shed: scheduler overloaded"))
+    outbox = make_outbox(handler)
+    item_id = outbox.enqueue("identify", {"organ": "kidneys"})
+    outbox.start()
+
+    wait_for(lambda: len(calls) == 1)
+    assert outbox.get(item_id)["status"] == "pending"
+    # Overload says nothing about the link
+    assert outbox.link_up
+
+    wait_for(lambda: finished(outbox, item_id))
+    assert outbox.get(item_id)["status"] == SENT
+    assert len(calls) == 2
+
+
+def test_other_errors_fail_the_item(make_outbox):
+    handler, _ = failing(1, ValueError("bad payload"))
+    outbox = make_outbox(handler)
+    item_id = outbox.enqueue("identify", {"organ": "lungs"})
+    outbox.start()
+
+    wait_for(lambda: finished(outbox, item_id))
+    item = outbox.get(item_id)
+    assert item["status"] == FAILED
+    assert item["error"] == "bad payload"
+
+
+def test_one_live_probe_per_backoff_while_down(make_outbox):
+    handler, _ = failing(0, None)
+    outbox = make_outbox(handler)
+    outbox.mark_down()
+    assert not outbox.should_try_upstream()
+
+    outbox._next_probe = 0.0
+    assert outbox.should_try_upstream()
+    assert not outbox.should_try_upstream()
+
+    outbox.mark_up()
+    assert outbox.should_try_upstream()
@@ -0,0 +1,139 @@
+import threading
+from functools import partial
+
+import anyio
+import pytest
+
+from conftest import in_thread, wait_for
+from src.scheduler import PRIORITY_CLASSES, Overloaded, RequestScheduler
+
+
+def make_scheduler(total_slots=1, max_waiting=16, timeout=5.0, max_queue=8):
+    return RequestScheduler(
+        total_slots=total_slots,
+        quotas={c: total_slots for c in PRIORITY_CLASSES},
+        timeouts={c: timeout for c in PRIORITY_CLASSES},
+        max_queue={c: max_queue for c in PRIORITY_CLASSES},
+        max_waiting=max_waiting,
+    )
+
+
+def waiting(scheduler, priority):
+    return scheduler.stats()["classes"][priority]["waiting"]
+
+
+def hold(scheduler, priority, release):
+    with scheduler.slot(priority):
+        release.wait()
+
+
+def test_higher_class_is_admitted_first():
+    scheduler = make_scheduler()
+    release = threading.Event()
+    holder, _ = in_thread(hold, scheduler, "routine", release)
+    wait_for(lambda: scheduler.stats()["classes"]["routine"]["running"] == 1)
+
+    order = []
+
+    def admit(priority):
+        with scheduler.slot(priority):
+            order.append(priority)
+
+    routine, _ = in_thread(admit, "routine")
+    wait_for(lambda: waiting(scheduler, "routine") == 1)
+    emergency, _ = in_thread(admit, "emergency")
+    wait_for(lambda: waiting(scheduler, "emergency") == 1)
+
+    release.set()
+    for thread in (holder, routine, emergency):
+        thread.join(5)
+    assert order == ["emergency", "routine"]
+
+
+def test_lower_class_is_shed_for_a_higher_one():
+    scheduler = make_scheduler(max_waiting=1)
+    release = threading.Event()
+    holder, _ = in_thread(hold, scheduler, "diagnostic", release)
+    wait_for(lambda: scheduler.stats()["classes"]["diagnostic"]["running"] == 1)
+
+    routine, routine_outcome = in_thread(hold, scheduler, "routine", release)
+    wait_for(lambda: waiting(scheduler, "routine") == 1)
+    emergency, emergency_outcome = in_thread(hold, scheduler, "emergency", release)
+
+    routine.join(5)
+    assert isinstance(routine_outcome.get("error"), Overloaded)
+    assert routine_outcome["error"].reason == "shed for a higher-priority request"
+
+    release.set()
+    for thread in (holder, emergency):
+        thread.join(5)
+    assert "error" not in emergency_outcome
+    assert scheduler.stats()["classes"]["routine"]["shed"] == 1
+
+
+def test_full_queue_rejects_the_newcomer_without_a_lower_class():
+    scheduler = make_scheduler(max_waiting=1)
+    release = threading.Event()
+    holder, _ = in_thread(hold, scheduler, "routine", release)
+    wait_for(lambda: scheduler.stats()["classes"]["routine"]["running"] == 1)
+    waiter, _ = in_thread(hold, scheduler, "routine", release)
+    wait_for(lambda: waiting(scheduler, "routine") == 1)
+
+    with pytest.raises(Overloaded, match="scheduler overloaded"):
+        with scheduler.slot("routine"):
+            pass
+    release.set()
+    holder.join(5)
+    waiter.join(5)
+
+
+def test_wait_is_bounded_by_the_class_timeout():
+    scheduler = make_scheduler(timeout=0.1)
+    release = threading.Event()
+    holder, _ = in_thread(hold, scheduler, "routine", release)
+    wait_for(lambda: scheduler.stats()["classes"]["routine"]["running"] == 1)
+
+    with pytest.raises(Overloaded, match="timed out"):
+        with scheduler.slot("navigation"):
+            pass
+    release.set()
+    holder.join(5)
+    assert scheduler.stats()["classes"]["navigation"]["timed_out"] == 1
+
+
+def test_emergency_is_not_starved_by_blocked_worker_threads():
+    """
+    Every running and waiting lower-class caller holds a worker thread. With the
+    pool sized above max_blocked(), as the app does at startup, an emergency
+    request still gets a thread, queues, and is admitted ahead of them.
+    """
+    scheduler = make_scheduler(total_slots=2, max_waiting=4)
+    release = threading.Event()
+    admitted = []
+
+    def call(priority):
+        try:
+            with scheduler.slot(priority):
+                admitted.append(priority)
+                if priority != "emergency":
+                    release.wait()
+        except Overloaded:
+            # The emergency request makes room by shedding a lower waiter
+            pass
+
+    async def main():
+        limiter = anyio.CapacityLimiter(scheduler.max_blocked() + 1)
+        run = partial(anyio.to_thread.run_sync, limiter=limiter)
+        lower = PRIORITY_CLASSES[1:]
+        async with anyio.create_task_group() as tg:
+            for i in range(scheduler.max_blocked()):
+                tg.start_soon(run, call, lower[i % len(lower)])
+            await anyio.to_thread.run_sync(wait_for, lambda: limiter.borrowed_tokens == scheduler.max_blocked())
+
+            tg.start_soon(run, call, "emergency")
+            await anyio.to_thread.run_sync(wait_for, lambda: waiting(scheduler, "emergency") == 1)
+            release.set()
+
+    anyio.run(main)
+    assert admitted.index("emergency") == scheduler.total_slots
+    assert len(admitted) == scheduler.max_blocked()
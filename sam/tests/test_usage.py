@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.usage import DOWNGRADED, NORMAL, OFFLINE, SHORTENED, RequestUsage, UsageLedger, current_request
+
+
+@pytest.fixture
+def scope():
+    scope = RequestUsage("/identify")
+    scope.session_id = "s1"
+    token = current_request.set(scope)
+    yield scope
+    current_request.reset(token)
+
+
+def spend(ledger, tokens=0, cost=0.0, organ="liver"):
+    usage = SimpleNamespace(input_tokens=tokens, output_tokens=0)
+    return ledger.record("identify", "smart", organ, usage, images=0, latency=0.1, cost=cost)
+
+
+@pytest.fixture
+def ledger():
+    return UsageLedger(session_token_budget=1000, soft_limit=0.7, downgrade_at=0.9, min_tokens=256)
+
+
+def test_under_soft_limit_plans_unchanged(ledger, scope):
+    spend(ledger, tokens=600)
+    assert ledger.plan("smart", 1024, "fast") == ("smart", 1024, NORMAL)
+    assert ledger.escalation_allowed()
+
+
+def test_soft_limit_shortens_max_tokens(ledger, scope):
+    spend(ledger, tokens=750)
+    tier, max_tokens, mode = ledger.plan("smart", 1024, "fast")
+    assert (tier, mode) == ("smart", SHORTENED)
+    # A quarter of the budget left out of the 0.3 above the soft limit
+    assert max_tokens == int(1024 * 0.25 / 0.3)
+    # Small calls are left alone
+    assert ledger.plan("smart", 200, "fast") == ("smart", 200, NORMAL)
+
+
+def test_downgrade_moves_to_cheapest_tier_without_escalation(ledger, scope):
+    spend(ledger, tokens=950)
+    tier, max_tokens, mode = ledger.plan("smart", 1024, "fast")
+    assert (tier, mode) == ("fast", DOWNGRADED)
+    assert max_tokens == 256
+    assert not ledger.escalation_allowed()
+
+
+def test_spent_session_budget_goes_offline(ledger, scope):
+    spend(ledger, tokens=1000)
+    assert ledger.plan("smart", 1024, "fast")[2] == OFFLINE
+    assert ledger.summary()["budget_modes"][OFFLINE] == 1
+
+
+def test_session_budget_is_per_session(ledger, scope):
+    spend(ledger, tokens=1000)
+    scope.session_id = "s2"
+    assert ledger.plan("smart", 1024, "fast")[2] == NORMAL
+
+
+def test_daily_cost_budget_applies_without_a_session():
+    ledger = UsageLedger(daily_cost_budget=1.0)
+    spend(ledger, cost=0.95)
+    assert ledger.plan("smart", 1024, "fast")[0] == "fast"
+    spend(ledger, cost=0.05)
+    assert ledger.plan("smart", 1024, "fast")[2] == OFFLINE
+
+
+def test_calls_are_attributed_to_request_session_and_organ(ledger, scope):
+    spend(ledger, tokens=100, cost=0.01, organ=["liver", "Heart"])
+    spend(ledger, tokens=50, cost=0.01, organ="liver")
+    assert scope.totals["calls"] == 2
+    assert scope.totals["input_tokens"] == 150
+
+    summary = ledger.summary(session_id="s1", organ="heart")
+    assert summary["session"]["input_tokens"] == 150
+    assert summary["organ"]["calls"] == 1
+    assert summary["by_organ"]["liver"]["calls"] == 2
+    assert summary["pressure"] == 0.15
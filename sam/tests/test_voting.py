@@ -0,0 +1,58 @@
+from src.voting import DetectionVoter, VotingEngine
+
+
+def test_stable_signal_needs_the_on_threshold():
+    voter = DetectionVoter(learning_rate=0.5)
+    # 0.5 -> 0.6, below the 0.65 on threshold
+    assert not voter.observe(True, 0.4, now=0.0)
+    # 0.6 -> 0.8
+    assert voter.observe(True, 1.0, now=0.0)
+
+
+def test_hysteresis_holds_until_the_off_threshold():
+    voter = DetectionVoter(learning_rate=0.5)
+    assert voter.observe(True, 1.0, now=0.0)
+    # 0.75 -> 0.375: a single contradicting frame does not flip it
+    assert voter.observe(False, 1.0, now=0.0)
+    # 0.375 -> 0.1875: below 0.35 it turns off
+    assert not voter.observe(False, 1.0, now=0.0)
+    # 0.1875 -> 0.59: still below the on threshold
+    assert not voter.observe(True, 1.0, now=0.0)
+
+
+def test_score_decays_towards_unknown():
+    voter = DetectionVoter(half_life=10.0, learning_rate=0.5)
+    voter.observe(True, 1.0, now=0.0)
+    assert voter.current_score(now=0.0) == 0.75
+    assert voter.current_score(now=10.0) == 0.625
+
+
+def test_upstream_skipped_only_for_confident_unchanged_frames():
+    voter = DetectionVoter(half_life=10.0, change_threshold=12, learning_rate=0.5)
+    frame = 0x0F0F0F0F0F0F0F0F
+    assert voter.needs_upstream(frame, now=0.0)
+
+    voter.observe(True, 1.0, frame_hash=frame, now=0.0)
+    # Same scene, a few bits of noise: the vote stands
+    assert not voter.needs_upstream(frame ^ 0b111, now=1.0)
+    # The probe moved: more than change_threshold bits differ
+    assert voter.needs_upstream(frame ^ 0xFFFF, now=1.0)
+    # Evidence decayed back into the uncertain band
+    assert voter.needs_upstream(frame, now=30.0)
+
+
+def test_engine_skips_the_call_and_counts_acquisitions():
+    engine = VotingEngine(learning_rate=0.5)
+    calls = []
+
+    def identify():
+        calls.append(1)
+        return True, 1.0
+
+    stable, score, upstream, raw = engine.decide("s1", "Liver", 0, identify)
+    assert (stable, upstream, raw) == (True, True, True)
+
+    stable, score, upstream, raw = engine.decide("s1", "liver", 0, identify)
+    assert (stable, upstream, raw) == (True, False, None)
+    assert len(calls) == 1
+    assert engine.stats() == {"decisions": 2, "upstream_skipped": 1, "acquisitions": 1, "calls_per_acquisition": 1.0}
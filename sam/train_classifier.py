@@ -0,0 +1,123 @@
+"""
+Train and evaluate the local organ classifier.
+
+Fits the softmax head on a labelled image folder, evaluates it on a
+held-out split and saves it where the API loads it from. Reports accuracy,
+the share of frames confident enough to skip the LLM (at the API's
+threshold) with their accuracy, and per-frame latency. With --base-url it
+also runs the held-out frames through the LLM identification path against
+a stand-in server and reports how often the two agree.
+
+Usage:
+    python train_classifier.py IMAGE_DIR [--base-url http://localhost:8080]
+
+IMAGE_DIR holds one sub-folder per organ (e.g. IMAGE_DIR/heart/*.png). The
+folder names are the labels and must be organs the app asks about
+(KNOWN_ORGANS in src/prompts.py); any other folder is reported, since the
+classifier can never answer a request for it.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from src.classifier import OrganClassifier, embed
+from src.prompts import KNOWN_ORGANS
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "organ_classifier.npz")
+
+
+def load_dataset(image_dir):
+    classes = sorted(d.lower() for d in os.listdir(image_dir) if os.path.isdir(os.path.join(image_dir, d)))
+    frames, labels = [], []
+    for folder in sorted(os.listdir(image_dir)):
+        path = os.path.join(image_dir, folder)
+        if not os.path.isdir(path):
+            continue
+        for name in sorted(os.listdir(path)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            gray = cv2.imread(os.path.join(path, name), cv2.IMREAD_GRAYSCALE)
+            if gray is not None:
+                frames.append(gray)
+                labels.append(classes.index(folder.lower()))
+    return classes, frames, np.array(labels, dtype=np.int64)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and evaluate the local organ classifier")
+    parser.add_argument("image_dir", help="Folder with one sub-folder of images per organ")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to save the trained model")
+    parser.add_argument("--test-split", type=float, default=0.2, help="Share of images held out for evaluation")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.9")))
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--base-url", help="Stand-in server for measuring agreement with the LLM")
+    args = parser.parse_args()
+
+    classes, frames, labels = load_dataset(args.image_dir)
+    if len(classes) < 2 or len(frames) < 10:
+        sys.exit(f"Need at least two organ folders and ten images in {args.image_dir}")
+    unknown = [c for c in classes if c not in KNOWN_ORGANS]
+    if unknown:
+        print(f"Folders that are not app organs ({', '.join(KNOWN_ORGANS)}): {', '.join(unknown)}", file=sys.stderr)
+
+    order = np.random.default_rng(args.seed).permutation(len(frames))
+    n_test = max(1, int(len(frames) * args.test_split))
+    test, train = order[:n_test], order[n_test:]
+
+    features = np.stack([embed(f) for f in frames])
+    model = OrganClassifier.fit(features[train], labels[train], classes, epochs=args.epochs)
+
+    # Latency of the full local path (embedding + prediction) per frame
+    latencies, probs = [], []
+    for i in test:
+        started = time.perf_counter()
+        probs.append(model.predict_proba(frames[i]))
+        latencies.append((time.perf_counter() - started) * 1000.0)
+    probs = np.stack(probs)
+    predicted = probs.argmax(axis=1)
+    confident = probs.max(axis=1) >= args.threshold
+    correct = predicted == labels[test]
+
+    report = {
+        "classes": classes,
+        "train": int(len(train)),
+        "test": int(len(test)),
+        "accuracy": round(float(correct.mean()), 3),
+        "per_class_accuracy": {
+            c: round(float(correct[labels[test] == k].mean()), 3) for k, c in enumerate(classes) if np.any(labels[test] == k)
+        },
+        "threshold": args.threshold,
+        "calls_avoided": round(float(confident.mean()), 3),
+        "confident_accuracy": round(float(correct[confident].mean()), 3) if confident.any() else None,
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "latency_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+    }
+
+    if args.base_url:
+        # Must be set before app is imported, which builds the client
+        os.environ["ANTHROPIC_BASE_URL"] = args.base_url
+        os.environ.setdefault("CLAUDE_API_KEY", "stand-in")
+        from app import identify_with_confidence
+
+        agreed = 0
+        for row, i in enumerate(test):
+            organ = classes[labels[i]]
+            found, _ = identify_with_confidence(cv2.cvtColor(frames[i], cv2.COLOR_GRAY2BGR), organ)
+            agreed += found == (predicted[row] == labels[i])
+        report["llm_agreement"] = round(agreed / len(test), 3)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    model.save(args.output)
+    report["saved_to"] = args.output
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Validate the model router against a local stand-in server.
+
+Runs identification over a labelled image folder through the same routing
+path as the API and reports accuracy, escalation rate, and per-tier latency
+and token spend.
+
+Usage:
+    python validate_router.py IMAGE_DIR --base-url http://localhost:8080
+
+IMAGE_DIR holds one sub-folder per organ (e.g. IMAGE_DIR/heart/*.png). Every
+image is checked against every organ folder name, so each image contributes
+one positive and several negative cases.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate tiered model routing against a stand-in server")
+    parser.add_argument("image_dir", help="Folder with one sub-folder of images per organ")
+    parser.add_argument("--base-url", default="http://localhost:8080", help="Anthropic-compatible stand-in server")
+    parser.add_argument("--config", help="Routing config to validate (defaults to config/routing.json)")
+    args = parser.parse_args()
+
+    # Must be set before app is imported, which builds the client and router
+    os.environ["ANTHROPIC_BASE_URL"] = args.base_url
+    os.environ.setdefault("CLAUDE_API_KEY", "stand-in")
+    if args.config:
+        os.environ["ROUTING_CONFIG"] = args.config
+
+    import cv2
+    from app import identify_with_confidence, router
+
+    organs = sorted(d for d in os.listdir(args.image_dir) if os.path.isdir(os.path.join(args.image_dir, d)))
+    if not organs:
+        sys.exit(f"No organ folders found in {args.image_dir}")
+
+    cases = correct = 0
+    started = time.perf_counter()
+    for label in organs:
+        folder = os.path.join(args.image_dir, label)
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            img = cv2.imread(os.path.join(folder, name))
+            if img is None:
+                continue
+            for organ in organs:
+                found, confidence = identify_with_confidence(img, organ)
+                cases += 1
+                correct += found == (organ == label)
+
+    elapsed = time.perf_counter() - started
+    tiers = router.stats()
+    escalations = sum(t["escalations_in"] for t in tiers.values())
+    print(json.dumps({
+        "cases": cases,
+        "accuracy": round(correct / cases, 3) if cases else None,
+        "escalation_rate": round(escalations / cases, 3) if cases else None,
+        "elapsed_s": round(elapsed, 1),
+        "tiers": tiers,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
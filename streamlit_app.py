@@ -2,10 +2,16 @@ import streamlit as st
 import requests
 from PIL import Image
 import io
+import os
 import time
 import json
+import uuid
+from collections import OrderedDict, deque
 from typing import List, Dict, Any, Optional
 
+# Start of this rerun, for the rerun-time measurement at the end of the script
+RERUN_STARTED = time.perf_counter()
+
 # Configure the page - MUST BE FIRST STREAMLIT COMMAND
 st.set_page_config(
     page_title="Space Triage: AI-Guided Ultrasound",
@@ -19,97 +25,130 @@ BASE_URL = "https://space-triage-199983032721.us-central1.run.app"
 IDENTIFY_API = f"{BASE_URL}/identify"
 NAVIGATE_API = f"{BASE_URL}/navigate"
 DESCRIBE_API = f"{BASE_URL}/describe"
+IMAGES_API = f"{BASE_URL}/images"
+SWEEP_API = f"{BASE_URL}/sweep"
+CHAT_API = f"{BASE_URL}/chat"
+JOBS_API = f"{BASE_URL}/jobs"
 
-# Add CSS for the days label
-st.markdown("""
-    <style>
-    .health-chain-container {
-        display: flex;
-        align-items: center;
-        gap: 15px;
-        margin: 10px 0;
-    }
-    
-    .days-label {
-        color: white;
-        font-size: 14px;
-        font-weight: 500;
-        text-shadow: 1px 1px 2px rgba(0, 0, 0, 0.3);
-        min-width: 45px;
-    }
-    
-    .health-chain {
-        display: flex;
-        gap: 4px;
-        align-items: center;
-        background: rgba(0, 0, 0, 0.3);
-        padding: 15px;
-        border-radius: 20px;
-        justify-content: flex-start;
-        overflow-x: auto;
-        min-height: 50px;
-        flex-grow: 1;
-    }
-    </style>
-""", unsafe_allow_html=True)
+# Bounds on what one session keeps in memory: only the active frame is kept at
+# full resolution, earlier uploads as a limited number of small thumbnails
+MAX_MESSAGES = 200
+MESSAGES_PAGE = 20
+MAX_THUMBNAILS = 20
+THUMBNAIL_SIZE = 256
+STYLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "styles.css")
+# Optional JSON-lines file receiving one record per rerun (stage, rerun time, RSS)
+PERF_LOG = os.getenv("STREAMLIT_PERF_LOG")
 
-def display_health_history(organ_name):
-    """Display a chain of health status for the past 7 days and future days up to 30 days total"""
-    # Mock data - in real app, this would come from your database
-    mock_history = {
-        "Liver": ["green", "yellow", "red", "green", "green", "yellow", "red"],
-        "Kidneys": ["green", "green", "yellow", "green", "green", "green", "green"],
-        "Pancreas": ["yellow", "yellow", "green", "green", "yellow", "green", "green"],
-        "Breasts": ["green", "green", "green", "yellow", "green", "green", "yellow"],
-        "Thyroid": ["yellow", "red", "red", "yellow", "yellow", "yellow", "red"],
-        "Heart": ["green", "green", "yellow", "green", "green", "green", "green"],
-        "Lungs": ["green", "yellow", "green", "green", "green", "yellow", "green"]
+# All page styles live in static/styles.css, read once per process and injected
+# once per full rerun (fragment reruns skip it)
+@st.cache_resource
+def page_styles():
+    with open(STYLES_PATH) as f:
+        return f"<style id=\"space-triage-styles\">{f.read()}</style>"
+
+st.markdown(page_styles(), unsafe_allow_html=True)
+
+# Mock data - in real app, this would come from your database
+MOCK_HISTORY = {
+    "Liver": ["green", "yellow", "red", "green", "green", "yellow", "red"],
+    "Kidneys": ["green", "green", "yellow", "green", "green", "green", "green"],
+    "Pancreas": ["yellow", "yellow", "green", "green", "yellow", "green", "green"],
+    "Bladder": ["green", "green", "green", "yellow", "green", "green", "yellow"],
+    "Thyroid": ["yellow", "red", "red", "yellow", "yellow", "yellow", "red"],
+    "Heart": ["green", "green", "yellow", "green", "green", "green", "green"],
+    "Lungs": ["green", "yellow", "green", "green", "green", "yellow", "green"]
+}
+
+@st.cache_resource
+def daily_reports():
+    """Mock daily reports, built once per process and only read afterwards"""
+    return {
+        str(i): {
+            "date": f"2024-03-{i:02d}",
+            "status": "healthy" if i % 3 != 0 else "unhealthy",
+            "notes": "Regular checkup completed" if i % 3 != 0 else "Some concerns noted",
+            "vitals": {
+                "heart_rate": f"{60 + i}",
+                "blood_pressure": f"120/{70 + i}",
+                "temperature": f"{36.5 + i/10:.1f}",
+            },
+            "recommendations": [
+                "Continue regular monitoring",
+                "Maintain exercise routine" if i % 3 != 0 else "Schedule follow-up",
+                "Stay hydrated"
+            ],
+            "alerts": [] if i % 3 != 0 else ["Elevated readings detected"]
+        } for i in range(1, 31)
     }
-    
-    # Mock daily reports data
-    if "daily_reports" not in st.session_state:
-        st.session_state.daily_reports = {
-            str(i): {
-                "date": f"2024-03-{i:02d}",
-                "status": "healthy" if i % 3 != 0 else "unhealthy",
-                "notes": "Regular checkup completed" if i % 3 != 0 else "Some concerns noted",
-                "vitals": {
-                    "heart_rate": f"{60 + i}",
-                    "blood_pressure": f"120/{70 + i}",
-                    "temperature": f"{36.5 + i/10:.1f}",
-                },
-                "recommendations": [
-                    "Continue regular monitoring",
-                    "Maintain exercise routine" if i % 3 != 0 else "Schedule follow-up",
-                    "Stay hydrated"
-                ],
-                "alerts": [] if i % 3 != 0 else ["Elevated readings detected"]
-            } for i in range(1, 31)
-        }
-    
-    history = mock_history.get(organ_name, ["green"] * 7)
-    future_days = ["inactive"] * 23
-    all_statuses = history + future_days
-    days = [str(i) for i in range(1, 31)]
+
+@st.cache_data
+def health_chain_html(organ_name):
+    """HTML of an organ's 30-day health chain, rendered once per organ"""
+    history = MOCK_HISTORY.get(organ_name, ["green"] * 7)
+    all_statuses = history + ["inactive"] * 23
     
     # Create the chain HTML with the days label - using compact format
-    chain_html = '<div class="health-chain-container"><div class="days-label">Days</div><div class="health-chain">'
-    
-    for i, (day, status) in enumerate(zip(days, all_statuses)):
+    days_html = []
+    for i, status in enumerate(all_statuses):
+        day = str(i + 1)
         current_class = " current" if i == 6 else ""
         if status == "inactive":
-            chain_html += f'<div class="health-day health-{status}{current_class}" title="Day {day}: No data" onclick="handleDayClick(\'{day}\')" style="cursor: pointer;">{day}</div>'
+            status_text = "No data"
         else:
             status_text = "Healthy" if status == "green" else "Warning" if status == "yellow" else "Critical"
-            chain_html += f'<div class="health-day health-{status}{current_class}" title="Day {day}: {status_text}" onclick="handleDayClick(\'{day}\')" style="cursor: pointer;">{day}</div>'
-    
-    chain_html += '</div></div>'
+        days_html.append(f'<div class="health-day health-{status}{current_class}" title="Day {day}: {status_text}" onclick="handleDayClick(\'{day}\')" style="cursor: pointer;">{day}</div>')
     
     # Add JavaScript for handling clicks
     js_code = '<script>function handleDayClick(day) {window.parent.postMessage({type: "streamlit:setComponentValue", value: day}, "*");}</script>'
-    
-    # Render the chain and JavaScript
-    st.markdown(chain_html + js_code, unsafe_allow_html=True)
+    return (
+        '<div class="health-chain-container"><div class="days-label">Days</div><div class="health-chain">'
+        + "".join(days_html) + '</div></div>' + js_code
+    )
+
+@st.cache_data
+def organ_cards_html(date, status, notes, alerts, recommendations):
+    """HTML of the status, alerts and recommendations cards, rendered once per distinct record"""
+    status_html = f"""
+        <div class="organ-card">
+            <h3>Status Overview</h3>
+            <p><strong>Latest Check:</strong> {date}</p>
+            <p><strong>Status:</strong> 
+                <span class="status-{status}">
+                    {status.upper()}
+                </span>
+            </p>
+        </div>
+    """
+    
+    alerts_html = ['<div class="organ-card"><h3>⚠️ Active Alerts</h3>']
+    # Add notes if they exist
+    if notes:
+        alerts_html.append(f'<p class="organ-notes">{notes}</p>')
+    # Add alerts if they exist
+    if alerts:
+        alerts_html.append('<ul class="alert-list">' + "".join(f'<li class="alert-item">{a}</li>' for a in alerts) + '</ul>')
+    elif not notes:  # If no alerts and no notes
+        alerts_html.append('<p class="no-alerts">No active alerts</p>')
+    alerts_html.append("</div>")
+    
+    recommendations_html = (
+        '<div class="organ-card"><h3>Recommendations</h3><p>Based on your latest assessment:</p><ul>'
+        + "".join(f"<li>{rec}</li>" for rec in recommendations)
+        + '</ul></div>'
+    )
+    return status_html, "".join(alerts_html), recommendations_html
+
+def display_organ_cards(date, status, notes, alerts, recommendations):
+    """Show the three organ cards side by side"""
+    cards = organ_cards_html(date, status, notes, tuple(alerts), tuple(recommendations))
+    for column, card in zip(st.columns([1, 1, 1]), cards):
+        with column:
+            st.markdown(card, unsafe_allow_html=True)
+
+def display_health_history(organ_name):
+    """Display a chain of health status for the past 7 days and future days up to 30 days total"""
+    st.markdown(health_chain_html(organ_name), unsafe_allow_html=True)
     
     # Handle day selection using session state
     if "selected_day" not in st.session_state:
@@ -120,148 +159,16 @@ def display_health_history(organ_name):
         st.session_state.selected_day = selected_day
         
     # Show day's dashboard if a day is selected
-    if st.session_state.selected_day and st.session_state.selected_day in st.session_state.daily_reports:
-        report = st.session_state.daily_reports[st.session_state.selected_day]
-        
-        # Create three columns for the dashboard cards
-        col1, col2, col3 = st.columns([1, 1, 1])
-        
-        with col1:
-            # Status Overview Card
-            st.markdown(f"""
-                <div class="organ-card">
-                    <h3>Status Overview</h3>
-                    <p><strong>Latest Check:</strong> {report['date']}</p>
-                    <p><strong>Status:</strong> 
-                        <span class="status-{report['status']}">
-                            {report['status'].upper()}
-                        </span>
-                    </p>
-                </div>
-            """, unsafe_allow_html=True)
+    reports = daily_reports()
+    if st.session_state.selected_day and st.session_state.selected_day in reports:
+        report = reports[st.session_state.selected_day]
+        display_organ_cards(report["date"], report["status"], report["notes"], report["alerts"], report.get("recommendations", []))
         
-        with col2:
-            # Active Alerts
-            alerts_html = """
-                <div class="organ-card">
-                    <h3>⚠️ Active Alerts</h3>
-            """
-            
-            # Add notes if they exist
-            if report['notes']:
-                alerts_html += f'<p class="organ-notes">{report["notes"]}</p>'
-            
-            # Add alerts if they exist
-            if report['alerts']:
-                alerts_html += '<ul class="alert-list">'
-                for alert in report['alerts']:
-                    alerts_html += f'<li class="alert-item">{alert}</li>'
-                alerts_html += '</ul>'
-            elif not report['notes']:  # If no alerts and no notes
-                alerts_html += '<p class="no-alerts">No active alerts</p>'
-            
-            alerts_html += "</div>"
-            st.markdown(alerts_html, unsafe_allow_html=True)
-        
-        with col3:
-            # Recommendations
-            recommendations_html = """
-                <div class="organ-card">
-                    <h3>Recommendations</h3>
-                    <p>Based on your latest assessment:</p>
-                    <ul>
-            """
-            for rec in report.get('recommendations', []):
-                recommendations_html += f"<li>{rec}</li>"
-            recommendations_html += """
-                    </ul>
-                </div>
-            """
-            st.markdown(recommendations_html, unsafe_allow_html=True)
-        
-        # Add a close button
-        if st.button("Close Report", key=f"close_report_{st.session_state.selected_day}"):
+        # Add a close button; only the dashboard fragment needs to rerun
+        if st.button("Close Report", key=f"close_report_{organ_name}_{st.session_state.selected_day}"):
             st.session_state.selected_day = None
             st.query_params.clear()
-            st.rerun()
-
-# Add CSS for the report summary
-st.markdown("""
-    <style>
-    /* Report Summary Styling */
-    .report-summary {
-        background: rgba(255, 255, 255, 0.95);
-        border-radius: 15px;
-        padding: 2rem;
-        margin: 1rem 0;
-        box-shadow: 0 4px 10px rgba(0, 0, 0, 0.1);
-    }
-    
-    .report-header {
-        border-bottom: 1px solid #eee;
-        margin-bottom: 1.5rem;
-        padding-bottom: 1rem;
-    }
-    
-    .report-header h3 {
-        color: #2D3748;
-        margin: 0;
-        font-size: 1.5rem;
-    }
-    
-    .report-date {
-        color: #718096;
-        margin: 0.5rem 0 0 0;
-        font-size: 0.9rem;
-    }
-    
-    .report-section {
-        margin-bottom: 1.5rem;
-    }
-    
-    .report-section h4 {
-        color: #4A5568;
-        margin-bottom: 0.5rem;
-        font-size: 1.1rem;
-    }
-    
-    .report-section ul {
-        list-style-type: none;
-        padding: 0;
-        margin: 0;
-    }
-    
-    .report-section ul li {
-        margin-bottom: 0.5rem;
-        color: #4A5568;
-    }
-    
-    .report-section.alerts {
-        background: rgba(254, 226, 226, 0.5);
-        padding: 1rem;
-        border-radius: 8px;
-        border-left: 4px solid #EF4444;
-    }
-    
-    .report-section.alerts h4 {
-        color: #DC2626;
-    }
-    
-    .report-section.alerts ul li {
-        color: #B91C1C;
-    }
-    
-    .health-day {
-        cursor: pointer;
-        transition: transform 0.2s ease, box-shadow 0.2s ease;
-    }
-    
-    .health-day:hover {
-        transform: scale(1.1);
-        box-shadow: 0 0 15px rgba(255, 255, 255, 0.4);
-    }
-    </style>
-""", unsafe_allow_html=True)
+            st.rerun(scope="fragment")
 
 # Custom functions
 def image_to_bytes(uploaded_image):
@@ -269,17 +176,119 @@ def image_to_bytes(uploaded_image):
     if uploaded_image is None:
         return None
     
-    img = Image.open(uploaded_image)
+    img = Image.open(uploaded_image).convert("RGB")
     buf = io.BytesIO()
     img.save(buf, format="JPEG")
     return buf.getvalue()
 
+def make_thumbnail(image_bytes):
+    """Return a small JPEG preview of an image"""
+    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=70)
+    return buf.getvalue()
+
+def store_thumbnail(image_bytes):
+    """Keep a preview in the bounded per-session store and return its key"""
+    thumbnails = st.session_state.thumbnails
+    key = uuid.uuid4().hex
+    thumbnails[key] = make_thumbnail(image_bytes)
+    while len(thumbnails) > MAX_THUMBNAILS:
+        thumbnails.popitem(last=False)
+    return key
+
+def add_message(message):
+    """Append a chat message, forgetting the oldest beyond MAX_MESSAGES"""
+    messages = st.session_state.messages
+    messages.append(message)
+    if len(messages) > MAX_MESSAGES:
+        del messages[:len(messages) - MAX_MESSAGES]
+
+def upload_key(uploaded_file):
+    """Identify an upload across reruns without keeping the file object"""
+    return getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+
+def process_rss_mb():
+    """Resident memory of the Streamlit process in MB (shared by all sessions)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def session_state_bytes():
+    """Approximate bytes held by this session's messages and images"""
+    total = sum(len(m.get("content") or "") for m in st.session_state.get("messages", []))
+    total += sum(len(t) for t in st.session_state.get("thumbnails", {}).values())
+    total += len(st.session_state.get("active_image") or b"")
+    return total
+
+def record_rerun(scope="app", started=RERUN_STARTED):
+    """Record the duration and memory of a full rerun ("app") or of a fragment's, and append it to PERF_LOG if set"""
+    record = {
+        "scope": scope,
+        "stage": st.session_state.get("current_stage"),
+        "rerun_ms": round((time.perf_counter() - started) * 1000.0, 1),
+        "rss_mb": process_rss_mb(),
+        "session_bytes": session_state_bytes(),
+        "images": st.session_state.get("images_uploaded", 0),
+        "messages": len(st.session_state.get("messages", [])),
+    }
+    st.session_state.rerun_times.append(record)
+    if PERF_LOG:
+        with open(PERF_LOG, "a") as f:
+            f.write(json.dumps({"session_id": st.session_state.get("session_id"), **record}) + "\n")
+
+def display_performance():
+    """Rerun time and memory of this session's previous full and fragment reruns"""
+    records = list(st.session_state.rerun_times)
+    with st.expander("⏱️ Performance"):
+        if not records:
+            st.caption("No reruns measured yet")
+            return
+        for scope in ("app", "dashboard", "chat"):
+            times = sorted(r["rerun_ms"] for r in records if r["scope"] == scope)
+            if times:
+                st.caption(
+                    f"{scope.capitalize()} reruns: {len(times)} | median {times[len(times) // 2]:.0f} ms | "
+                    f"p95 {times[min(len(times) - 1, int(len(times) * 0.95))]:.0f} ms"
+                )
+        latest = records[-1]
+        rss = f"{latest['rss_mb']:.0f} MB" if latest["rss_mb"] is not None else "n/a"
+        st.caption(
+            f"Images: {latest['images']} | session state: {latest['session_bytes'] / 1024:.0f} KB | process RSS: {rss}"
+        )
+
+def register_image(image_bytes):
+    """Upload the current image once and return its server-side ID (None if unavailable)"""
+    if st.session_state.get("image_id") is None:
+        try:
+            files = {"image": ("image.jpg", image_bytes, "image/jpeg")}
+            response = requests.post(IMAGES_API, files=files)
+            response.raise_for_status()
+            st.session_state.image_id = response.json()["image_id"]
+        except Exception:
+            return None
+    return st.session_state.image_id
+
+def post_image_request(url, data, image_bytes):
+    """POST to an image endpoint, referring to the registered image by ID when possible"""
+    image_id = register_image(image_bytes)
+    if image_id:
+        response = requests.post(url, data={**data, "image_id": image_id})
+        if response.status_code != 404:
+            return response
+        # Expired on the server: forget the ID and send the bytes instead
+        st.session_state.image_id = None
+    files = {"image": ("image.jpg", image_bytes, "image/jpeg")}
+    return requests.post(url, files=files, data=data)
+
 def call_identify_api(image_bytes, target_organ):
     """Call the identify API endpoint with an image and organ name"""
     try:
-        files = {"image": ("image.jpg", image_bytes, "image/jpeg")}
-        data = {"entity_name": target_organ}
-        response = requests.post(IDENTIFY_API, files=files, data=data)
+        data = {"entity_name": target_organ, "session_id": st.session_state.session_id}
+        response = post_image_request(IDENTIFY_API, data, image_bytes)
         return response.json()
     except Exception as e:
         st.error(f"Error calling identify API: {e}")
@@ -288,11 +297,10 @@ def call_identify_api(image_bytes, target_organ):
 def call_navigate_api(image_bytes, target_organ):
     """Call the navigate API endpoint with image and entity name"""
     try:
-        files = {"image": ("image.jpg", image_bytes, "image/jpeg")}
-        data = {"entity_name": target_organ}
+        data = {"entity_name": target_organ, "session_id": st.session_state.session_id}
         
-        # Send entity_name as form data and the image file
-        response = requests.post(NAVIGATE_API, files=files, data=data)
+        # Send entity_name as form data and the image (or its registered ID)
+        response = post_image_request(NAVIGATE_API, data, image_bytes)
         return response.json()
     except Exception as e:
         st.error(f"Error calling navigate API: {e}")
@@ -301,22 +309,136 @@ def call_navigate_api(image_bytes, target_organ):
 def call_description_api(image_bytes, target_organ):
     """Call the describe API endpoint with an image"""
     try:
-        files = {"image": ("image.jpg", image_bytes, "image/jpeg")}
-        data = {"target_organ": target_organ}
-        response = requests.post(DESCRIBE_API, files=files, data=data)
+        data = {"target_organ": target_organ, "session_id": st.session_state.session_id}
+        response = post_image_request(DESCRIBE_API, data, image_bytes)
         return response.json()
     except Exception as e:
         st.error(f"Error calling describe API: {e}")
         return {"description": "Error occurred during diagnosis.", "error": str(e)}
 
+def call_sweep_api(uploaded_files, organs):
+    """Check all organs in one or more images with a single sweep call"""
+    try:
+        files = [("images", (f.name, f.getvalue(), f.type or "image/jpeg")) for f in uploaded_files]
+        response = requests.post(SWEEP_API, files=files, data={"organs": ",".join(organs)})
+        return response.json()
+    except Exception as e:
+        st.error(f"Error calling sweep API: {e}")
+        return {"organs": {}, "error": str(e)}
+
+def call_chat_api(question):
+    """Ask a follow-up question; the backend keeps the conversation and the session's image"""
+    try:
+        data = {
+            "session_id": st.session_state.session_id,
+            "message": question,
+            "target_organ": st.session_state.target_organ,
+        }
+        if st.session_state.get("image_id"):
+            data["image_id"] = st.session_state.image_id
+        response = requests.post(CHAT_API, data=data)
+        if response.status_code == 404:
+            # The image expired on the server: ask without it
+            data.pop("image_id", None)
+            response = requests.post(CHAT_API, data=data)
+        if response.status_code == 503:
+            return {"response": "📡 The link to the analysis service is down. Please ask again in a moment."}
+        if response.status_code == 429:
+            return {"response": "⏸️ The usage budget for follow-up questions is spent. Please contact the flight surgeon if you need more help."}
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        st.error(f"Error calling chat API: {e}")
+        return {"response": "Error occurred while answering your question.", "error": str(e)}
+
+def start_navigation_prefetch(image_bytes, target_organ):
+    """Queue navigation guidance speculatively, so it is ready if the organ turns out not to be in view"""
+    image_id = register_image(image_bytes)
+    if not image_id:
+        return None
+    try:
+        data = {
+            "kind": "navigate",
+            "organ": target_organ,
+            "image_id": image_id,
+            "speculative": "true",
+            "session_id": st.session_state.session_id,
+        }
+        response = requests.post(JOBS_API, data=data, timeout=10)
+        response.raise_for_status()
+        # None when the backend declines speculative work (e.g. near the usage budget)
+        return response.json().get("job_id")
+    except Exception:
+        return None
+
+def discard_navigation_prefetch():
+    """Tell the backend the prefetched guidance is not needed"""
+    job_id = st.session_state.get("nav_prefetch_job")
+    st.session_state.nav_prefetch_job = None
+    if job_id:
+        try:
+            requests.delete(f"{JOBS_API}/{job_id}", timeout=10)
+        except Exception:
+            pass
+
+def fetch_navigation_prefetch():
+    """Return the prefetched navigation result, waiting for it if it is still running (None if unavailable)"""
+    job_id = st.session_state.get("nav_prefetch_job")
+    if not job_id:
+        return None
+    try:
+        job = requests.get(f"{JOBS_API}/{job_id}", params={"wait": 60}).json()
+    except Exception:
+        job = {}
+    if job.get("status") == "done":
+        st.session_state.nav_prefetch_job = None
+        return job["result"]
+    # Failed or still not finished: give it up and ask directly
+    discard_navigation_prefetch()
+    return None
+
+def offline_notice(response):
+    """Explain a response that was queued because the analysis link is down"""
+    if not response.get("queued"):
+        return "No result available"
+    return (
+        "📡 The link to the analysis service is down. Your scan has been queued and will be "
+        f"analysed automatically when the link returns (local image quality score: {response.get('quality', 'n/a')})."
+    )
+
+def partial_view_hint(organ, bbox):
+    """Short probe adjustment for an organ that is only partly in view, based on its bounding box"""
+    if not bbox:
+        return f"🔎 The {organ} is only partly in view. Slowly sweep the probe around its current position and upload a new image."
+    center_x = bbox["x"] + bbox["width"] / 2
+    center_y = bbox["y"] + bbox["height"] / 2
+    directions = []
+    if center_x < 0.4:
+        directions.append("left")
+    elif center_x > 0.6:
+        directions.append("right")
+    if center_y < 0.4:
+        directions.append("towards the top of the image")
+    elif center_y > 0.6:
+        directions.append("towards the bottom of the image")
+    where = " and ".join(directions) or "near the edge of the view"
+    return (
+        f"🔎 The {organ} is partly visible, {where}. Slide the probe slightly in that direction "
+        "so the whole organ is in view, then upload a new image."
+    )
+
 def process_image_flow():
     """Process the uploaded image through the flow based on current stage"""
-    if st.session_state.uploaded_image is None:
+    if st.session_state.active_image is None:
         return
     
-    image_bytes = image_to_bytes(st.session_state.uploaded_image)
+    image_bytes = st.session_state.active_image
     
     if st.session_state.current_stage == "identify":
+        # Navigation is prefetched while identification runs, and discarded if it is not needed
+        discard_navigation_prefetch()
+        st.session_state.nav_prefetch_job = start_navigation_prefetch(image_bytes, st.session_state.target_organ)
+        
         # Call identify API
         with st.spinner("Analyzing image..."):
             response = call_identify_api(
@@ -324,31 +446,45 @@ def process_image_flow():
                 st.session_state.target_organ
             )
             
-        if response.get("found", False):
-            st.session_state.messages.append({"role": "assistant", "content": f"✅ The {response.get('entity', 'target organ')} has been successfully identified in the image."})
+        if response.get("queued"):
+            # Link to the analysis service is down: the scan waits in the backend's outbox
+            add_message({"role": "assistant", "content": offline_notice(response)})
+            st.session_state.current_stage = "wait_for_new_image"
+            discard_navigation_prefetch()
+
+        # Prefer the backend's debounced signal over the single-frame result
+        elif response.get("stable_found", response.get("found", False)):
+            add_message({"role": "assistant", "content": f"✅ The {response.get('entity', 'target organ')} has been successfully identified in the image."})
             st.session_state.current_stage = "describe"
+            discard_navigation_prefetch()
             
             # Move directly to description
             with st.spinner("Generating diagnosis..."):
                 description_response = call_description_api(image_bytes, st.session_state.target_organ)
                 st.session_state.description_response = description_response
                 
-            diagnosis_text = description_response.get("description", "No diagnosis available")
-            st.session_state.messages.append({"role": "assistant", "content": f"🔬 **Diagnosis Results**:\n\n{diagnosis_text}"})
+            diagnosis_text = description_response.get("description") or offline_notice(description_response)
+            add_message({"role": "assistant", "content": f"🔬 **Diagnosis Results**:\n\n{diagnosis_text}"})
+
+        elif response.get("visibility") == "partial" and response.get("image_quality") != "poor":
+            # Partly in view: a local nudge from the bounding box replaces the navigation round trip
+            add_message({"role": "assistant", "content": partial_view_hint(st.session_state.target_organ, response.get("bbox"))})
+            st.session_state.current_stage = "wait_for_new_image"
+            discard_navigation_prefetch()
             
         else:
-            st.session_state.messages.append({"role": "assistant", "content": f"❌ I couldn't clearly identify the {st.session_state.target_organ} in this image. Would you like me to help you navigate to get a better view?"})
+            add_message({"role": "assistant", "content": f"❌ I couldn't clearly identify the {st.session_state.target_organ} in this image. Would you like me to help you navigate to get a better view?"})
             st.session_state.needs_navigation = True
             st.session_state.current_stage = "ask_navigation"
     
     elif st.session_state.current_stage == "navigate":
-        # Call navigate API with image and entity name
+        # Use the guidance prefetched during identification, or call the navigate API with image and entity name
         with st.spinner("Generating navigation guidance..."):
-            response = call_navigate_api(image_bytes, st.session_state.target_organ)
+            response = fetch_navigation_prefetch() or call_navigate_api(image_bytes, st.session_state.target_organ)
             st.session_state.navigate_response = response
             
-        navigation_text = response.get("response", "No navigation guidance available")
-        st.session_state.messages.append({"role": "assistant", "content": f"🧭 **Navigation Guidance**:\n\n{navigation_text}\n\nPlease adjust your probe following these instructions and upload a new image when ready."})
+        navigation_text = response.get("response") or offline_notice(response)
+        add_message({"role": "assistant", "content": f"🧭 **Navigation Guidance**:\n\n{navigation_text}\n\nPlease adjust your probe following these instructions and upload a new image when ready."})
         st.session_state.current_stage = "wait_for_new_image"
     
     elif st.session_state.current_stage == "describe":
@@ -357,42 +493,44 @@ def process_image_flow():
             response = call_description_api(image_bytes, st.session_state.target_organ)
             st.session_state.description_response = response
             
-        diagnosis_text = response.get("description", "No diagnosis available")
-        st.session_state.messages.append({"role": "assistant", "content": f"🔬 **Diagnosis Results**:\n\n{diagnosis_text}"})
+        diagnosis_text = response.get("description") or offline_notice(response)
+        add_message({"role": "assistant", "content": f"🔬 **Diagnosis Results**:\n\n{diagnosis_text}"})
         st.session_state.current_stage = "chat"  # Move to open chat for follow-up questions
 
 def handle_user_input(user_input):
     """Process text input from the user"""
     if user_input:
         # Add user message to chat
-        st.session_state.messages.append({"role": "user", "content": user_input})
+        add_message({"role": "user", "content": user_input})
         
         # Handle user response based on current stage
         if st.session_state.current_stage == "ask_navigation" and st.session_state.needs_navigation:
             if "yes" in user_input.lower() or "sure" in user_input.lower() or "ok" in user_input.lower():
                 st.session_state.current_stage = "navigate"
-                st.session_state.messages.append({"role": "assistant", "content": "I'll help you navigate to get a better view. Processing your current image..."})
+                add_message({"role": "assistant", "content": "I'll help you navigate to get a better view. Processing your current image..."})
                 process_image_flow()
             else:
-                st.session_state.messages.append({"role": "assistant", "content": "Please upload a different image that shows the target organ more clearly."})
+                discard_navigation_prefetch()
+                add_message({"role": "assistant", "content": "Please upload a different image that shows the target organ more clearly."})
                 st.session_state.current_stage = "wait_for_new_image"
         
         # If we're in chat mode (after diagnosis), respond to follow-up questions
         elif st.session_state.current_stage == "chat":
-            # Here you could integrate with an LLM to answer follow-up questions
-            # For now we'll use a simple response
-            st.session_state.messages.append({
-                "role": "assistant", 
-                "content": "Thank you for your question. To provide a more detailed answer, I would need to connect to a medical knowledge base. Is there something specific about the diagnosis you'd like to know more about?"
-            })
+            # Only the question is sent: the backend holds the conversation so far
+            with st.spinner("Thinking..."):
+                response = call_chat_api(user_input)
+            add_message({"role": "assistant", "content": response.get("response")})
 
 def restart_session():
     """Reset the session state to start over"""
+    discard_navigation_prefetch()
     for key in list(st.session_state.keys()):
         del st.session_state[key]
     st.session_state.messages = []
+    st.session_state.session_id = uuid.uuid4().hex
     st.session_state.current_stage = "initial"
-    st.session_state.uploaded_image = None
+    st.session_state.active_image = None
+    st.session_state.uploaded_image_key = None
     st.session_state.needs_navigation = False
     st.session_state.navigate_response = None
     st.session_state.description_response = None
@@ -400,429 +538,138 @@ def restart_session():
     st.session_state.target_organ = ""
     st.rerun()
 
-# Custom CSS for better styling
-st.markdown("""
-    <style id="space-triage-styles">
-    /* Main background */
-    .stApp {
-        background-image: url('https://images.unsplash.com/photo-1451187580459-43490279c0fa?ixlib=rb-1.2.1&auto=format&fit=crop&w=1950&q=80');
-        background-size: cover;
-        background-position: center;
-        background-attachment: fixed;
-    }
-    
-    /* Welcome page container */
-    .welcome-container {
-        max-width: 800px;
-        margin: 0 auto;
-        padding: 2rem;
-        text-align: center;
-    }
-    
-    /* Text background container */
-    .text-background {
-        background: rgba(0, 0, 0, 0.7);
-        padding: 2rem;
-        border-radius: 15px;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.3);
-        backdrop-filter: blur(5px);
-        margin-bottom: 2rem;
-    }
-    
-    /* Welcome header */
-    .welcome-header {
-        text-align: center;
-        padding: 1rem 0;
-        color: #FFFFFF !important;
-        font-size: 2.5rem;
-        font-weight: bold;
-        text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.3);
-        margin: 0;
-    }
-    
-    /* Welcome message */
-    .welcome-message {
-        font-size: 1.2rem;
-        color: #FFFFFF !important;
-        line-height: 1.6;
-        margin: 0;
-        text-shadow: 1px 1px 2px rgba(0, 0, 0, 0.3);
-    }
-    
-    /* Start button */
-    .stButton > button {
-        background-color: #3B82F6 !important;
-        color: white !important;
-        border: 1px solid rgba(255, 255, 255, 0.2) !important;
-        padding: 0.5rem 1rem !important;
-        width: 100% !important;
-        border-radius: 8px !important;
-        backdrop-filter: blur(5px) !important;
-        transition: all 0.3s ease !important;
-        font-size: 0.9rem !important;
-        margin-top: 0 !important;
-    }
-    
-    .stButton > button:hover {
-        background-color: #2563EB !important;
-        border-color: rgba(255, 255, 255, 0.3) !important;
-        transform: translateY(-2px) !important;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1) !important;
-    }
-    
-    /* Sidebar styling */
-    .css-1d391kg {
-        background-color: rgba(255, 255, 255, 0.95);
-    }
-    
-    /* Chat message styling */
-    .stChatMessage {
-        background-color: rgba(255, 255, 255, 0.9);
-        border-radius: 10px;
-        padding: 1rem;
-        margin: 0.5rem 0;
-    }
-    
-    /* Dashboard styles */
-    .dashboard-container {
-        max-width: 1200px;
-        margin: 0 auto;
-        padding: 2rem;
-    }
-    
-    .organ-card {
-        background: rgba(255, 255, 255, 0.9);
-        border-radius: 10px;
-        padding: 1.5rem;
-        margin-bottom: 1rem;
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-        transition: transform 0.2s;
-        height: 100%;
-        min-height: 200px;
-    }
-    
-    .organ-card h3 {
-        color: #2D3748;
-        margin-bottom: 1rem;
-        font-size: 1.2rem;
-        font-weight: bold;
-    }
-    
-    .organ-card ul {
-        list-style-type: none;
-        padding-left: 0;
-        margin-top: 1rem;
-    }
-    
-    .organ-card ul li {
-        margin-bottom: 0.5rem;
-        padding-left: 1.5rem;
-        position: relative;
-    }
-    
-    .organ-card ul li:before {
-        content: "•";
-        position: absolute;
-        left: 0;
-        color: #EF4444;
-    }
-    
-    .status-healthy {
-        color: #10B981;
-        font-weight: bold;
-    }
-    
-    .status-unhealthy {
-        color: #EF4444;
-        font-weight: bold;
-    }
-    
-    .dashboard-header {
-        color: #FFFFFF !important;
-        text-align: left;
-        margin-bottom: 1rem;
-        text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.3);
-    }
-    
-    /* Start New Assessment button styling */
-    .stButton > button {
-        background-color: #3B82F6 !important;
-        color: white !important;
-        border: 1px solid rgba(255, 255, 255, 0.2) !important;
-        padding: 0.75rem 1rem !important;
-        font-size: 1rem !important;
-        border-radius: 8px !important;
-        transition: all 0.3s ease !important;
-        margin-top: 1rem !important;
-    }
-    
-    .stButton > button:hover {
-        background-color: #2563EB !important;
-        border-color: rgba(255, 255, 255, 0.3) !important;
-        transform: translateY(-2px) !important;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1) !important;
-    }
-    
-    /* Organ selection styles */
-    .organ-selection-card {
-        background: rgba(255, 255, 255, 0.9);
-        border-radius: 15px;
-        padding: 1.5rem;
-        margin-bottom: 1rem;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        transition: all 0.3s ease;
-        text-align: center;
-        cursor: pointer;
-        border: 2px solid transparent;
-    }
-    
-    .organ-selection-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 6px 12px rgba(0, 0, 0, 0.15);
-    }
-    
-    .organ-icon {
-        font-size: 2.5rem;
-        margin: 0;
-        padding: 0.5rem;
-    }
-    
-    .organ-name {
-        font-size: 1.2rem;
-        font-weight: bold;
-        margin: 0.5rem 0;
-        color: #2D3748;
-    }
-    
-    .organ-description {
-        font-size: 0.9rem;
-        color: #718096;
-        margin: 0;
-    }
-    
-    /* Tab styling */
-    .stTabs [data-baseweb="tab-list"] {
-        background-color: rgba(0, 0, 0, 0.5);
-        border-radius: 10px;
-        padding: 0.5rem;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        color: #FFFFFF !important;
-        text-shadow: 1px 1px 2px rgba(0, 0, 0, 0.3);
-    }
-    
-    .stTabs [aria-selected="true"] {
-        background-color: rgba(255, 255, 255, 0.2) !important;
-        color: #FFFFFF !important;
-    }
-    
-    /* Main title styling */
-    .main-title {
-        color: #FFFFFF !important;
-        text-align: center;
-        text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.3);
-        margin-bottom: 2rem;
-        margin-top: 1rem !important;
-    }
-    
-    /* Input label styling */
-    .stTextInput label {
-        color: #FFFFFF !important;
-        text-shadow: 1px 1px 2px rgba(0, 0, 0, 0.3);
-    }
-    
-    .health-chain {
-        display: flex;
-        gap: 4px;
-        align-items: center;
-        margin: 10px 0;
-        background: rgba(0, 0, 0, 0.3);
-        padding: 15px;
-        border-radius: 20px;
-        justify-content: flex-start;
-        overflow-x: auto;
-        min-height: 50px;
-    }
-    
-    .health-day {
-        width: 35px;
-        height: 35px;
-        border-radius: 50%;
-        display: flex;
-        align-items: center;
-        justify-content: center;
-        font-size: 14px;
-        color: white;
-        font-weight: bold;
-        border: 2px solid rgba(255, 255, 255, 0.2);
-        flex-shrink: 0;
-    }
-    
-    .health-green {
-        background-color: #28a745;
-    }
-    
-    .health-yellow {
-        background-color: #ffc107;
-    }
-    
-    .health-red {
-        background-color: #dc3545;
-    }
-    
-    .health-inactive {
-        background-color: rgba(255, 255, 255, 0.1);
-        color: rgba(255, 255, 255, 0.5);
-        border: 2px dashed rgba(255, 255, 255, 0.2);
-    }
-    
-    .health-day.current {
-        border: 2px solid white;
-        box-shadow: 0 0 10px rgba(255, 255, 255, 0.3);
-    }
-    
-    /* Active Alerts styling */
-    .organ-notes {
-        color: #4A5568;
-        margin-bottom: 1rem;
-        font-size: 1rem;
-        line-height: 1.5;
-    }
-    
-    .alert-list {
-        list-style-type: none;
-        padding-left: 0;
-        margin: 0;
-    }
-    
-    .alert-item {
-        color: #EF4444;
-        margin-bottom: 0.5rem;
-        padding-left: 1.5rem;
-        position: relative;
-        font-weight: 500;
-    }
-    
-    .alert-item:before {
-        content: "⚠️";
-        position: absolute;
-        left: 0;
-        font-size: 1rem;
-    }
-    
-    .no-alerts {
-        color: #10B981;
-        font-style: italic;
-        text-align: center;
-        margin: 1rem 0;
-    }
-    
-    /* Navigation buttons container */
-    div[data-testid="column"]:nth-child(3) {
-        display: flex;
-        flex-direction: column;
-        gap: 0.5rem;
-    }
-    
-    /* Navigation buttons */
-    div[data-testid="column"] button {
-        margin-bottom: 0.5rem !important;
-    }
-    
-    /* Finish Assessment button */
-    div[data-testid="column"]:nth-child(3) button[kind="primary"] {
-        background-color: #10B981 !important;
-        color: white !important;
-        border: 1px solid rgba(255, 255, 255, 0.2) !important;
-        padding: 0.5rem 1rem !important;
-        width: 100% !important;
-        border-radius: 8px !important;
-        backdrop-filter: blur(5px) !important;
-        transition: all 0.3s ease !important;
-        font-size: 0.9rem !important;
-        margin-top: 0.5rem !important;
-    }
-    
-    div[data-testid="column"]:nth-child(3) button[kind="primary"]:hover {
-        background-color: #059669 !important;
-        border-color: rgba(255, 255, 255, 0.3) !important;
-        transform: translateY(-2px) !important;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1) !important;
-    }
-    
-    /* Save Dialog */
-    .save-dialog {
-        background: rgba(0, 0, 0, 0.8);
-        border-radius: 12px;
-        padding: 2rem;
-        margin: 1rem 0;
-        backdrop-filter: blur(10px);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        text-align: center;
-        color: white;
-    }
-    
-    .save-dialog h3 {
-        color: white;
-        margin-bottom: 1rem;
-        font-size: 1.2rem;
-    }
-    
-    .save-dialog p {
-        color: rgba(255, 255, 255, 0.8);
-        margin-bottom: 1.5rem;
-    }
-    
-    /* Save Dialog Buttons */
-    .save-dialog button {
-        min-width: 120px;
-    }
-    
-    /* Save & Exit Button */
-    .element-container:has(button:contains("Save & Exit")) button {
-        background-color: #10B981 !important;
-    }
-    
-    .element-container:has(button:contains("Save & Exit")) button:hover {
-        background-color: #059669 !important;
-    }
-    
-    /* Exit without Saving Button */
-    .element-container:has(button:contains("Exit without Saving")) button {
-        background-color: #EF4444 !important;
-    }
-    
-    .element-container:has(button:contains("Exit without Saving")) button:hover {
-        background-color: #DC2626 !important;
-    }
-    
-    /* Cancel Button */
-    .element-container:has(button:contains("Cancel")) button {
-        background-color: #6B7280 !important;
-    }
-    
-    .element-container:has(button:contains("Cancel")) button:hover {
-        background-color: #4B5563 !important;
-    }
-    
-    /* Button text nowrap */
-    div[data-testid="column"] button {
-        white-space: nowrap !important;
-        overflow: hidden !important;
-        text-overflow: ellipsis !important;
-        min-width: fit-content !important;
-    }
-    </style>
-""", unsafe_allow_html=True)
+
+# Fragments: the dashboard records and the chat rerun on their own when their
+# widgets are used, without re-executing the rest of the page
+@st.fragment
+def dashboard_records():
+    """Organ tabs and the daily sweep"""
+    started = time.perf_counter()
+    # Create tabs for each organ
+    tabs = st.tabs([organ.capitalize() for organ in st.session_state.health_records.keys()])
+
+    # Display detailed information for each organ in its respective tab
+    for tab, (organ, data) in zip(tabs, st.session_state.health_records.items()):
+        with tab:
+            # Health History Chain first
+            display_health_history(organ.capitalize())
+
+            # Status, alerts and recommendations cards
+            display_organ_cards(
+                data["latest_date"], data["status"], data["notes"], data["alerts"], data.get("recommendations", [])
+            )
+
+    # Daily sweep: every tracked organ checked in one backend call
+    with st.expander("🔭 Daily sweep"):
+        sweep_files = st.file_uploader(
+            "Upload up to 4 scans", type=["jpg", "jpeg", "png"], accept_multiple_files=True, key="sweep_files"
+        )
+        if st.button("Run sweep", key="run_sweep", disabled=not sweep_files):
+            with st.spinner("Checking all organs..."):
+                sweep_result = call_sweep_api(sweep_files[:4], list(st.session_state.health_records.keys()))
+            if sweep_result.get("detail"):
+                st.error(sweep_result["detail"])
+            for organ, detection in sweep_result.get("organs", {}).items():
+                icon = "✅" if detection["found"] else "❌"
+                visibility = f", {detection['visibility']} view" if detection.get("visibility") else ""
+                st.markdown(f"{icon} **{organ.capitalize()}**: confidence {detection['confidence']:.2f}{visibility}")
+            if sweep_result.get("image_quality"):
+                st.caption(f"Image quality: {sweep_result['image_quality']}")
+
+    record_rerun("dashboard", started)
+
+@st.fragment
+def chat_panel():
+    """Chat messages, image upload and the question input"""
+    started = time.perf_counter()
+    # Display the most recent chat messages; older pages are rendered on request
+    messages = st.session_state.messages
+    hidden = max(0, len(messages) - st.session_state.visible_messages)
+    if hidden and st.button(f"Show {min(hidden, MESSAGES_PAGE)} earlier messages"):
+        st.session_state.visible_messages += MESSAGES_PAGE
+        st.rerun(scope="fragment")
+    for message in messages[hidden:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            # If the message has an image, display its thumbnail
+            if "thumbnail" in message:
+                thumbnail = st.session_state.thumbnails.get(message["thumbnail"])
+                if thumbnail is not None:
+                    st.image(thumbnail)
+                else:
+                    st.caption("(earlier image no longer kept)")
+
+    # Welcome message on first load
+    if st.session_state.current_stage == "initial" and not st.session_state.messages:
+        with st.chat_message("assistant"):
+            st.markdown("👋 Welcome to Space Triage! I'm your AI ultrasound assistant. Please enter the organ you wish to diagnose in the sidebar, then upload an ultrasound image to begin.")
+        st.session_state.current_stage = "waiting_for_image"
+
+    # Image uploader in chat input
+    uploaded_file = st.file_uploader(
+        "Upload an ultrasound image", 
+        type=["png", "jpg", "jpeg"],
+        key="chat_file_uploader",
+        label_visibility="collapsed"
+    )
+
+    # Handle file upload
+    if uploaded_file is not None and upload_key(uploaded_file) != st.session_state.uploaded_image_key:
+        # Keep only the active frame's bytes; it is registered with the backend on first use
+        st.session_state.uploaded_image_key = upload_key(uploaded_file)
+        st.session_state.active_image = image_to_bytes(uploaded_file)
+        st.session_state.image_id = None
+        st.session_state.images_uploaded += 1
+
+        # Add user message with a thumbnail of the image
+        add_message({
+            "role": "user", 
+            "content": f"I've uploaded an ultrasound image for {st.session_state.target_organ} analysis.",
+            "thumbnail": store_thumbnail(st.session_state.active_image)
+        })
+
+        # Display the image
+        with st.chat_message("user"):
+            st.markdown(f"I've uploaded an ultrasound image for {st.session_state.target_organ} analysis.")
+            st.image(st.session_state.active_image, caption="Uploaded Ultrasound Image")
+
+        # Set stage to identify if we have an organ target
+        if st.session_state.target_organ:
+            st.session_state.current_stage = "identify"
+            # Process the image through our flow
+            process_image_flow()
+        else:
+            with st.chat_message("assistant"):
+                st.markdown("❗ Please specify the target organ in the sidebar before proceeding.")
+
+        # Force a rerun of the chat to update it
+        st.rerun(scope="fragment")
+
+    # Chat input for text messages
+    user_input = st.chat_input("Ask a question or provide additional information...")
+    if user_input:
+        handle_user_input(user_input)
+        st.rerun(scope="fragment")
+    record_rerun("chat", started)
 
 # Initialize session state variables if they don't exist
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "session_id" not in st.session_state:
+    # Lets the backend reuse results for near-identical frames within a session
+    st.session_state.session_id = uuid.uuid4().hex
 if "current_stage" not in st.session_state:
     st.session_state.current_stage = "welcome"  # Stages: welcome, login, dashboard, select_organ, initial, identify, navigate, describe
-if "uploaded_image" not in st.session_state:
-    st.session_state.uploaded_image = None
+if "active_image" not in st.session_state:
+    # JPEG bytes of the frame being analysed; earlier frames only live on as thumbnails
+    st.session_state.active_image = None
+    st.session_state.uploaded_image_key = None
+if "thumbnails" not in st.session_state:
+    st.session_state.thumbnails = OrderedDict()
+    st.session_state.images_uploaded = 0
+    st.session_state.visible_messages = MESSAGES_PAGE
+if "rerun_times" not in st.session_state:
+    st.session_state.rerun_times = deque(maxlen=200)
 if "needs_navigation" not in st.session_state:
     st.session_state.needs_navigation = False
 if "navigate_response" not in st.session_state:
@@ -869,7 +716,7 @@ if "health_records" not in st.session_state:
             ],
             "alerts": []
         },
-        "breasts": {
+        "bladder": {
             "latest_date": "2024-03-12",
             "status": "healthy",
             "notes": "Normal capacity and function",
@@ -1014,70 +861,8 @@ elif st.session_state.current_stage == "dashboard":
             st.session_state.current_stage = "select_organ"
             st.rerun()
     
-    # Create tabs for each organ
-    tabs = st.tabs([organ.capitalize() for organ in st.session_state.health_records.keys()])
-    
-    # Display detailed information for each organ in its respective tab
-    for tab, (organ, data) in zip(tabs, st.session_state.health_records.items()):
-        with tab:
-            # Health History Chain first
-            display_health_history(organ.capitalize())
-            
-            # Create three columns for the main boxes
-            col1, col2, col3 = st.columns([1, 1, 1])
-            
-            with col1:
-                # Status Overview Card
-                st.markdown(f"""
-                    <div class="organ-card">
-                        <h3>Status Overview</h3>
-                        <p><strong>Latest Check:</strong> {data['latest_date']}</p>
-                        <p><strong>Status:</strong> 
-                            <span class="status-{data['status']}">
-                                {data['status'].upper()}
-                            </span>
-                        </p>
-                    </div>
-                """, unsafe_allow_html=True)
-            
-            with col2:
-                # Active Alerts
-                alerts_html = """
-                    <div class="organ-card">
-                        <h3>⚠️ Active Alerts</h3>
-                """
-                
-                # Add notes if they exist
-                if data['notes']:
-                    alerts_html += f'<p class="organ-notes">{data["notes"]}</p>'
-                
-                # Add alerts if they exist
-                if data['alerts']:
-                    alerts_html += '<ul class="alert-list">'
-                    for alert in data['alerts']:
-                        alerts_html += f'<li class="alert-item">{alert}</li>'
-                    alerts_html += '</ul>'
-                elif not data['notes']:  # If no alerts and no notes
-                    alerts_html += '<p class="no-alerts">No active alerts</p>'
-                
-                alerts_html += "</div>"
-                st.markdown(alerts_html, unsafe_allow_html=True)
-            
-            with col3:
-                # Recommendations
-                recommendations_html = """
-                    <div class="organ-card">
-                        <h3>Recommendations</h3>
-                        <p>Based on your latest assessment:</p>
-                        <ul>
-                """
-                for rec in data.get('recommendations', []):
-                    recommendations_html += f"<li>{rec}</li>"
-                recommendations_html += """
-                        </ul>
-                    </div>
-                """
-                st.markdown(recommendations_html, unsafe_allow_html=True)
+    # Records and sweep rerun on their own when used
+    dashboard_records()
     
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -1243,63 +1028,14 @@ elif st.session_state.current_stage not in ["welcome", "login"]:
         if st.button("🔄 Start New Session"):
             restart_session()
 
-    # Display chat messages
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-            # If the message has an image, display it
-            if "image" in message:
-                st.image(message["image"])
-
-    # Welcome message on first load
-    if st.session_state.current_stage == "initial" and not st.session_state.messages:
-        with st.chat_message("assistant"):
-            st.markdown("👋 Welcome to Space Triage! I'm your AI ultrasound assistant. Please enter the organ you wish to diagnose in the sidebar, then upload an ultrasound image to begin.")
-        st.session_state.current_stage = "waiting_for_image"
-
-    # Image uploader in chat input
-    uploaded_file = st.file_uploader(
-        "Upload an ultrasound image", 
-        type=["png", "jpg", "jpeg"],
-        key="chat_file_uploader",
-        label_visibility="collapsed"
-    )
-
-    # Handle file upload
-    if uploaded_file is not None and (st.session_state.uploaded_image is None or uploaded_file != st.session_state.uploaded_image):
-        # Store the uploaded image
-        st.session_state.uploaded_image = uploaded_file
-        
-        # Add user message with image
-        st.session_state.messages.append({
-            "role": "user", 
-            "content": f"I've uploaded an ultrasound image for {st.session_state.target_organ} analysis.",
-            "image": uploaded_file  # Store image in message for reference
-        })
-        
-        # Display the image
-        with st.chat_message("user"):
-            st.markdown(f"I've uploaded an ultrasound image for {st.session_state.target_organ} analysis.")
-            st.image(uploaded_file, caption="Uploaded Ultrasound Image")
-        
-        # Set stage to identify if we have an organ target
-        if st.session_state.target_organ:
-            st.session_state.current_stage = "identify"
-            # Process the image through our flow
-            process_image_flow()
-        else:
-            with st.chat_message("assistant"):
-                st.markdown("❗ Please specify the target organ in the sidebar before proceeding.")
-        
-        # Force a rerun to update the UI
-        st.rerun()
-
-    # Chat input for text messages
-    user_input = st.chat_input("Ask a question or provide additional information...")
-    if user_input:
-        handle_user_input(user_input)
-        st.rerun()
+    # Messages, uploads and questions rerun on their own when used
+    chat_panel()
 
     # Add a footer
     st.markdown("---")
-    st.caption("Space Triage | AI-Guided Ultrasound Assistant | Demo Version")
\ No newline at end of file
+    st.caption("Space Triage | AI-Guided Ultrasound Assistant | Demo Version")
+
+# Rerun time and memory, measured on every rerun that reaches the end of the script
+with st.sidebar:
+    display_performance()
+record_rerun()
@@ -0,0 +1,55 @@
+"""
+Summarise the Streamlit rerun log written when STREAMLIT_PERF_LOG is set.
+
+Reports, per session and rerun scope (full "app" reruns or the
+"dashboard" and "chat" fragments), how rerun time, process RSS and session
+state size evolve as images are uploaded, in buckets of ten images, so a
+100-image session shows whether either grows with its length.
+
+Usage:
+    STREAMLIT_PERF_LOG=perf.jsonl streamlit run streamlit_app.py
+    python streamlit_perf_report.py perf.jsonl
+"""
+import sys
+import json
+from collections import defaultdict
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+
+    sessions = defaultdict(lambda: defaultdict(list))
+    with open(sys.argv[1]) as f:
+        for line in f:
+            record = json.loads(line)
+            bucket = (record["images"] - 1) // 10 if record["images"] else -1
+            scope = record.get("scope", "app")
+            sessions[f"{record['session_id']} {scope}"][bucket].append(record)
+
+    report = {}
+    for session_id, buckets in sessions.items():
+        rows = {}
+        for bucket in sorted(buckets):
+            records = buckets[bucket]
+            label = "0" if bucket < 0 else f"{bucket * 10 + 1}-{bucket * 10 + 10}"
+            times = [r["rerun_ms"] for r in records]
+            rss = [r["rss_mb"] for r in records if r["rss_mb"] is not None]
+            rows[label] = {
+                "reruns": len(records),
+                "rerun_p50_ms": percentile(times, 0.5),
+                "rerun_p95_ms": percentile(times, 0.95),
+                "rss_mb_max": round(max(rss), 1) if rss else None,
+                "session_kb_max": round(max(r["session_bytes"] for r in records) / 1024, 1),
+            }
+        report[session_id] = rows
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()